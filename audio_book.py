@@ -4,30 +4,79 @@ import xbmc
 import requests
 import json
 import threading
+import time
 import sys
 from library_service import AudioBookShelfLibraryService
+from chapter_index import ChapterIndex
+from download_manager import DownloadManager
+from playback_scheduler import PlaybackScheduler
+from progress_sync import ProgressSyncWriter
+from track_index import TrackIndex
+import profiler
+
+SESSION_DWELL_TIME = 1.0  # seconds Play has to keep the focus before a playback session is opened in advance
 
 class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 	def __init__(self, *args, **kwargs):
 		super().__init__(*args, **kwargs)
-		self.id = kwargs['id']
-		self.title = kwargs['title']
+		self.audiobook = kwargs['audiobook']
+		self.id = self.audiobook.id
+		# Set for podcast episodes, which are played and synced as part of their podcast item
+		self.episode_id = self.audiobook.episode_id
+		self.title = self.audiobook.title
 		self.cover = kwargs['cover']
-		self.description = kwargs['description']
-		self.narrator_name = kwargs['narrator_name']
-		self.published_year = kwargs['published_year']
-		self.publisher = kwargs['publisher']
-		self.duration = kwargs['duration']
+		self.description = self.audiobook.description
+		self.narrator_name = self.audiobook.narrator_label
+		self.published_year = self.audiobook.published_year_label
+		self.publisher = self.audiobook.publisher_label
+		self.duration = self.audiobook.duration
 		self.player = xbmc.Player()
 		self.library_service = AudioBookShelfLibraryService()
-		self.chapters = self.library_service.get_chapters(self.id)
+		self.progress_writer = ProgressSyncWriter()
+		self.download_manager = DownloadManager()
+		self.chapters = []
+		self.chapter_index = ChapterIndex(self.chapters)
 		self.threads = []
+
+		# One scheduler thread drives all periodic control updates during playback
+		self.rendered_values = {}
+		self.scheduler = PlaybackScheduler(self.player, self.get_book_time)
+		self.scheduler.register(0.5, self.update_timer)
+		self.scheduler.register(2.0, self.update_chapter)
+		self.scheduler.register(5.0, self.update_progressbar)
+		self.scheduler.register(5.0, self.auto_save_progress)
 		
 		# Progress tracking variables
 		self.saved_progress = 0.0
 		self.last_saved_time = 0.0
 		self.progress_save_interval = 30  # Save progress every 30 seconds
-		self.load_progress()
+
+		# Server playback session and the listening time not yet reported to it
+		self.play_session = None
+		self.listening_since = None
+		self.unsynced_time_listened = 0.0
+
+		# Audio files of the book; books split into several files play as a playlist
+		self.track_index = TrackIndex([])
+		self.playlist = None
+
+		# Chapters and progress load in the background while the dialog opens
+		self.details_lock = threading.Lock()
+		self.controls_ready = False
+		self.progress_loaded = threading.Event()
+		self._start_thread(self.load_chapters)
+		self._start_thread(self.load_progress)
+
+		# The playback session opens once Play kept the focus for a while, so Play does not wait for it
+		# but merely looking at a book leaves no empty session on the server
+		self.session_lock = threading.Lock()
+		self.prefetched_session = None
+		self.session_prefetched = threading.Event()
+		self.session_prefetch_started = False
+		self.play_focus_left = threading.Event()
+		self.closing = False
+		# The dialog opens with the focus on Play, only focus the user moved there counts
+		self.user_acted = False
 
 	def onInit(self):
 		controls_mapping = {
@@ -57,94 +106,185 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 		if self.button_controls:
 			self.setFocus(self.button_controls[2])
 
+		with self.details_lock:
+			self.controls_ready = True
+			self.apply_details()
+
+	def apply_details(self):
+		"""Show chapter and progress of the saved position once both the data and the controls are there"""
+		if not self.controls_ready or self.player.isPlayingAudio():
+			return
+		self.update_chapter(self.saved_progress)
+		self.update_progressbar(self.saved_progress)
+
+	def load_chapters(self):
+		try:
+			if self.episode_id:
+				# Fetching the podcast item would pull all of its episodes
+				chapters = self.audiobook.chapters
+			else:
+				chapters = self.library_service.get_chapters(self.id)
+		except Exception as e:
+			xbmc.log("Failed to load chapters for {}: {}".format(self.id, str(e)), xbmc.LOGERROR)
+			return
+
+		with self.details_lock:
+			self.chapters = chapters
+			self.chapter_index = ChapterIndex(chapters)
+			self.apply_details()
+
 	def set_button_navigation(self):
 		for index, button in enumerate(self.button_controls):
 			left_button = self.button_controls[index - 1] if index > 0 else button
 			right_button = self.button_controls[index + 1] if index < len(self.button_controls) - 1 else button
 			button.setNavigation(button, button, left_button, right_button)
 
-	def update_progressbar(self):
-		time = self.player.getTime()
+	def get_book_time(self):
+		"""Return the playhead position in global book time, across file boundaries"""
+		track_time = self.player.getTime()
+		if self.playlist is not None:
+			return self.track_index.to_book_time(self.playlist.getposition(), track_time)
+		return track_time
+
+	def seek_book_time(self, book_time):
+		"""Seek to a global book time, switching to the file containing it if necessary"""
+		if self.playlist is None:
+			self.player.seekTime(book_time)
+			return
+
+		position, offset = self.track_index.locate(book_time)
+		if position != self.playlist.getposition():
+			self.player.playselected(position)
+			monitor = xbmc.Monitor()
+			for _ in range(30):  # 3 seconds max
+				if self.player.isPlayingAudio() and self.playlist.getposition() == position:
+					break
+				if monitor.waitForAbort(0.1):
+					return
+		self.player.seekTime(offset)
+
+	def _start_playlist(self, track_urls, resume_time=0.0):
+		"""Queue all files of a multi-file book and start at the file containing resume_time"""
+		playlist = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
+		playlist.clear()
+		position, offset = self.track_index.locate(resume_time)
+		for index, track_url in enumerate(track_urls):
+			listitem = xbmcgui.ListItem(path=track_url)
+			if index == position and offset > 0:
+				listitem.setProperty('resumetime', str(offset))
+				listitem.setProperty('totaltime', str(self.track_index.tracks[index].get('duration') or 0))
+			playlist.add(track_url, listitem)
+
+		self.playlist = playlist
+		self.player.play(playlist, startpos=position)
+		xbmc.log("Started playlist of {} files at file {} ({}s)".format(len(track_urls), position, offset), xbmc.LOGINFO)
+		if resume_time > 0:
+			self._start_thread(self._verify_listitem_resume)
+
+	def set_control_label(self, control_id, label):
+		"""Set a label only if it differs from the one already rendered"""
+		if self.rendered_values.get(control_id) != label:
+			self.getControl(control_id).setLabel(label)
+			self.rendered_values[control_id] = label
+
+	def set_control_percent(self, control_id, percent):
+		"""Set a progress bar only if the rendered percentage changes"""
+		percent = round(percent, 1)
+		if self.rendered_values.get(control_id) != percent:
+			self.getControl(control_id).setPercent(percent)
+			self.rendered_values[control_id] = percent
+
+	def update_progressbar(self, time):
 		duration = self.duration
-		progress_percentage = 0.0
-
-		if not self.player.isPlaying():
-			pass
-		else:
-			time = self.player.getTime()
-			duration = self.duration
-			progress_percentage = (time / duration) * 100 if duration != 0 else 0
-
-		pb = self.getControl(1009)
-		pb.setPercent(progress_percentage)
-
-	def progressbar_updater(self):
-		monitor = xbmc.Monitor()
-		while self.player.isPlayingAudio():
-			self.update_progressbar()
-			self.auto_save_progress()
-			if monitor.waitForAbort(5.0):  # 5 seconds, interruptible
-				break
-
-	def chapter_updater(self):
-		monitor = xbmc.Monitor()
-		while self.player.isPlayingAudio():
-			self.update_chapter(self.player.getTime())
-			if monitor.waitForAbort(2.0):  # 2 seconds, interruptible
-				break				
+		progress_percentage = (time / duration) * 100 if duration != 0 else 0
+		self.set_control_percent(1009, progress_percentage)
 
 	def get_chapter_by_time(self,time):
-		for chapter in self.chapters:
-			if chapter['start'] <= time <= chapter['end']:
-				return chapter
-		return None
+		return self.chapter_index.chapter_at(time)
 
 	def update_chapter(self,time):
 		current_chapter = self.get_chapter_by_time(time)
-		ccontrol = self.getControl(1011)
-		ccontrol.setLabel(current_chapter['title'])
+		if current_chapter:
+			self.set_control_label(1011, current_chapter['title'])
 
 	def get_next_chapter(self, time):
-		current_chapter = None
-		for chapter in self.chapters:
-			if chapter['start'] <= time <= chapter['end']:
-				current_chapter = chapter
-				break
-		if current_chapter and self.chapters.index(current_chapter) < len(self.chapters) - 1:
-			return self.chapters[self.chapters.index(current_chapter) + 1]
-		return None
+		return self.chapter_index.next_chapter(time)
 
 	def get_previous_chapter(self, time):
-		current_chapter = None
-		for chapter in self.chapters:
-			if chapter['start'] <= time <= chapter['end']:
-				current_chapter = chapter
-				break
-		if current_chapter and self.chapters.index(current_chapter) > 0:
-			return self.chapters[self.chapters.index(current_chapter) - 1]
-		return None
-
-	def update_timer(self):
-		monitor = xbmc.Monitor()
-		while self.player.isPlayingAudio():
-			ct = self.player.getTime()
-			
-			# Umwandlung von Sekunden in Minuten und Sekunden
-			minutes = int(ct // 60)
-			seconds = int(ct % 60)
-
-			# Formatierung der Ausgabe als MM:SS
-			formatted_time = "{:02d}:{:02d}".format(minutes, seconds)
-
-			timer_control = self.getControl(1012)
-			timer_control.setLabel(formatted_time)        
-			if monitor.waitForAbort(0.5):  # 500ms, interruptible
-				break
+		return self.chapter_index.previous_chapter(time)
+
+	def update_timer(self, ct):
+		# Umwandlung von Sekunden in Minuten und Sekunden
+		minutes = int(ct // 60)
+		seconds = int(ct % 60)
+
+		# Formatierung der Ausgabe als MM:SS
+		formatted_time = "{:02d}:{:02d}".format(minutes, seconds)
+		self.set_control_label(1012, formatted_time)
+
+	def onFocus(self, controlId):
+		self.play_focus_left.set()
+		if controlId != 1001 or not self.user_acted:
+			return
+		with self.session_lock:
+			if self.session_prefetch_started or self.closing:
+				return
+			self.play_focus_left = threading.Event()
+			focus_left = self.play_focus_left
+		self._start_thread(lambda: self.prefetch_after_dwell(focus_left))
+
+	def prefetch_after_dwell(self, focus_left):
+		if focus_left.wait(SESSION_DWELL_TIME):
+			return
+		with self.session_lock:
+			if self.session_prefetch_started or self.closing:
+				return
+			self.session_prefetch_started = True
+		self.prefetch_play_session()
+
+	def prefetch_play_session(self):
+		session = None
+		try:
+			session = self.library_service.open_play_session(self.id, self.episode_id)
+		except Exception as e:
+			xbmc.log("Failed to open playback session for {} in advance: {}".format(self.id, str(e)), xbmc.LOGDEBUG)
+		finally:
+			with self.session_lock:
+				closing = self.closing
+				if not closing:
+					self.prefetched_session = session
+			self.session_prefetched.set()
+		if closing and session:
+			self.close_unused_session(session)
+
+	def take_play_session(self):
+		"""Return the session opened in advance, or open one if none was, it failed or was used already"""
+		with self.session_lock:
+			prefetching = self.session_prefetch_started
+			# Play was pressed before the dwell time passed, nothing to open in advance any more
+			self.session_prefetch_started = True
+		if prefetching:
+			self.session_prefetched.wait(timeout=10)
+		with self.session_lock:
+			session, self.prefetched_session = self.prefetched_session, None
+		if session is not None:
+			return session
+		return self.library_service.open_play_session(self.id, self.episode_id)
+
+	def close_unused_session(self, session):
+		"""Close a session nothing was played in, without reporting a position"""
+		try:
+			self.library_service.close_session(session['id'])
+		except Exception as e:
+			xbmc.log("Failed to close unused playback session {}: {}".format(session['id'], str(e)), xbmc.LOGDEBUG)
 
 	def load_progress(self):
-		"""Load saved progress from the server"""
+		"""Load saved progress from the shared progress cache or the server"""
 		try:
-			progress_data = self.library_service.get_media_progress(self.id)
+			# An update that has not reached the server yet is newer than the server state
+			progress_data = self.progress_writer.get_pending(self.id, self.episode_id)
+			if not progress_data:
+				progress_data = self.library_service.get_cached_media_progress(self.id, self.episode_id)
 			if progress_data and 'currentTime' in progress_data:
 				self.saved_progress = float(progress_data['currentTime'])
 				xbmc.log("Loaded progress for {}: {} seconds".format(self.id, self.saved_progress), xbmc.LOGINFO)
@@ -155,35 +295,73 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 			xbmc.log("Failed to load progress for {}: {}".format(self.id, str(e)), xbmc.LOGERROR)
 			self.saved_progress = 0.0
 
-	def save_progress(self, current_time=None):
-		"""Save current progress to the server"""
+		self.progress_loaded.set()
+		with self.details_lock:
+			self.apply_details()
+
+	def start_listening(self):
+		if self.listening_since is None:
+			self.listening_since = time.monotonic()
+
+	def stop_listening(self):
+		if self.listening_since is not None:
+			self.unsynced_time_listened += time.monotonic() - self.listening_since
+			self.listening_since = None
+
+	def take_time_listened(self):
+		"""Return the listening time since the last sync and start counting anew"""
+		listening = self.listening_since is not None
+		self.stop_listening()
+		time_listened = self.unsynced_time_listened
+		self.unsynced_time_listened = 0.0
+		if listening:
+			self.start_listening()
+		return time_listened
+
+	def save_progress(self, current_time=None, close_session=False):
+		"""Queue the current progress for the background writer"""
 		try:
 			if current_time is None:
 				if self.player.isPlayingAudio():
-					current_time = self.player.getTime()
+					current_time = self.get_book_time()
 				else:
-					current_time = self.last_saved_time
-
-			if current_time > 0:
+					# Nothing plays, the last known position is the one saved or loaded last
+					current_time = self.saved_progress
+
+			if current_time <= 0 and close_session and self.play_session:
+				# Nothing was played, a final position of 0 would overwrite the one on the server
+				session, self.play_session = self.play_session, None
+				self.stop_listening()
+				self.unsynced_time_listened = 0.0
+				self._start_thread(lambda: self.close_unused_session(session))
+			elif current_time > 0:
 				progress_data = {
 					'currentTime': current_time,
 					'duration': self.duration,
 					'progress': (current_time / self.duration) if self.duration > 0 else 0
 				}
-				
-				self.library_service.update_media_progress(self.id, progress_data)
+
+				self.library_service.cache_media_progress(self.id, progress_data, self.episode_id)
+				if self.play_session:
+					# Sync through the playback session so listening stats are recorded
+					self.progress_writer.submit(self.id, progress_data, self.episode_id, session_id=self.play_session['id'],
+						time_listened=self.take_time_listened(), close_session=close_session)
+					if close_session:
+						self.play_session = None
+				else:
+					self.progress_writer.submit(self.id, progress_data, self.episode_id)
 				self.last_saved_time = current_time
-				xbmc.log("Saved progress for {}: {} seconds".format(self.id, current_time), xbmc.LOGDEBUG)
+				# Playing again after a stop resumes here
+				self.saved_progress = current_time
+				xbmc.log("Queued progress for {}: {} seconds".format(self.id, current_time), xbmc.LOGDEBUG)
 		except Exception as e:
 			xbmc.log("Failed to save progress for {}: {}".format(self.id, str(e)), xbmc.LOGERROR)
 
-	def auto_save_progress(self):
+	def auto_save_progress(self, current_time):
 		"""Automatically save progress at regular intervals"""
-		if self.player.isPlayingAudio():
-			current_time = self.player.getTime()
-			# Save progress if enough time has passed since last save
-			if abs(current_time - self.last_saved_time) >= self.progress_save_interval:
-				self.save_progress(current_time)
+		# Save progress if enough time has passed since last save
+		if abs(current_time - self.last_saved_time) >= self.progress_save_interval:
+			self.save_progress(current_time)
 
 	def resume_from_progress(self):
 		"""Resume playback from saved progress using waitForAbort instead of sleep"""
@@ -206,13 +384,13 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 					# Additional stability wait using waitForAbort
 					monitor.waitForAbort(0.5)  # 500ms wait, interruptible
 					
-					self.player.seekTime(self.saved_progress)
+					self.seek_book_time(self.saved_progress)
 					xbmc.log("Resumed playback at {} seconds".format(self.saved_progress), xbmc.LOGINFO)
 					
 					# Update chapter display after seeking using waitForAbort
 					monitor.waitForAbort(0.5)  # Brief wait for seek to complete
 					if self.player.isPlayingAudio():
-						self.update_chapter(self.player.getTime())
+						self.update_chapter(self.get_book_time())
 			except Exception as e:
 				xbmc.log("Failed to resume from progress: {}".format(str(e)), xbmc.LOGERROR)
 
@@ -227,12 +405,12 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				for attempt in range(20):
 					if self.player.isPlayingAudio():
 						try:
-							self.player.seekTime(self.saved_progress)
+							self.seek_book_time(self.saved_progress)
 							
 							# Brief wait using waitForAbort (interruptible and non-blocking)
 							if not monitor.waitForAbort(0.1):  # 100ms wait, interruptible
 								if self.player.isPlayingAudio():
-									current_pos = self.player.getTime()
+									current_pos = self.get_book_time()
 									if abs(current_pos - self.saved_progress) < 5:
 										xbmc.log("Successfully resumed at {}s (target: {}s)".format(current_pos, self.saved_progress), xbmc.LOGINFO)
 										# Update chapter info without blocking
@@ -262,7 +440,7 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 					return  # Interrupted
 					
 				if self.player.isPlayingAudio():
-					current_time = self.player.getTime()
+					current_time = self.get_book_time()
 					if abs(current_time - self.saved_progress) < 5:
 						self.update_chapter(current_time)
 						return
@@ -317,7 +495,7 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				# Check if we're at the expected position
 				monitor.waitForAbort(0.5)  # Give it a moment to stabilize
 				
-				current_pos = self.player.getTime()
+				current_pos = self.get_book_time()
 				position_difference = abs(current_pos - self.saved_progress)
 				
 				if position_difference < 10:  # Within 10 seconds is good
@@ -327,7 +505,7 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				else:
 					xbmc.log("ListItem resume inaccurate: at {}s (target: {}s), correcting...".format(current_pos, self.saved_progress), xbmc.LOGINFO)
 					# Correct the position
-					self.player.seekTime(self.saved_progress)
+					self.seek_book_time(self.saved_progress)
 					self._start_thread(self.delayed_chapter_update)
 			else:
 				xbmc.log("ListItem playback verification failed - player not active", xbmc.LOGWARNING)
@@ -355,7 +533,7 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 			
 			# Seek to saved position while paused
 			try:
-				self.player.seekTime(self.saved_progress)
+				self.seek_book_time(self.saved_progress)
 				xbmc.log("Sought to {} seconds while paused".format(self.saved_progress), xbmc.LOGINFO)
 			except Exception as e:
 				xbmc.log("Error seeking while paused: {}".format(str(e)), xbmc.LOGERROR)
@@ -371,7 +549,7 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 			# Verify position after resume
 			monitor.waitForAbort(0.3)
 			if self.player.isPlayingAudio():
-				current_pos = self.player.getTime()
+				current_pos = self.get_book_time()
 				xbmc.log("Playing at {}s (target: {}s)".format(current_pos, self.saved_progress), xbmc.LOGINFO)
 				
 				# Update chapter info
@@ -381,14 +559,15 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 			xbmc.log("Error in pause-seek-resume: {}".format(str(e)), xbmc.LOGERROR)
 
 	def _start_thread(self, target):
-		thread = threading.Thread(target=target)
+		self.threads = [thread for thread in self.threads if thread.is_alive()]
+		thread = threading.Thread(target=profiler.wrap_thread_target(target))
 		thread.start()
 		self.threads.append(thread)
 
+	@profiler.traced()
 	def onAction(self, action):
+		self.user_acted = True
 		if action.getId() == xbmcgui.ACTION_NAV_BACK:
-			if self.player.isPlayingAudio():
-				self.player.stop()
 			self.close()
 		elif action == xbmcgui.ACTION_SELECT_ITEM:
 			focus_id = self.getFocusId()
@@ -398,15 +577,49 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				if self.player.isPlayingAudio():
 					self.player.pause()
 				else:
-					# Get file URL and handle progress before starting playback
-					afile = self.library_service.get_file_url(self.id)
-					
-					# If we have saved progress, start playback with special handling
-					if self.saved_progress > 0:
-						self._start_silent_playback_with_resume(afile)
+					if self.play_session:
+						self.save_progress(close_session=True)
+
+					# The saved position is needed to start at the right place
+					self.progress_loaded.wait(timeout=10)
+
+					# Downloaded books play from the profile, the session only records the listening
+					local_tracks = None if self.episode_id else self.download_manager.get_local_tracks(self.id)
+
+					# Open a playback session and handle progress before starting playback
+					try:
+						self.play_session = self.take_play_session()
+					except Exception as e:
+						if not local_tracks:
+							raise
+						# Progress is queued by the writer and sent once the server is back
+						xbmc.log("Playing downloaded files of {} without a server session: {}".format(self.id, str(e)), xbmc.LOGWARNING)
+						self.play_session = None
+					if local_tracks and self.play_session:
+						# Files that no longer match the server's are streamed instead
+						local_tracks = self.download_manager.verify(self.id, self.play_session.get('audioTracks'))
+
+					# The files must stay until the player is done with them
+					self.download_manager.set_playing(self.id, bool(local_tracks))
+					if local_tracks:
+						self.track_index = TrackIndex(local_tracks)
+						track_urls = [track['path'] for track in self.track_index.tracks]
 					else:
-						# No progress, start normal playback
-						self.player.play(afile)
+						self.track_index = TrackIndex(self.play_session.get('audioTracks'))
+						track_urls = None
+					self.playlist = None
+
+					if self.track_index.is_multi_track():
+						self._start_playlist(track_urls or self.library_service.get_session_track_urls(self.play_session), self.saved_progress)
+					else:
+						afile = track_urls[0] if track_urls else self.library_service.get_session_file_url(self.play_session)
+
+						# If we have saved progress, start playback with special handling
+						if self.saved_progress > 0:
+							self._start_silent_playback_with_resume(afile)
+						else:
+							# No progress, start normal playback
+							self.player.play(afile)
 
 				# Wait for pause button to be visible using waitForAbort
 				monitor = xbmc.Monitor()
@@ -418,21 +631,22 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				# Wait briefly for potential seeking to complete before updating chapter
 				monitor.waitForAbort(1.0)  # 1 second wait, interruptible
 				if self.player.isPlayingAudio():
-					self.update_chapter(self.player.getTime())
+					self.update_chapter(self.get_book_time())
 				
-				self._start_thread(self.progressbar_updater)
-				self._start_thread(self.chapter_updater)
-				self._start_thread(self.update_timer)
+				self.start_listening()
+				self.scheduler.start()
 
 			elif focus_id == 1010:  # Pause Button
 				# Save progress before pausing
 				if self.player.isPlayingAudio():
 					try:
-						current_time = self.player.getTime()
+						current_time = self.get_book_time()
 						self.save_progress(current_time)
 					except:
 						pass  # Continue if getting time fails
 				
+				self.scheduler.stop()
+				self.stop_listening()
 				self.player.pause()
 
 				# Wait for play button to be visible using waitForAbort
@@ -445,18 +659,18 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 			elif focus_id in [1003, 1008]:  # Chapter navigation buttons
 				chapter = None
 				if focus_id == 1003:
-					chapter = self.get_previous_chapter(self.player.getTime())
+					chapter = self.get_previous_chapter(self.get_book_time())
 				elif focus_id == 1008:
-					chapter = self.get_next_chapter(self.player.getTime())
+					chapter = self.get_next_chapter(self.get_book_time())
 				
 				if chapter:
 					cs = chapter['start']
-					self.player.seekTime(cs)
+					self.seek_book_time(cs)
 					# Save progress after seeking to new chapter
 					self.save_progress(cs)
 
 			elif focus_id in [1002, 1007]:  # Time navigation buttons
-				ct = self.player.getTime()
+				ct = self.get_book_time()
 				st = None
 				if focus_id == 1002:
 					st = ct - 10
@@ -466,19 +680,31 @@ class AudioBookPlayer(xbmcgui.WindowXMLDialog):
 				if st is not None:
 					# Ensure we don't seek to negative time
 					st = max(0, st)
-					self.player.seekTime(st)
+					self.seek_book_time(st)
 					# Save progress after seeking
 					self.save_progress(st)
 
 	def close(self):
-		# Save progress before closing
+		self.scheduler.stop()
+
+		# Save progress and close the playback session before closing
 		if self.player.isPlayingAudio():
 			try:
-				current_time = self.player.getTime()
-				self.save_progress(current_time)
+				current_time = self.get_book_time()
+				self.save_progress(current_time, close_session=True)
 			except:
 				pass  # Continue closing if saving fails
 			self.player.stop()
+		elif self.play_session:
+			self.save_progress(close_session=True)
+		self.download_manager.set_playing(self.id, False)
+
+		with self.session_lock:
+			self.closing = True
+			unused_session, self.prefetched_session = self.prefetched_session, None
+		self.play_focus_left.set()
+		if unused_session is not None:
+			self._start_thread(lambda: self.close_unused_session(unused_session))
 
 		for thread in self.threads:
 			if thread.is_alive():
@@ -0,0 +1,144 @@
+"""Compare chapter lookups through ChapterIndex with the linear scan it replaced.
+
+Builds synthetic books of contiguous chapters, chapters with gaps and
+overlapping chapters, and times current/next/previous lookups at random
+times (seeks) and along a playhead advancing every 2 seconds (what
+chapter_updater does). Checks every lookup against the documented rules:
+a time belongs to the chapter that started last at or before it, and times
+before the first or after the last chapter belong to none.
+
+Usage: python benchmarks/chapters.py [--chapters 1000] [--lookups 5000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checks import Checks  # noqa: E402
+from chapter_index import ChapterIndex  # noqa: E402
+
+CHAPTER_LENGTH = 600.0  # seconds
+PLAYHEAD_STEP = 2.0  # seconds between two chapter_updater runs
+PLAYHEAD_STRETCHES = 10
+
+
+def make_book(count, layout, rng):
+	chapters = []
+	start = 0.0
+	for number in range(count):
+		length = CHAPTER_LENGTH * rng.uniform(0.5, 1.5)
+		end = start + length
+		if layout == "overlapping" and number < count - 1:
+			end += rng.uniform(1.0, 30.0)
+		chapters.append({"id": number, "start": round(start, 3), "end": round(end, 3), "title": "Kapitel {}".format(number + 1)})
+		start += length
+		if layout == "gaps":
+			start += rng.uniform(1.0, 30.0)
+	return chapters
+
+
+class LinearChapters:
+	"""The lookups AudioBookPlayer did before the index"""
+
+	def __init__(self, chapters):
+		self.chapters = chapters
+
+	def chapter_at(self, time):
+		for chapter in self.chapters:
+			if chapter['start'] <= time <= chapter['end']:
+				return chapter
+		return None
+
+	def next_chapter(self, time):
+		current_chapter = self.chapter_at(time)
+		if current_chapter and self.chapters.index(current_chapter) < len(self.chapters) - 1:
+			return self.chapters[self.chapters.index(current_chapter) + 1]
+		return None
+
+	def previous_chapter(self, time):
+		current_chapter = self.chapter_at(time)
+		if current_chapter and self.chapters.index(current_chapter) > 0:
+			return self.chapters[self.chapters.index(current_chapter) - 1]
+		return None
+
+
+def expected_chapter(chapters, time):
+	started = [chapter for chapter in chapters if chapter['start'] <= time]
+	if not started or time > chapters[-1]['end'] and started[-1] is chapters[-1]:
+		return None
+	return started[-1]
+
+
+def time_lookups(lookup, times):
+	started = time.perf_counter()
+	for value in times:
+		lookup(value)
+	return (time.perf_counter() - started) / len(times) * 1e6
+
+
+def bench_book(layout, count, lookups, rng, checks):
+	chapters = make_book(count, layout, rng)
+	duration = chapters[-1]['end']
+	random_times = [rng.uniform(-10.0, duration + 10.0) for _ in range(lookups)]
+	# Stretches of playback from positions spread over the whole book
+	stretch = lookups // PLAYHEAD_STRETCHES
+	playhead_times = [position + step * PLAYHEAD_STEP
+		for position in (rng.uniform(0.0, duration - stretch * PLAYHEAD_STEP) for _ in range(PLAYHEAD_STRETCHES)) for step in range(stretch)]
+
+	result = {"layout": layout, "chapters": count, "lookups": lookups}
+	for name, times in (("seek", random_times), ("playhead", playhead_times)):
+		for variant, make in (("linear", LinearChapters), ("index", ChapterIndex)):
+			lookup = make(chapters)
+			result["{}_{}_us".format(name, variant)] = round(time_lookups(lookup.chapter_at, times), 3)
+			lookup = make(chapters)
+			result["{}_{}_next_previous_us".format(name, variant)] = round(time_lookups(
+				lambda value: (lookup.next_chapter(value), lookup.previous_chapter(value)), times), 3)
+		result["{}_speedup".format(name)] = round(result["{}_linear_us".format(name)] / result["{}_index_us".format(name)], 1)
+
+	# Every boundary and a sample of random times, in random order so the cached interval is exercised too
+	index = ChapterIndex(chapters)
+	times = random_times[:2000] + [chapter['start'] for chapter in chapters] + [chapter['end'] for chapter in chapters]
+	rng.shuffle(times)
+	wrong = [value for value in times if index.chapter_at(value) is not expected_chapter(chapters, value)]
+	checks.check("{}: lookups follow the chapter rules".format(layout), not wrong, "{} wrong, e.g. at {}".format(len(wrong), wrong[:3]) if wrong else None)
+	neighbours = [value for value in times[:500] if index.chapter_at(value) is not None and (
+		index.next_chapter(value) is not (chapters[index.position_at(value) + 1] if index.position_at(value) < count - 1 else None)
+		or index.previous_chapter(value) is not (chapters[index.position_at(value) - 1] if index.position_at(value) > 0 else None))]
+	checks.check("{}: next and previous are the neighbours of the current chapter".format(layout), not neighbours)
+	checks.check("{}: index is faster than the linear scan".format(layout),
+		result["seek_speedup"] > 1 and result["playhead_speedup"] > 1, "speedups {} and {}".format(result["seek_speedup"], result["playhead_speedup"]))
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--chapters", type=int, default=1000)
+	parser.add_argument("--lookups", type=int, default=5000)
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	checks = Checks()
+	results = [bench_book(layout, args.chapters, args.lookups, rng, checks) for layout in ("contiguous", "gaps", "overlapping")]
+
+	# A time on the end of one chapter and the start of the next belongs to the later one
+	boundary = ChapterIndex([{"start": 0.0, "end": 10.0}, {"start": 10.0, "end": 20.0}])
+	checks.check("boundary resolves to the later chapter", boundary.chapter_at(10.0)["start"] == 10.0)
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results, "checks": checks.results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,34 @@
+"""Pass/fail checks of a benchmark run.
+
+A benchmark records what it expects of the add-on as named checks next to its
+measurements. The checks go into the JSON report and any failed one is
+printed to stderr and makes the script exit non-zero, so a regression fails
+the run instead of just showing up in the numbers.
+"""
+import sys
+
+
+class Checks:
+	def __init__(self):
+		self.results = []
+
+	def check(self, name, passed, detail=None):
+		"""Record a check, detail is reported alongside to explain a failure"""
+		passed = bool(passed)
+		result = {"check": name, "passed": passed}
+		if detail is not None:
+			result["detail"] = detail
+		self.results.append(result)
+		return passed
+
+	@property
+	def failed(self):
+		return [result for result in self.results if not result["passed"]]
+
+	def exit(self):
+		"""Exit non-zero if a check failed, call after the report is written"""
+		for result in self.failed:
+			print("FAILED: {}{}".format(result["check"], " ({})".format(result["detail"]) if "detail" in result else ""), file=sys.stderr)
+		if self.failed:
+			sys.exit(1)
+		print("{} checks passed".format(len(self.results)), file=sys.stderr)
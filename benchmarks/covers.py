@@ -0,0 +1,105 @@
+"""Check that page flips of the library grid do not wait for cover downloads.
+
+Starts the add-on with an empty cover cache against a stub server with
+latency, flips through the grid and times each flip. Checks that a flip takes
+a fraction of one request, that covers not cached yet are shown by URL, that
+each downloaded cover then replaces the URL of its slot while the page is
+still shown, and that no slot ever shows the cover of a book from another
+page.
+
+Usage: python benchmarks/covers.py [--latency 0.3] [--flips 4]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+from checks import Checks  # noqa: E402
+
+TIMEOUT = 10.0  # seconds to wait for the covers of a page
+
+
+def page_covers(ui, cover_cache):
+	"""Slot textures of the shown page next to the cached files of its books"""
+	expected = [cover_cache.get_cached(audiobook.id, audiobook.updated_at) for audiobook in ui.audiobooks_to_display]
+	return ui.slot_textures[:len(expected)], expected
+
+
+def flip(ui, cover_cache):
+	started = time.perf_counter()
+	ui.next_page()
+	flip_ms = (time.perf_counter() - started) * 1000
+	textures = list(ui.slot_textures[:len(ui.audiobooks_to_display)])
+	by_url = sum(1 for texture in textures if texture.startswith("http"))
+	started = time.perf_counter()
+	while True:
+		shown, expected = page_covers(ui, cover_cache)
+		if (None not in expected and shown == expected) or time.perf_counter() - started > TIMEOUT:
+			break
+		time.sleep(0.005)
+	return {
+		"flip_ms": round(flip_ms, 1),
+		"shown_by_url": by_url,
+		"swapped_ms": round((time.perf_counter() - started) * 1000, 1),
+		"all_swapped": shown == expected,
+		# A local file that is not the cover of the book in its slot
+		"foreign_covers": sum(1 for texture, own in zip(shown, expected) if not texture.startswith("http") and texture != own)
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=200)
+	parser.add_argument("--latency", type=float, default=0.3, help="seconds the server adds to every request")
+	parser.add_argument("--flips", type=int, default=4)
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_covers_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = run.StubServerProcess(argparse.Namespace(items=args.items, chapters=1, tracks=1, latency=args.latency, jitter=0.0))
+	context = {"url": server.url, "profile_dir": profile_dir}
+	try:
+		run.startup(context)
+		run.wait_for_background_syncs()
+		ui = context["ui"]
+		# Only the covers are timed, not pulling library pages from the server
+		if hasattr(ui.audiobooks, "load_all"):
+			ui.audiobooks.load_all()
+		# Neighbour pages are warmed in the background, so flip past them before measuring
+		ui.cover_cache.prefetch = lambda load_keys: None
+		results = [flip(ui, context["cover_cache"]) for _ in range(args.flips)]
+	finally:
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	checks = Checks()
+	slowest = max(result["flip_ms"] for result in results)
+	checks.check("page flips do not wait for covers", slowest < args.latency * 1000 / 2, slowest)
+	checks.check("covers not cached yet are shown by URL", all(result["shown_by_url"] for result in results),
+		[result["shown_by_url"] for result in results])
+	checks.check("downloaded covers replace the URLs", all(result["all_swapped"] for result in results))
+	checks.check("no slot shows the cover of another book", not any(result["foreign_covers"] for result in results))
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "flips": results, "checks": checks.results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
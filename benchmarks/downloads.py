@@ -0,0 +1,225 @@
+"""Check offline downloads against the stub server.
+
+Downloads one book with one and with several connections from a server that
+throttles every connection, then again while the server cuts off transfers
+midway, and once more after stopping the download halfway and resuming it
+with a new manager. Checks that every download completes byte-identical to
+the server's files, that the manifest matches the server's audio files, that
+the resumed download continues instead of starting over, that failed
+transfers leave the circuit breaker of the user interface closed, that the
+files of a playing book are not deleted, and that a book is streamed instead
+of played from its files once one was truncated or changed on the server.
+Exits non-zero otherwise.
+
+Usage: python benchmarks/downloads.py [--file-size 8388608] [--file-rate 4194304] [--tracks 2]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+import stub_server  # noqa: E402
+from checks import Checks  # noqa: E402
+
+ITEM_ID = "li_000000"
+
+
+def expected_checksums(args):
+	library = stub_server.SyntheticLibrary(1, 1, args.tracks, file_size=args.file_size)
+	return [hashlib.sha1(library.file_bytes(ITEM_ID, track["ino"])).hexdigest() for track in library.audio_tracks(ITEM_ID)]
+
+
+def create_manager(url, download_dir, connections):
+	from download_manager import DownloadManager
+	from library_service import AudioBookShelfLibraryService
+	from login_service import AudioBookShelfService
+
+	run.reset_singletons()
+	DownloadManager._instance = None
+	service = AudioBookShelfService(url)
+	token, _ = service.get_tokens(service.login(run.USERNAME, run.PASSWORD))
+	return DownloadManager(AudioBookShelfLibraryService(url, token), download_dir, max_connections=connections)
+
+
+def local_checksums(tracks):
+	checksums = []
+	for track in tracks:
+		with open(track["path"], "rb") as f:
+			checksums.append(hashlib.sha1(f.read()).hexdigest())
+	return checksums
+
+
+def wait(manager, limit=300.0):
+	started = time.perf_counter()
+	while manager.get_status(ITEM_ID) and time.perf_counter() - started < limit:
+		time.sleep(0.02)
+	return manager.get_status(ITEM_ID)
+
+
+def download(server, args, connections, mode="ok", stop_at=None):
+	"""Download the book and report time, transferred bytes and whether it matches the server"""
+	from http_session import get_session
+
+	download_dir = tempfile.mkdtemp(prefix="abs_downloads_")
+	server.set_mode(mode)
+	server.reset()
+	started = time.perf_counter()
+	resumed_at = None
+	try:
+		manager = create_manager(server.url, download_dir, connections)
+		manager.enqueue(ITEM_ID)
+		if stop_at is not None:
+			# Stop like a closing add-on would, then resume with a new manager
+			total = args.file_size * args.tracks
+			while (manager.get_status(ITEM_ID) or {}).get("done", 0) < total * stop_at:
+				time.sleep(0.005)
+			manager.stop()
+			time.sleep(0.5)
+			resumed_at = manager.used_bytes()
+			manager = create_manager(server.url, download_dir, connections)
+			manager.enqueue(ITEM_ID)
+		failure = wait(manager)
+		wall_time = time.perf_counter() - started
+		tracks = manager.get_local_tracks(ITEM_ID) or []
+		checksums = local_checksums(tracks)
+		matches_server = manager.verify(ITEM_ID) is not None
+		breaker = get_session().breaker
+		breaker_failures = breaker.failures + (breaker.failure_threshold if breaker.is_open() else 0)
+		manager.stop()
+	finally:
+		server.set_mode("ok")
+		shutil.rmtree(download_dir, ignore_errors=True)
+
+	file_requests = {endpoint: entry for endpoint, entry in server.stats().items() if "/file/" in endpoint}
+	return {
+		"connections": connections,
+		"mode": mode,
+		"wall_ms": round(wall_time * 1000, 1),
+		"requests": sum(entry["count"] for entry in file_requests.values()),
+		"bytes_received": sum(entry["bytes_out"] for entry in file_requests.values()),
+		"resumed_at_bytes": resumed_at,
+		"error": failure and failure["error"],
+		"byte_identical": len(tracks) == args.tracks and checksums == expected_checksums(args),
+		"matches_server": matches_server,
+		"breaker_failures": breaker_failures
+	}
+
+
+def remove_while_playing(server, args):
+	"""Try to delete a downloaded book while it plays from its files, and once it stopped"""
+	from download_manager import DownloadInUse
+
+	download_dir = tempfile.mkdtemp(prefix="abs_downloads_")
+	try:
+		manager = create_manager(server.url, download_dir, args.connections)
+		manager.enqueue(ITEM_ID)
+		wait(manager)
+		manager.set_playing(ITEM_ID, True)
+		try:
+			manager.remove(ITEM_ID)
+			refused = False
+		except DownloadInUse:
+			refused = True
+		kept = manager.is_downloaded(ITEM_ID)
+		manager.set_playing(ITEM_ID, False)
+		manager.remove(ITEM_ID)
+		started = time.perf_counter()
+		while os.path.exists(os.path.join(download_dir, ITEM_ID)) and time.perf_counter() - started < 10:
+			time.sleep(0.02)
+		removed = not os.path.exists(os.path.join(download_dir, ITEM_ID))
+		manager.stop()
+	finally:
+		shutil.rmtree(download_dir, ignore_errors=True)
+	return {"refused": refused, "kept": kept, "removed_after_stop": removed}
+
+
+def damaged_files(server, args):
+	"""Check which files a playback would use after they were cut short or changed on the server"""
+	download_dir = tempfile.mkdtemp(prefix="abs_downloads_")
+	try:
+		manager = create_manager(server.url, download_dir, args.connections)
+		manager.enqueue(ITEM_ID)
+		wait(manager)
+		audio_tracks = manager.library_service.open_play_session(ITEM_ID)["audioTracks"]
+		plays_local = manager.verify(ITEM_ID, audio_tracks) is not None
+		changed = [dict(track, metadata=dict(track["metadata"], size=track["metadata"]["size"] + 1)) for track in audio_tracks]
+		changed_streams = manager.verify(ITEM_ID, changed) is None
+		with open(manager.get_local_tracks(ITEM_ID)[-1]["path"], "r+b") as f:
+			f.truncate(args.file_size // 2)
+		truncated_streams = manager.get_local_tracks(ITEM_ID) is None and manager.verify(ITEM_ID, audio_tracks) is None
+		manager.stop()
+	finally:
+		shutil.rmtree(download_dir, ignore_errors=True)
+	return {"plays_local": plays_local, "changed_streams": changed_streams, "truncated_streams": truncated_streams}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--file-size", type=int, default=8 * 1024 * 1024, help="bytes per audio file")
+	parser.add_argument("--file-rate", type=int, default=4 * 1024 * 1024, help="bytes per second per connection")
+	parser.add_argument("--tracks", type=int, default=2, help="audio files per book")
+	parser.add_argument("--connections", type=int, default=4, help="parallel range requests")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	import download_manager
+	# Split the small benchmark files into segments like large real ones
+	download_manager.MIN_SEGMENT_SIZE = args.file_size // args.connections
+	download_manager.RETRY_DELAY = 0.1
+	server_args = argparse.Namespace(items=10, chapters=1, tracks=args.tracks, latency=0.0, jitter=0.0,
+		file_size=args.file_size, file_rate=args.file_rate)
+	server = run.StubServerProcess(server_args)
+	try:
+		results = [
+			download(server, args, 1),
+			download(server, args, args.connections),
+			download(server, args, args.connections, mode="flaky"),
+			download(server, args, args.connections, stop_at=0.5)
+		]
+		removal = remove_while_playing(server, args)
+		damaged = damaged_files(server, args)
+	finally:
+		run.reset_singletons()
+		server.stop()
+
+	total = args.file_size * args.tracks
+	checks = Checks()
+	for result in results:
+		name = "{} connection(s){}{}".format(result["connections"], ", " + result["mode"] if result["mode"] != "ok" else "",
+			", resumed" if result["resumed_at_bytes"] is not None else "")
+		checks.check("{}: completes".format(name), result["error"] is None, result["error"])
+		checks.check("{}: files byte-identical to the server".format(name), result["byte_identical"])
+		checks.check("{}: manifest matches the server's audio files".format(name), result["matches_server"])
+		checks.check("{}: user interface circuit untouched".format(name), result["breaker_failures"] == 0, result["breaker_failures"])
+	resumed = results[-1]
+	# The stopped manager may have received a few chunks it did not write
+	checks.check("resumed download continues where it stopped", resumed["resumed_at_bytes"] >= total * 0.4
+		and resumed["bytes_received"] < total * 1.25, "{} bytes kept, {} received".format(resumed["resumed_at_bytes"], resumed["bytes_received"]))
+	checks.check("files of a playing book are not deleted", removal["refused"] and removal["kept"], removal)
+	checks.check("files are deleted once the book stopped playing", removal["removed_after_stop"])
+	checks.check("downloaded files matching the session are played", damaged["plays_local"])
+	checks.check("a book whose files changed on the server is streamed", damaged["changed_streams"])
+	checks.check("a book with a truncated file is streamed", damaged["truncated_streams"])
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results, "removal": removal,
+		"damaged": damaged, "checks": checks.results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,370 @@
+"""Minimal stand-ins for the Kodi modules so add-on code can run outside Kodi.
+
+Every call on a control is counted in CALLS, keyed by "<Class>.<method>".
+"""
+import itertools
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+
+CALLS = Counter()
+SETTINGS = {}
+PROFILE_DIR = tempfile.mkdtemp(prefix="abs_profile_")
+
+_control_ids = itertools.count(3000)
+
+
+def _counted(name):
+	def method(self, *args, **kwargs):
+		CALLS["{}.{}".format(type(self).__name__, name)] += 1
+	return method
+
+
+class Control:
+	def __init__(self, *args, **kwargs):
+		CALLS["{}.__init__".format(type(self).__name__)] += 1
+		self.control_id = next(_control_ids)
+
+	def getId(self):
+		CALLS["{}.getId".format(type(self).__name__)] += 1
+		return self.control_id
+
+	def isVisible(self):
+		CALLS["{}.isVisible".format(type(self).__name__)] += 1
+		return True
+
+	setVisible = _counted("setVisible")
+	setNavigation = _counted("setNavigation")
+	setImage = _counted("setImage")
+	setLabel = _counted("setLabel")
+	setText = _counted("setText")
+	setPercent = _counted("setPercent")
+
+
+class ControlImage(Control):
+	pass
+
+
+class ControlButton(Control):
+	pass
+
+
+class ControlLabel(Control):
+	pass
+
+
+class ControlProgress(Control):
+	pass
+
+
+class Window:
+	# Add-on windows do not call the base constructor, so state lives on the class defaults
+	focus_id = None
+
+	def __init__(self, *args, **kwargs):
+		pass
+
+	@property
+	def controls(self):
+		return self.__dict__.setdefault("_controls", {})
+
+	def addControl(self, control):
+		CALLS["Window.addControl"] += 1
+		self.controls[control.control_id] = control
+
+	def addControls(self, controls):
+		CALLS["Window.addControls"] += 1
+		for control in controls:
+			self.controls[control.control_id] = control
+
+	def removeControl(self, control):
+		CALLS["Window.removeControl"] += 1
+		self.controls.pop(control.control_id, None)
+
+	def setFocus(self, control):
+		CALLS["Window.setFocus"] += 1
+		self.focus_id = control.control_id
+		on_focus = getattr(self, "onFocus", None)
+		if on_focus:
+			on_focus(control.control_id)
+
+	def setFocusId(self, control_id):
+		CALLS["Window.setFocusId"] += 1
+		self.focus_id = control_id
+
+	def getFocusId(self):
+		return self.focus_id
+
+	def getControl(self, control_id):
+		CALLS["Window.getControl"] += 1
+		control = self.controls.get(control_id)
+		if control is None:
+			# Controls defined in the skin XML
+			control = self.controls[control_id] = Control()
+			control.control_id = control_id
+		return control
+
+	def doModal(self):
+		pass
+
+	def show(self):
+		pass
+
+	def close(self):
+		pass
+
+
+class Dialog:
+	def select(self, heading, options, *args, **kwargs):
+		return 0
+
+	def input(self, heading, *args, **kwargs):
+		return ""
+
+	def contextmenu(self, options):
+		return -1
+
+	def ok(self, heading, message):
+		return True
+
+	def notification(self, *args, **kwargs):
+		pass
+
+
+class Addon:
+	def __init__(self, *args, **kwargs):
+		pass
+
+	def getAddonInfo(self, key):
+		return PROFILE_DIR if key == "profile" else ""
+
+	def getSetting(self, setting_id):
+		return SETTINGS.get(setting_id, "")
+
+	def setSetting(self, setting_id, value):
+		SETTINGS[setting_id] = value
+
+
+class Action:
+	def __init__(self, action_id, button_code=0):
+		self.action_id = action_id
+		self.button_code = button_code
+
+	def getId(self):
+		return self.action_id
+
+	def getButtonCode(self):
+		return self.button_code
+
+	def __eq__(self, other):
+		# Kodi actions compare equal to their id
+		if isinstance(other, Action):
+			return self.action_id == other.action_id
+		return self.action_id == other
+
+	def __hash__(self):
+		return hash(self.action_id)
+
+
+class ListItem:
+	def __init__(self, label="", path=""):
+		self.path = path
+		self.properties = {}
+
+	def setProperty(self, key, value):
+		self.properties[key] = value
+
+	def getProperty(self, key):
+		return self.properties.get(key, "")
+
+	def setInfo(self, *args, **kwargs):
+		pass
+
+	def setArt(self, *args, **kwargs):
+		pass
+
+
+class PlayList:
+	def __init__(self, playlist_id=0):
+		self.items = []
+
+	def clear(self):
+		self.items = []
+
+	def add(self, url, listitem=None, index=-1):
+		self.items.append(listitem or ListItem(path=url))
+
+	def size(self):
+		return len(self.items)
+
+	def getposition(self):
+		with PLAYER.lock:
+			PLAYER.advance()
+			return PLAYER.position
+
+
+class PlayerState:
+	"""Simulated playback shared by all Player instances, like Kodi's single player.
+
+	Media time advances SPEED times faster than the wall clock. With
+	track_durations set, a playlist moves on to the next file once a file has
+	played to its end, like Kodi does.
+	"""
+	SPEED = 1.0
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		self.playing = False
+		self.paused = False
+		self.media_time = 0.0
+		self.started_at = None
+		self.position = 0
+		self.playlist = None
+		self.track_durations = None
+
+	def time(self):
+		if self.started_at is None:
+			return self.media_time
+		return self.media_time + (time.monotonic() - self.started_at) * self.SPEED
+
+	def start(self, media_time):
+		self.media_time = media_time
+		self.started_at = time.monotonic()
+		self.playing = True
+		self.paused = False
+
+	def hold(self):
+		self.media_time = self.time()
+		self.started_at = None
+
+	def advance(self):
+		durations = self.track_durations
+		if not durations or self.playlist is None:
+			return
+		while self.position < len(durations) - 1 and self.time() >= durations[self.position]:
+			media_time = self.time() - durations[self.position]
+			self.position += 1
+			if self.started_at is None:
+				self.media_time = media_time
+			else:
+				self.start(media_time)
+
+
+PLAYER = PlayerState()
+
+
+class Player:
+	def __init__(self, *args, **kwargs):
+		pass
+
+	def play(self, item=None, listitem=None, windowed=False, startpos=-1):
+		CALLS["Player.play"] += 1
+		with PLAYER.lock:
+			if isinstance(item, PlayList):
+				PLAYER.playlist = item
+				PLAYER.position = max(startpos, 0)
+				listitem = item.items[PLAYER.position] if item.items else None
+			else:
+				PLAYER.playlist = None
+				PLAYER.position = 0
+			resume_time = float(listitem.getProperty("resumetime") or 0) if listitem else 0.0
+			PLAYER.start(resume_time)
+
+	def playselected(self, position):
+		CALLS["Player.playselected"] += 1
+		with PLAYER.lock:
+			PLAYER.position = position
+			PLAYER.start(0.0)
+
+	def pause(self):
+		CALLS["Player.pause"] += 1
+		with PLAYER.lock:
+			if PLAYER.paused:
+				PLAYER.start(PLAYER.media_time)
+			elif PLAYER.playing:
+				PLAYER.hold()
+				PLAYER.paused = True
+
+	def stop(self):
+		CALLS["Player.stop"] += 1
+		with PLAYER.lock:
+			PLAYER.hold()
+			PLAYER.playing = False
+			PLAYER.paused = False
+
+	def seekTime(self, seconds):
+		CALLS["Player.seekTime"] += 1
+		with PLAYER.lock:
+			if PLAYER.started_at is None:
+				PLAYER.media_time = seconds
+			else:
+				PLAYER.start(seconds)
+
+	def isPlaying(self):
+		return PLAYER.playing
+
+	def isPlayingAudio(self):
+		return PLAYER.playing and not PLAYER.paused
+
+	def getTime(self):
+		CALLS["Player.getTime"] += 1
+		if not PLAYER.playing:
+			raise RuntimeError("Kodi is not playing any media file")
+		with PLAYER.lock:
+			PLAYER.advance()
+			return PLAYER.time()
+
+
+class Monitor:
+	def abortRequested(self):
+		return False
+
+	def waitForAbort(self, timeout=None):
+		return False
+
+
+def install():
+	"""Register the fake xbmc, xbmcgui, xbmcaddon and xbmcvfs modules"""
+	xbmc = types.ModuleType("xbmc")
+	for level, name in enumerate(("LOGDEBUG", "LOGINFO", "LOGWARNING", "LOGERROR", "LOGFATAL")):
+		setattr(xbmc, name, level)
+	xbmc.log = lambda message, level=0: None
+	xbmc.executebuiltin = lambda command: None
+	xbmc.sleep = lambda milliseconds: None
+	xbmc.Player = Player
+	xbmc.Monitor = Monitor
+	xbmc.PlayList = PlayList
+	xbmc.PLAYLIST_MUSIC = 0
+
+	xbmcgui = types.ModuleType("xbmcgui")
+	xbmcgui.Window = Window
+	xbmcgui.WindowXML = Window
+	xbmcgui.WindowXMLDialog = Window
+	xbmcgui.Dialog = Dialog
+	xbmcgui.ControlImage = ControlImage
+	xbmcgui.ControlButton = ControlButton
+	xbmcgui.ControlLabel = ControlLabel
+	xbmcgui.ControlProgress = ControlProgress
+	xbmcgui.ListItem = ListItem
+	xbmcgui.Action = Action
+	for action_id, name in enumerate(("ACTION_MOVE_LEFT", "ACTION_MOVE_RIGHT", "ACTION_MOVE_UP", "ACTION_MOVE_DOWN"), start=1):
+		setattr(xbmcgui, name, action_id)
+	for action_id, name in enumerate(("ACTION_SELECT_ITEM", "ACTION_PREVIOUS_MENU", "ACTION_NAV_BACK", "ACTION_CONTEXT_MENU"), start=7):
+		setattr(xbmcgui, name, action_id)
+	xbmcgui.NOTIFICATION_INFO = "info"
+	xbmcgui.NOTIFICATION_WARNING = "warning"
+	xbmcgui.NOTIFICATION_ERROR = "error"
+
+	xbmcaddon = types.ModuleType("xbmcaddon")
+	xbmcaddon.Addon = Addon
+
+	xbmcvfs = types.ModuleType("xbmcvfs")
+	xbmcvfs.translatePath = lambda path: path
+
+	sys.modules.update({"xbmc": xbmc, "xbmcgui": xbmcgui, "xbmcaddon": xbmcaddon, "xbmcvfs": xbmcvfs})
@@ -0,0 +1,72 @@
+"""Count the Kodi control API calls the library grid makes per page flip.
+
+Usage: python benchmarks/grid_flip.py [--columns 3] [--rows 2] [--flips 20]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_kodi  # noqa: E402
+
+
+def make_audiobooks(count):
+	from media_item import Audiobook
+	return [
+		Audiobook.from_dict({"id": "li_{}".format(index), "updatedAt": index, "media": {"metadata": {"title": "Book {}".format(index)}}})
+		for index in range(count)
+	]
+
+
+def run(columns, rows, flips):
+	fake_kodi.SETTINGS.update({"columns": str(columns), "rows": str(rows)})
+	import default
+
+	ui = default.GUI("script-mainwindow.xml", "", "default", "1080i", True,
+		optional1=make_audiobooks(default.MAX_PER_PAGE * (flips + 1) - 1))
+
+	fake_kodi.CALLS.clear()
+	ui.onInit()
+	setup_calls = dict(fake_kodi.CALLS)
+
+	flip_calls = []
+	started = time.perf_counter()
+	for _ in range(flips):
+		fake_kodi.CALLS.clear()
+		ui.next_page()
+		flip_calls.append(sum(fake_kodi.CALLS.values()))
+	elapsed = time.perf_counter() - started
+
+	fake_kodi.CALLS.clear()
+	for button in ui.button_controls:
+		ui.onFocus(button.control_id)
+	focus_calls = sum(fake_kodi.CALLS.values()) / len(ui.button_controls)
+
+	return {
+		"columns": default.MAX_COLUMNS,
+		"rows": default.MAX_ROWS,
+		"setup_calls": sum(setup_calls.values()),
+		"setup_calls_by_method": setup_calls,
+		"calls_per_full_flip": flip_calls[0],
+		"calls_last_flip": flip_calls[-1],
+		"calls_per_focus": focus_calls,
+		"ms_per_flip": elapsed * 1000 / flips
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--columns", type=int, default=3)
+	parser.add_argument("--rows", type=int, default=2)
+	parser.add_argument("--flips", type=int, default=20)
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	print(json.dumps(run(args.columns, args.rows, args.flips), indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,136 @@
+"""Compare the memory a library keeps per item as dicts and as slotted models.
+
+Parses a minified listing of a synthetic library, the way the add-on
+receives it, and converts every item as select_library did before the
+media_item models (a dict of pre-formatted display strings per item) and
+with Audiobook.from_dict. Reports the memory still allocated once the
+listing itself is dropped, per item and in total, and the time to convert.
+
+Usage: python benchmarks/item_memory.py [--items 10000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_server  # noqa: E402
+from checks import Checks  # noqa: E402
+from media_item import Audiobook  # noqa: E402
+
+URL = "http://abs.local:13378"
+TOKEN = "tok_" + "0" * 32
+
+
+def as_dicts(items, progress):
+	"""The item dicts select_library built before the models"""
+	audiobooks = []
+	for item in items:
+		cover_path = item['media'].get('coverPath', "") or ""
+		icon_id = os.path.basename(os.path.dirname(cover_path))
+		cover_url = "{}/api/items/{}/cover?token={}".format(URL, icon_id, TOKEN)
+		title = item['media']['metadata'].get('title', "") or ""
+		description = item['media']['metadata'].get('description', "") or ""
+		narrator_name = item['media']['metadata'].get('narratorName', "") or ""
+		publisher = item['media']['metadata'].get('publisher', "") or ""
+		published_year = item['media']['metadata'].get('publishedYear', "") or ""
+		duration = item['media'].get('duration', 0.0) or 0.0
+		iid = item['id']
+
+		progress_info = {"currentTime": 0.0, "progress": 0.0}
+		progress_data = progress.get(iid)
+		if progress_data and 'currentTime' in progress_data:
+			progress_info = {
+				"currentTime": float(progress_data.get('currentTime', 0.0)),
+				"progress": float(progress_data.get('progress', 0.0))
+			}
+
+		display_title = title
+		if progress_info["progress"] > 0.01:
+			display_title = "{} ({}%)".format(title, int(progress_info["progress"] * 100))
+
+		audiobooks.append({
+			"id": iid,
+			"title": display_title,
+			"original_title": title,
+			"cover_url": cover_url,
+			"description": description,
+			"narrator_name": "Narrator: " + narrator_name,
+			"published_year": "Year: " + published_year,
+			"publisher": "Publisher: " + publisher,
+			"duration": duration,
+			"progress": progress_info
+		})
+	return audiobooks
+
+
+def as_models(items, progress):
+	return [Audiobook.from_dict(item, progress.get(item['id'])) for item in items]
+
+
+def measure(name, convert, listing, progress):
+	"""Memory the converted items keep once the parsed listing is gone"""
+	gc.collect()
+	tracemalloc.start()
+	items = json.loads(listing)["results"]
+	started = time.perf_counter()
+	audiobooks = convert(items, progress)
+	convert_ms = (time.perf_counter() - started) * 1000
+	del items
+	gc.collect()
+	retained, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	count = len(audiobooks)
+	return {
+		"variant": name,
+		"items": count,
+		"retained_kb": round(retained / 1024, 1),
+		"bytes_per_item": round(retained / count),
+		"peak_kb": round(peak / 1024, 1),
+		"convert_ms": round(convert_ms, 1)
+	}, audiobooks
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=10000)
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	library = stub_server.SyntheticLibrary(args.items, 20, 1)
+	listing = json.dumps(library.query({"minified": "1"}))
+	progress = library.progress
+
+	before, dicts = measure("dict per item", as_dicts, listing, progress)
+	after, models = measure("Audiobook", as_models, listing, progress)
+
+	checks = Checks()
+	checks.check("models keep less memory per item than the dicts", after["bytes_per_item"] < before["bytes_per_item"],
+		"{} vs {} bytes".format(after["bytes_per_item"], before["bytes_per_item"]))
+	# Display strings are produced on demand from the same data
+	sample = [(entry, model) for entry, model in zip(dicts, models) if entry["progress"]["progress"] > 0.01][:1] + list(zip(dicts, models))[:1]
+	checks.check("models show the same title, narrator and year", all(
+		entry["original_title"] == model.title and entry["narrator_name"].endswith(model.media.metadata.narrator_name or "")
+		and entry["published_year"].endswith(model.media.metadata.published_year or "") for entry, model in sample))
+
+	report = {
+		"config": {key: value for key, value in vars(args).items() if key != "output"},
+		"results": [before, after],
+		"saved_per_item": before["bytes_per_item"] - after["bytes_per_item"],
+		"checks": checks.results
+	}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
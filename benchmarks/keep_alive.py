@@ -0,0 +1,105 @@
+"""Measure what the pooled keep-alive session saves over a new connection per call.
+
+Sends the same authenticated API calls to the stub server three ways: with
+module-level requests calls as the add-on did before the shared session, with
+the shared session and keep-alive turned off, and with keep-alive on. Each
+variant runs once sequentially and once from several threads, like the
+player's background threads. Reports latency per call, throughput and how
+many TCP connections the server accepted.
+
+Usage: python benchmarks/keep_alive.py [--calls 300] [--threads 8] [--latency 0.0]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(server, get, calls, threads):
+	"""Run calls GET requests through get() on threads threads"""
+	url = server.url + "/api/libraries"
+	latencies = []
+
+	def call(_):
+		started = time.perf_counter()
+		get(url).raise_for_status()
+		latencies.append((time.perf_counter() - started) * 1000)
+
+	server.reset()
+	started = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=threads) as executor:
+		list(executor.map(call, range(calls)))
+	wall_time = time.perf_counter() - started
+	return {
+		"threads": threads,
+		"calls": calls,
+		"p50_ms": round(percentile(latencies, 0.5), 3),
+		"p95_ms": round(percentile(latencies, 0.95), 3),
+		"calls_per_second": round(calls / wall_time, 1),
+		"connections": server.connections()
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--calls", type=int, default=300, help="calls per variant and concurrency")
+	parser.add_argument("--threads", type=int, default=8, help="threads of the concurrent runs")
+	parser.add_argument("--pool-size", type=int, default=10, help="connections the shared session keeps open")
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds the server adds to every request")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	from http_session import create_session
+	from login_service import AudioBookShelfService
+
+	server = run.StubServerProcess(argparse.Namespace(items=100, chapters=1, tracks=1, latency=args.latency, jitter=0.0))
+	try:
+		run.reset_singletons()
+		service = AudioBookShelfService(server.url)
+		token, _ = service.get_tokens(service.login(run.USERNAME, run.PASSWORD))
+		headers = {"Authorization": "Bearer {}".format(token)}
+
+		results = []
+		for name, keep_alive in (("requests.get", None), ("session, keep-alive off", False), ("session, keep-alive on", True)):
+			if keep_alive is None:
+				def get(url):
+					return requests.get(url, headers=headers)
+				session = None
+			else:
+				session = create_session(args.pool_size, keep_alive)
+				session.breaker = None
+				session.headers.update(headers)
+				get = session.get
+			for threads in (1, args.threads):
+				results.append(dict(measure(server, get, args.calls, threads), variant=name))
+			if session is not None:
+				session.close()
+	finally:
+		run.reset_singletons()
+		server.stop()
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,150 @@
+"""Check playback of a book split into 50 audio files against the stub server.
+
+Opens a book with saved progress whose files and chapters do not line up,
+plays it as a playlist and checks in global book time: resuming in the right
+file, seeking into another file, skipping back and to the next chapter
+across file boundaries, playing over the end of a file, the chapter shown,
+and the position the playback session reports to the server.
+
+Usage: python benchmarks/multitrack.py [--tracks 50] [--chapters 37]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+from checks import Checks  # noqa: E402
+
+SPEED = 20.0  # media seconds per wall-clock second
+TOLERANCE = 2.0  # seconds of book time a check may be off, playback goes on while it runs
+
+
+def press(dialog, control_id):
+	import xbmcgui
+
+	dialog.setFocusId(control_id)
+	dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_SELECT_ITEM))
+
+
+def chapter_at(chapters, book_time):
+	return next(chapter for chapter in reversed(chapters) if chapter["start"] <= book_time)
+
+
+def file_at(tracks, book_time):
+	return max(index for index, track in enumerate(tracks) if track["startOffset"] <= book_time)
+
+
+def check_position(checks, name, dialog, tracks, book_time):
+	"""Check the player is in the file holding book_time and reports book_time"""
+	position = file_at(tracks, book_time)
+	actual = dialog.get_book_time()
+	checks.check(name, fake_kodi.PLAYER.position == position and abs(actual - book_time) < TOLERANCE,
+		"file {} at {:.1f}s, expected file {} at {:.1f}s".format(fake_kodi.PLAYER.position, actual, position, book_time))
+	return actual
+
+
+def play_book(args, server, context, checks):
+	from audio_book import AudioBookPlayer
+	from library_service import AudioBookShelfLibraryService
+
+	library_service = AudioBookShelfLibraryService()
+	# A book resuming somewhere in the middle of its files
+	audiobook, saved = next((audiobook, progress["currentTime"]) for audiobook in context["ui"].audiobooks
+		for progress in [library_service.progress_cache.get((audiobook.id, None))]
+		if progress and 0.2 < progress["currentTime"] / progress["duration"] < 0.6)
+	item = library_service.get_library_item_by_id(audiobook.id)
+	tracks = item["media"]["tracks"]
+	chapters = item["media"]["chapters"]
+	fake_kodi.PLAYER.track_durations = [track["duration"] for track in tracks]
+
+	dialog = AudioBookPlayer("audiobook_dialog.xml", "", "default", "1080i", audiobook=audiobook, cover="")
+	dialog.onInit()
+	press(dialog, 1001)
+	checks.check("playlist holds every file", dialog.playlist is not None and dialog.playlist.size() == len(tracks),
+		dialog.playlist.size() if dialog.playlist else None)
+	check_position(checks, "resumes in the file holding the saved position", dialog, tracks, saved)
+
+	target = tracks[40]["startOffset"] + tracks[40]["duration"] / 3
+	dialog.seek_book_time(target)
+	check_position(checks, "seeks into another file", dialog, tracks, target)
+
+	now = dialog.get_book_time()
+	dialog.update_chapter(now)
+	checks.check("shows the chapter playing at the book time", dialog.rendered_values.get(1011) == chapter_at(chapters, now)["title"],
+		"{} at {:.1f}s".format(dialog.rendered_values.get(1011), now))
+
+	# From the end of a file to a chapter starting in the next one
+	following = next(chapter for previous, chapter in zip(chapters, chapters[1:])
+		if file_at(tracks, previous["start"]) < file_at(tracks, chapter["start"]) > file_at(tracks, now))
+	dialog.seek_book_time(tracks[file_at(tracks, following["start"])]["startOffset"] - 2)
+	press(dialog, 1008)
+	check_position(checks, "next chapter in the next file", dialog, tracks, following["start"])
+
+	target = tracks[30]["startOffset"] + 4
+	dialog.seek_book_time(target)
+	press(dialog, 1002)
+	check_position(checks, "skipping back 10s goes to the previous file", dialog, tracks, target - 10)
+
+	before = tracks[20]["startOffset"] + tracks[20]["duration"] - 3
+	dialog.seek_book_time(before)
+	started = time.perf_counter()
+	time.sleep(10 / SPEED)
+	check_position(checks, "plays on into the next file", dialog, tracks, before + (time.perf_counter() - started) * SPEED)
+
+	press(dialog, 1010)
+	paused = dialog.get_book_time()
+	dialog.close()
+	context["progress_writer"].stop()
+	session = next(session for session in server.sessions().values() if session["libraryItemId"] == audiobook.id)
+	checks.check("session reports the position in book time", session["closed"] and abs(session["currentTime"] - paused) < 1,
+		"{:.1f}s, paused at {:.1f}s".format(session["currentTime"], paused))
+	return {"item": audiobook.id, "tracks": len(tracks), "chapters": len(chapters), "saved": saved, "paused": paused}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=200)
+	parser.add_argument("--tracks", type=int, default=50, help="audio files per book")
+	parser.add_argument("--chapters", type=int, default=37, help="chapters per book, not lining up with the files")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	fake_kodi.PlayerState.SPEED = SPEED
+	profile_dir = tempfile.mkdtemp(prefix="abs_multitrack_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = run.StubServerProcess(argparse.Namespace(items=args.items, chapters=args.chapters, tracks=args.tracks, latency=0.0, jitter=0.0))
+	context = {"url": server.url, "profile_dir": profile_dir}
+	checks = Checks()
+	try:
+		run.startup(context)
+		run.wait_for_background_syncs()
+		server.reset()
+		details = play_book(args, server, context, checks)
+		endpoints = {endpoint: entry["count"] for endpoint, entry in server.stats().items()}
+	finally:
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "details": details,
+		"requests": endpoints, "checks": checks.results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,142 @@
+"""Measure how the add-on behaves while the server drops connections or stalls.
+
+Reports how long each call takes to fail before and after the circuit breaker
+opens, whether the library is still served from the cache, and how long the
+background probe needs to notice that the server is back. Checks that the
+circuit opens after the failure threshold, that calls then fail at once,
+that the cached page is served and that the circuit closes again once the
+server is back, and exits non-zero otherwise.
+
+Usage: python benchmarks/outage.py [--items 1000] [--read-timeout 1.0]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+from checks import Checks  # noqa: E402
+
+CALLS_PER_PHASE = 6
+RECOVERY_LIMIT = 60.0  # seconds
+FAST_FAIL_MS = 50  # a call rejected by the open circuit sends nothing
+
+
+def time_calls(call, count=CALLS_PER_PHASE):
+	"""Return duration and outcome of count consecutive calls"""
+	results = []
+	for _ in range(count):
+		started = time.perf_counter()
+		try:
+			call()
+			outcome = "ok"
+		except Exception as e:
+			outcome = type(e).__name__
+		results.append({"ms": round((time.perf_counter() - started) * 1000, 1), "outcome": outcome})
+	return results
+
+
+def wait_for_recovery(breaker, limit=RECOVERY_LIMIT):
+	started = time.perf_counter()
+	while breaker.is_open() and time.perf_counter() - started < limit:
+		time.sleep(0.05)
+	return round((time.perf_counter() - started) * 1000, 1)
+
+
+def outage(server, context, mode):
+	from http_session import get_session
+	from library_service import AudioBookShelfLibraryService
+
+	library_service = AudioBookShelfLibraryService()
+	library_id = context["ui"].library_id
+	breaker = get_session().breaker
+
+	server.set_mode(mode)
+	calls = time_calls(library_service.get_me)
+
+	# A new launch would sync the library first, with the circuit open it is served from the cache
+	library_service.library_cache.synced_libraries.discard(library_id)
+	started = time.perf_counter()
+	page = library_service.get_library_items(library_id, limit=10, page=0)
+	cached_page = {"ms": round((time.perf_counter() - started) * 1000, 1), "items": len(page["results"])}
+
+	server.set_mode("ok")
+	recovery_ms = wait_for_recovery(breaker)
+	return {
+		"mode": mode,
+		"calls": calls,
+		"cached_page": cached_page,
+		"recovered": not breaker.is_open(),
+		"recovery_ms": recovery_ms,
+		"after_recovery": time_calls(library_service.get_me, 1)
+	}
+
+
+def check_outage(checks, result, read_timeout):
+	from circuit_breaker import FAILURE_THRESHOLD
+
+	mode = result["mode"]
+	failing, rejected = result["calls"][:FAILURE_THRESHOLD], result["calls"][FAILURE_THRESHOLD:]
+	checks.check("{}: circuit opens after {} failed calls".format(mode, FAILURE_THRESHOLD),
+		all(call["outcome"] not in ("ok", "CircuitOpenError") for call in failing) and all(call["outcome"] == "CircuitOpenError" for call in rejected),
+		[call["outcome"] for call in result["calls"]])
+	checks.check("{}: calls fail at once while the circuit is open".format(mode), max(call["ms"] for call in rejected) < FAST_FAIL_MS,
+		max(call["ms"] for call in rejected))
+	if mode == "stall":
+		checks.check("stall: calls give up at the read timeout", max(call["ms"] for call in failing) < read_timeout * 1000 * 1.5,
+			max(call["ms"] for call in failing))
+	checks.check("{}: library page served from the cache".format(mode), result["cached_page"]["items"] == 10, result["cached_page"])
+	checks.check("{}: circuit closes once the server is back".format(mode), result["recovered"], result["recovery_ms"])
+	checks.check("{}: calls succeed after recovery".format(mode), result["after_recovery"][0]["outcome"] == "ok", result["after_recovery"])
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=1000)
+	parser.add_argument("--read-timeout", type=float, default=1.0, help="interactive read timeout used for the stall phase")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_outage_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server_args = argparse.Namespace(items=args.items, chapters=20, tracks=1, latency=0.0, jitter=0.0)
+	server = run.StubServerProcess(server_args, stall=args.read_timeout * 5)
+	context = {"url": server.url, "profile_dir": profile_dir}
+
+	try:
+		run.startup(context)
+		# Scenarios below expect the library in the cache, as on any launch after the first
+		run.wait_for_background_syncs()
+		from http_session import get_session
+		# Keep the stall phase short, the default interactive read timeout is much longer
+		get_session().timeout = (1.0, args.read_timeout)
+		results = [outage(server, context, "drop"), outage(server, context, "stall")]
+	finally:
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	checks = Checks()
+	for result in results:
+		check_outage(checks, result, args.read_timeout)
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results, "checks": checks.results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,119 @@
+"""Measure browsing a podcast with many episodes against the stub server.
+
+Opens the first podcast of a podcast library in several launches of the
+add-on that share one profile: the first builds the episode index, the next
+only refresh it, after new episodes were published and after old ones were
+deleted. Each launch pages through the episodes in the grid. Reports
+requests, bytes, time and peak memory of opening the podcast and of paging,
+and how many episodes showed progress without requesting it.
+
+Usage: python benchmarks/podcasts.py [--episodes 1500] [--pages 20]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+import stub_server  # noqa: E402
+
+
+def launch(url, profile_dir):
+	"""Log in and load the progress index like a new launch of the add-on"""
+	from library_service import AudioBookShelfLibraryService
+	from login_service import AudioBookShelfService
+
+	run.reset_singletons()
+	service = AudioBookShelfService(url)
+	token, _ = service.get_tokens(service.login(run.USERNAME, run.PASSWORD))
+	library_service = AudioBookShelfLibraryService(url, token, cache_dir=profile_dir)
+	library_service.get_all_media_progress()
+
+
+def measure(server, step):
+	server.reset()
+	tracemalloc.start()
+	started = time.perf_counter()
+	details = step()
+	wall_time = time.perf_counter() - started
+	_, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	endpoints = server.stats()
+	return dict(details, **{
+		"wall_ms": round(wall_time * 1000, 1),
+		"requests": {endpoint: entry["count"] for endpoint, entry in endpoints.items()},
+		"bytes_received": sum(entry["bytes_out"] for entry in endpoints.values()),
+		"peak_memory_kb": round(peak_memory / 1024, 1)
+	})
+
+
+def browse(server, context, name, pages):
+	import default
+
+	launch(context["url"], context["profile_dir"])
+	podcast = default.open_library(stub_server.PODCAST_LIBRARY_ID)[0]
+	episodes = None
+
+	def open_podcast():
+		nonlocal episodes
+		episodes = default.open_podcast(stub_server.PODCAST_LIBRARY_ID, podcast)
+		first_page = episodes[0:default.MAX_PER_PAGE]
+		return {"episodes": len(episodes), "newest": first_page[0].title}
+
+	def page_through():
+		shown = []
+		for page in range(pages):
+			shown.extend(episodes[page * default.MAX_PER_PAGE:(page + 1) * default.MAX_PER_PAGE])
+		return {"pages": pages, "with_progress": sum(1 for episode in shown if episode.progress > 0)}
+
+	return {"launch": name, "open": measure(server, open_podcast), "paging": measure(server, page_through)}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--podcasts", type=int, default=5)
+	parser.add_argument("--episodes", type=int, default=1500, help="episodes per podcast")
+	parser.add_argument("--pages", type=int, default=20, help="grid pages to flip through per launch")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_podcasts_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server_args = argparse.Namespace(items=10, chapters=1, tracks=1, latency=0.0, jitter=0.0,
+		podcasts=args.podcasts, episodes=args.episodes)
+	server = run.StubServerProcess(server_args)
+	context = {"url": server.url, "profile_dir": profile_dir}
+	try:
+		results = [browse(server, context, "cold", args.pages), browse(server, context, "warm", args.pages)]
+		server.change_episodes(publish=3)
+		results.append(browse(server, context, "3 published", args.pages))
+		server.change_episodes(remove=10)
+		results.append(browse(server, context, "10 deleted", args.pages))
+		index_size = os.path.getsize(os.path.join(profile_dir, "episode_index.json"))
+	finally:
+		run.reset_singletons()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	report = {
+		"config": {key: value for key, value in vars(args).items() if key != "output"},
+		"episode_index_bytes": index_size,
+		"results": results
+	}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,109 @@
+"""Measure how long opening a book and pressing Play take with and without focus prefetch.
+
+Focuses a cover, waits like a user deciding whether to open it, opens the
+player dialog and presses Play, against a stub server with latency. Reports
+the time until chapters and progress are shown and until playback starts,
+and the prefetch hit counts.
+
+Usage: python benchmarks/prefetch.py [--latency 0.1] [--books 6] [--think 0.8]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+
+
+def open_books(context, books, think, prefetch):
+	import xbmcgui
+	from audio_book import AudioBookPlayer
+	from focus_prefetch import FocusPrefetcher
+	from item_cache import ItemCache
+	from library_service import AudioBookShelfLibraryService, ITEM_CACHE_SIZE
+
+	library_service = AudioBookShelfLibraryService()
+	library_service.item_cache = ItemCache(ITEM_CACHE_SIZE)
+	ui = context["ui"]
+	ui.prefetcher = FocusPrefetcher(library_service) if prefetch else None
+	results = []
+	for slot in range(books):
+		ui.setFocus(ui.button_controls[slot])
+		time.sleep(think)
+
+		audiobook = ui.audiobooks[ui.page * len(ui.button_controls) + slot]
+		started = time.perf_counter()
+		if ui.prefetcher:
+			ui.prefetcher.claim(audiobook.id)
+		dialog = AudioBookPlayer("audiobook_dialog.xml", "", "default", "1080i", audiobook=audiobook, cover="")
+		dialog.onInit()
+		while not dialog.chapters or not dialog.progress_loaded.is_set():
+			time.sleep(0.001)
+		details_ms = (time.perf_counter() - started) * 1000
+
+		# Looking at the dialog before pressing Play
+		time.sleep(think)
+		dialog.setFocusId(1001)
+		started = time.perf_counter()
+		dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_SELECT_ITEM))
+		play_ms = (time.perf_counter() - started) * 1000
+		dialog.close()
+		fake_kodi.PLAYER.reset()
+		results.append({"details_ms": round(details_ms, 1), "play_ms": round(play_ms, 1)})
+
+	counts = None
+	if ui.prefetcher:
+		counts = dict(ui.prefetcher.counts)
+		ui.prefetcher.shutdown()
+		ui.prefetcher = None
+	return {
+		"prefetch": prefetch,
+		"details_ms_avg": round(sum(result["details_ms"] for result in results) / len(results), 1),
+		"play_ms_avg": round(sum(result["play_ms"] for result in results) / len(results), 1),
+		"books": results,
+		"counts": counts
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--latency", type=float, default=0.1, help="seconds the server adds to every request")
+	parser.add_argument("--books", type=int, default=6, help="books opened per variant, at most one grid page")
+	parser.add_argument("--think", type=float, default=0.8, help="seconds spent on a focused cover and in the dialog")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_prefetch_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = run.StubServerProcess(argparse.Namespace(items=200, chapters=20, tracks=1, latency=args.latency, jitter=0.0))
+	context = {"url": server.url, "profile_dir": profile_dir}
+	try:
+		run.startup(context)
+		# Scenarios below expect the library in the cache, as on any launch after the first
+		run.wait_for_background_syncs()
+		books = min(args.books, len(context["ui"].button_controls))
+		results = [open_books(context, books, args.think, False), open_books(context, books, args.think, True)]
+	finally:
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+"""Check that profiling covers threads started while the main thread is profiled.
+
+Enables the profiler, runs a main function under profiler.run the way
+default.py does, and starts worker threads from it through
+wrap_thread_target, as the player dialog does for chapters, progress and the
+playback session. Checks that every worker ran to its end, that spans of
+all threads were recorded and that the profile and trace files are written.
+Python 3.12 and later allow one active cProfile per process, so run it with
+those versions too.
+
+Usage: python3.12 benchmarks/profiler_threads.py [--threads 3]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_kodi  # noqa: E402
+from checks import Checks  # noqa: E402
+
+
+def work(n):
+	return sum(i * i for i in range(n))
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--threads", type=int, default=3, help="worker threads started from the profiled main function")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	import profiler
+
+	output_dir = tempfile.mkdtemp(prefix="abs_profile_")
+	finished = []
+	errors = []
+
+	def worker():
+		with profiler.span("worker"):
+			work(20000)
+		finished.append(threading.current_thread().name)
+
+	def addon_main():
+		threads = []
+		for number in range(args.threads):
+			target = profiler.wrap_thread_target(worker)
+
+			def guarded(target=target):
+				try:
+					target()
+				except Exception as e:
+					errors.append(repr(e))
+			thread = threading.Thread(target=guarded, name="worker-{}".format(number))
+			thread.start()
+			threads.append(thread)
+		work(20000)
+		for thread in threads:
+			thread.join(timeout=10)
+
+	try:
+		profiler.enable(output_dir)
+		profiler.run(addon_main)
+		profiler.save()
+		with open(os.path.join(output_dir, profiler.TRACE_FILE_NAME), encoding="utf-8") as f:
+			trace = json.load(f)["traceEvents"]
+		pstats_written = os.path.exists(os.path.join(output_dir, profiler.PSTATS_FILE_NAME))
+	finally:
+		shutil.rmtree(output_dir, ignore_errors=True)
+
+	worker_spans = [event for event in trace if event["ph"] == "X" and event["name"] == "worker"]
+	checks = Checks()
+	checks.check("profiled worker threads raise nothing", not errors, errors[:1])
+	checks.check("every worker thread ran to its end", len(finished) == args.threads, finished)
+	checks.check("spans of every worker thread are recorded", len(worker_spans) == args.threads, len(worker_spans))
+	checks.check("main thread span is recorded", any(event["ph"] == "X" and event["name"].endswith("addon_main") for event in trace))
+	checks.check("cProfile statistics are written", pstats_written)
+	print(json.dumps({"python": sys.version.split()[0], "threads": args.threads, "checks": checks.results}, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,224 @@
+"""Check that server-side changes reach the caches through the realtime listener.
+
+Starts the add-on against the stub server, connects the listener to the
+stub's socket and lets the stub script the changes another client would make:
+progress saved on a phone, a renamed book, an added and a removed book. For
+each event reports the time until the cache reflects it and the requests the
+add-on made for it, next to what re-polling the same data costs, and counts
+the polls of an idle socket. Checks that every event reaches the caches and
+the search index, that the socket stays out of the shared session's request
+statistics, and that after the next page access the cached library and the
+cache file match the server's listing in order, also after a book was added
+while the add-on was closed. Exits non-zero otherwise.
+
+Usage: python benchmarks/realtime.py [--items 1000] [--ping-interval 2] [--idle 10]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+import stub_server  # noqa: E402
+from checks import Checks  # noqa: E402
+
+TIMEOUT = 10.0  # seconds to wait for an event to show up in the cache
+
+
+def wait_for(condition, started):
+	while not condition():
+		if time.perf_counter() - started > TIMEOUT:
+			return None
+		time.sleep(0.001)
+	return round((time.perf_counter() - started) * 1000, 1)
+
+
+def split_requests(endpoints):
+	socket = {endpoint: entry["count"] for endpoint, entry in endpoints.items() if "/socket.io/" in endpoint}
+	api = {endpoint: entry["count"] for endpoint, entry in endpoints.items() if "/socket.io/" not in endpoint}
+	return socket, api
+
+
+def apply_event(server, name, event, condition, **params):
+	server.reset()
+	started = time.perf_counter()
+	server.emit(event, **params)
+	latency_ms = wait_for(condition, started)
+	socket, api = split_requests(server.stats())
+	return {"event": name, "applied": latency_ms is not None, "latency_ms": latency_ms, "socket_requests": socket, "api_requests": api}
+
+
+def cached_item(library_service, item_id):
+	# Looked up directly, copying the whole listing on every check would compete with the listener for the lock
+	return library_service.library_cache.libraries[stub_server.LIBRARY_ID]["items"].get(item_id)
+
+
+def run_events(server, context):
+	from library_service import AudioBookShelfLibraryService
+
+	library_service = AudioBookShelfLibraryService()
+	search_index = context["ui"].search_index
+	cover_cache = context["cover_cache"]
+	first_page = context["ui"].audiobooks[:6]
+	progress_id, renamed_id, removed_id = first_page[0].id, first_page[1].id, first_page[2].id
+	library_service.get_cached_library_item(renamed_id)
+	count = library_service.library_cache.count(stub_server.LIBRARY_ID)
+
+	results = [
+		apply_event(server, "progress from phone", "user_item_progress_updated",
+			lambda: (library_service.progress_cache.get((progress_id, None)) or {}).get("currentTime") == 1234.5,
+			id=progress_id, currentTime=1234.5),
+		apply_event(server, "book renamed", "item_updated",
+			lambda: (cached_item(library_service, renamed_id) or {}).get("media", {}).get("metadata", {}).get("title") == "Umbenannt"
+				and library_service.item_cache.get(renamed_id)["media"]["metadata"]["title"] == "Umbenannt",
+			id=renamed_id, title="Umbenannt"),
+		apply_event(server, "book added", "item_added",
+			lambda: library_service.library_cache.count(stub_server.LIBRARY_ID) == count + 1),
+		apply_event(server, "book removed", "item_removed",
+			lambda: cached_item(library_service, removed_id) is None,
+			id=removed_id),
+	]
+	results[1]["old_cover_dropped"] = cover_cache.get_cached(renamed_id, first_page[1].updated_at) is None
+	# The stub numbers a new book after the highest id
+	added_id = max(item["id"] for item in library_service.library_cache.get_items(stub_server.LIBRARY_ID))
+	results[1]["search_index_updated"] = [audiobook.id for audiobook in search_index.search("Umbenannt")] == [renamed_id]
+	results[2]["search_index_updated"] = added_id in search_index
+	results[3]["search_index_updated"] = removed_id not in search_index
+
+	# What the same changes cost without the listener
+	server.reset()
+	library_service.get_all_media_progress()
+	library_service.get_library_item_by_id(renamed_id)
+	_, refetch = split_requests(server.stats())
+	refetch_bytes = sum(entry["bytes_out"] for entry in server.stats().values())
+	return results, {"requests": refetch, "bytes_received": refetch_bytes}
+
+
+def check_consistency(url, token, library_service):
+	"""Compare ids, titles and order of the cached library with a fresh listing from the server"""
+	listing = requests.get("{}/api/libraries/{}/items".format(url, stub_server.LIBRARY_ID), params={"minified": 1},
+		headers={"Authorization": "Bearer " + token}).json()["results"]
+	server_items = [(item["id"], item["media"]["metadata"]["title"]) for item in listing]
+	cached_items = [(item["id"], item["media"]["metadata"]["title"]) for item in library_service.library_cache.get_items(stub_server.LIBRARY_ID)]
+	return server_items == cached_items
+
+
+def check_persisted(profile_dir, library_service):
+	from library_cache import LibraryCache
+
+	on_disk = LibraryCache(profile_dir).get_items(stub_server.LIBRARY_ID)
+	return on_disk == library_service.library_cache.get_items(stub_server.LIBRARY_ID)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=1000)
+	parser.add_argument("--latency", type=float, default=0.02, help="seconds the server adds to every request")
+	parser.add_argument("--ping-interval", type=float, default=2.0, help="seconds the stub holds an idle poll open")
+	parser.add_argument("--idle", type=float, default=10.0, help="seconds to count polls of an idle socket")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_realtime_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = run.StubServerProcess(argparse.Namespace(items=args.items, chapters=20, tracks=1, latency=args.latency, jitter=0.0,
+		ping_interval=args.ping_interval))
+	context = {"url": server.url, "profile_dir": profile_dir}
+	listener = None
+	try:
+		from http_session import get_session
+		from library_service import AudioBookShelfLibraryService
+		from realtime_listener import RealtimeListener
+		from request_stats import RequestStats
+
+		run.startup(context)
+		# Scenarios below expect the library in the cache, as on any launch after the first
+		run.wait_for_background_syncs()
+		library_service = AudioBookShelfLibraryService()
+		request_stats = get_session().stats = RequestStats()
+		listener = RealtimeListener(library_service, context["cover_cache"], context["progress_writer"], context["ui"].search_index,
+			stub_server.LIBRARY_ID)
+		started = time.perf_counter()
+		listener.start()
+		connected = listener.connected.wait(TIMEOUT)
+		connect_ms = round((time.perf_counter() - started) * 1000, 1)
+
+		results, refetch = run_events(server, context)
+		# The added book's place in the server's order is unknown until the next page access syncs the library
+		reordered = library_service.library_cache.needs_full_sync(stub_server.LIBRARY_ID)
+		library_service.get_library_items(stub_server.LIBRARY_ID, limit=6, page=0)
+		run.wait_for_background_syncs()
+		consistent = check_consistency(server.url, library_service.token, library_service)
+
+		server.reset()
+		time.sleep(args.idle)
+		idle_requests, _ = split_requests(server.stats())
+		counts = dict(listener.counts)
+		shared_socket_requests = sum(entry["count"] for key, entry in request_stats.snapshot().items() if "/socket.io/" in key)
+		# Changes are written to disk in bursts, at the latest when the listener stops
+		listener.stop()
+		listener = None
+		persisted = check_persisted(profile_dir, library_service)
+
+		# A book added while the add-on is closed reaches the cache through the delta sync of the next launch
+		server.emit("item_added")
+		run.startup(context)
+		run.wait_for_background_syncs()
+		library_service = AudioBookShelfLibraryService()
+		relaunch_consistent = check_consistency(server.url, library_service.token, library_service)
+	finally:
+		if listener:
+			listener.stop()
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	report = {
+		"config": {key: value for key, value in vars(args).items() if key != "output"},
+		"connected": connected,
+		"connect_ms": connect_ms,
+		"events": results,
+		"refetch_instead": refetch,
+		"cache_matches_server": consistent,
+		"cache_file_matches": persisted,
+		"cache_matches_server_after_relaunch": relaunch_consistent,
+		"idle_socket_requests": idle_requests,
+		"listener_counts": counts
+	}
+	checks = Checks()
+	checks.check("listener connects", connected)
+	for result in results:
+		checks.check("{}: reaches the cache".format(result["event"]), result["applied"], result["latency_ms"])
+		if "search_index_updated" in result:
+			checks.check("{}: reaches the search index".format(result["event"]), result["search_index_updated"])
+	checks.check("book renamed: old cover dropped", results[1]["old_cover_dropped"])
+	checks.check("book added: library marked for a full sync", reordered)
+	checks.check("socket requests stay out of the shared session's statistics", shared_socket_requests == 0, shared_socket_requests)
+	checks.check("cached library matches the server's listing in order", consistent)
+	checks.check("cache file matches the cached library", persisted)
+	checks.check("book added while closed: cached library matches the server's listing in order after the next launch", relaunch_consistent)
+	# One held poll per ping interval, each answered with a pong
+	polls = sum(idle_requests.values())
+	checks.check("idle socket polls once per ping interval", polls <= 2 * (args.idle / args.ping_interval + 1), polls)
+	report["checks"] = checks.results
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
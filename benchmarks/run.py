@@ -0,0 +1,290 @@
+"""End-to-end benchmarks of the add-on against the stub Audiobookshelf server.
+
+Runs startup, library paging and the player lifecycle with fake Kodi modules
+and reports wall time, requests, bytes and peak memory per scenario as JSON.
+With --sizes only cold and warm startup run, once per library size, to show
+how startup scales with the number of books.
+
+Usage: python benchmarks/run.py [--items 1000] [--latency 0.02] [--output results.json]
+       python benchmarks/run.py --sizes 100,1000,10000
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import fake_kodi  # noqa: E402
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+
+class StubServerProcess:
+	"""Runs the stub server in its own process so it does not skew client timings"""
+
+	def __init__(self, args, stall=60.0):
+		command = [sys.executable, os.path.join(BENCHMARK_DIR, "stub_server.py"),
+			"--items", str(args.items), "--chapters", str(args.chapters), "--tracks", str(args.tracks),
+			"--latency", str(args.latency), "--jitter", str(args.jitter), "--stall", str(stall)]
+		# Options only some benchmarks use
+		for option in ("file_size", "file_rate", "podcasts", "episodes", "ping_interval"):
+			if getattr(args, option, None) is not None:
+				command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+		self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+		self.url = "http://127.0.0.1:{}".format(self.process.stdout.readline().strip())
+
+	def stats(self):
+		import requests
+		return requests.get(self.url + "/__stats").json()
+
+	def reset(self):
+		import requests
+		requests.post(self.url + "/__reset")
+
+	def requests(self):
+		import requests
+		return requests.get(self.url + "/__requests").json()
+
+	def sessions(self):
+		import requests
+		return requests.get(self.url + "/__sessions").json()
+
+	def connections(self):
+		import requests
+		return requests.get(self.url + "/__connections").json()["connections"]
+
+	def set_mode(self, mode):
+		import requests
+		requests.post(self.url + "/__mode", params={"mode": mode})
+
+	def change_episodes(self, publish=0, remove=0):
+		import requests
+		requests.post(self.url + "/__episodes", params={"publish": publish, "remove": remove})
+
+	def emit(self, event, **params):
+		import requests
+		return requests.post(self.url + "/__emit", params=dict(params, event=event)).json()
+
+	def stop(self):
+		self.process.terminate()
+		self.process.wait()
+
+
+def reset_singletons():
+	"""Forget all process-wide state, as if the add-on was launched anew"""
+	import http_session
+	from download_manager import DownloadManager
+	from library_service import AudioBookShelfLibraryService
+	from progress_sync import ProgressSyncWriter
+
+	# A cold start leaves the library cache to be written by a background sync
+	wait_for_background_syncs()
+	if ProgressSyncWriter._instance is not None and hasattr(ProgressSyncWriter._instance, "initialized"):
+		ProgressSyncWriter._instance.stop()
+	if http_session._session is not None:
+		http_session._session.breaker.stop()
+		http_session._session.close()
+	http_session._session = None
+	AudioBookShelfLibraryService._instance = None
+	ProgressSyncWriter._instance = None
+	if DownloadManager._instance is not None and hasattr(DownloadManager._instance, "initialized"):
+		DownloadManager._instance.stop()
+	DownloadManager._instance = None
+	fake_kodi.PLAYER.reset()
+
+
+def wait_for_background_syncs():
+	from library_service import AudioBookShelfLibraryService
+
+	if AudioBookShelfLibraryService._instance is not None and hasattr(AudioBookShelfLibraryService._instance, "initialized"):
+		AudioBookShelfLibraryService._instance.wait_for_sync()
+
+
+@contextlib.contextmanager
+def fast_clock(factor):
+	"""Let time.monotonic run factor times faster, so the add-on's timers act as in a longer session.
+
+	Playback, listening time and the scheduler's due times follow the fast
+	clock, while waits still take real time: a 0.5s scheduler tick then covers
+	0.5 * factor seconds of playback.
+	"""
+	real_monotonic = time.monotonic
+	origin = real_monotonic()
+	time.monotonic = lambda: origin + (real_monotonic() - origin) * factor
+	try:
+		yield
+	finally:
+		time.monotonic = real_monotonic
+
+
+def startup(context):
+	"""Launch the add-on up to the first page of the library grid, like default.py does"""
+	import default
+	from cover_cache import CoverCache
+	from library_service import AudioBookShelfLibraryService
+	from login_service import AudioBookShelfService
+	from progress_sync import ProgressSyncWriter
+	from search_index import SearchIndex
+	from startup_timeline import StartupTimeline
+	from token_store import TokenStore
+
+	reset_singletons()
+	profile_dir = context["profile_dir"]
+	service = AudioBookShelfService(context["url"])
+	AudioBookShelfLibraryService(context["url"], cache_dir=profile_dir)
+	data = default.start_session(service, USERNAME, PASSWORD, TokenStore(profile_dir), StartupTimeline())
+	library_id = default.select_library(data["libraries"])
+
+	search_index = SearchIndex()
+	audiobooks = default.open_library(library_id, search_index)
+	progress_writer = ProgressSyncWriter(AudioBookShelfLibraryService(), profile_dir)
+	progress_writer.start()
+	cover_cache = CoverCache(os.path.join(profile_dir, "covers"), AudioBookShelfLibraryService(), default.COVER_WIDTH, default.COVER_HEIGHT)
+	ui = default.GUI("script-mainwindow.xml", "", "default", "1080i", True,
+		optional1=audiobooks, cover_cache=cover_cache, search_index=search_index, library_id=library_id)
+	ui.onInit()
+
+	if context.get("cover_cache"):
+		context["cover_cache"].shutdown()
+	context.update(ui=ui, cover_cache=cover_cache, progress_writer=progress_writer)
+	return {"library_size": len(audiobooks)}
+
+
+def paging(context):
+	"""Flip forward through the library grid"""
+	ui = context["ui"]
+	pages = 0
+	while pages < context["pages"] and (ui.page + 1) * len(ui.button_controls) < len(ui.audiobooks):
+		ui.next_page()
+		pages += 1
+	context["cover_cache"].executor.shutdown(wait=True)
+	return {"pages": pages}
+
+
+def player(context):
+	"""Open a book with saved progress, play it, pause and close the dialog"""
+	import xbmcgui
+	from audio_book import AudioBookPlayer
+	from library_service import AudioBookShelfLibraryService
+
+	library_service = AudioBookShelfLibraryService()
+	ui = context["ui"]
+	audiobook = next((audiobook for audiobook in ui.audiobooks[:200]
+		if library_service.progress_cache.get((audiobook.id, None))), ui.audiobooks[0])
+
+	dialog = AudioBookPlayer("audiobook_dialog.xml", "", "default", "1080i", audiobook=audiobook, cover="")
+	dialog.onInit()
+
+	dialog.setFocusId(1001)
+	dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_SELECT_ITEM))
+	time.sleep(context["play_seconds"])
+
+	dialog.setFocusId(1010)
+	dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_SELECT_ITEM))
+	dialog.close()
+	context["progress_writer"].stop()
+	return {"item": audiobook.id, "position": round(fake_kodi.PLAYER.time(), 1)}
+
+
+def measure(name, scenario, context, server):
+	server.reset()
+	fake_kodi.CALLS.clear()
+	tracemalloc.start()
+	started = time.perf_counter()
+	details = scenario(context)
+	wall_time = time.perf_counter() - started
+	# Work the scenario left to background threads still counts for requests and memory
+	wait_for_background_syncs()
+	_, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	endpoints = server.stats()
+	return {
+		"scenario": name,
+		"wall_ms": round(wall_time * 1000, 1),
+		"requests": sum(entry["count"] for entry in endpoints.values()),
+		"bytes_sent": sum(entry["bytes_in"] for entry in endpoints.values()),
+		"bytes_received": sum(entry["bytes_out"] for entry in endpoints.values()),
+		"peak_memory_kb": round(peak_memory / 1024, 1),
+		"control_calls": sum(fake_kodi.CALLS.values()),
+		"endpoints": endpoints,
+		"details": details
+	}
+
+
+def run_scenarios(args, scenarios):
+	"""Run scenarios in order against a fresh stub server and profile"""
+	profile_dir = tempfile.mkdtemp(prefix="abs_bench_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = StubServerProcess(args)
+	context = {"url": server.url, "profile_dir": profile_dir, "pages": args.pages, "play_seconds": args.play_seconds}
+	try:
+		return [measure(name, scenario, context, server) for name, scenario in scenarios]
+	finally:
+		reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def size_sweep(args, sizes):
+	"""Cold and warm startup for each library size, with the requests each needed"""
+	results = []
+	for items in sizes:
+		for result in run_scenarios(argparse.Namespace(**dict(vars(args), items=items)), [("cold_start", startup), ("warm_start", startup)]):
+			results.append({
+				"items": items,
+				"scenario": result["scenario"],
+				"wall_ms": result["wall_ms"],
+				"requests": result["requests"],
+				"bytes_received": result["bytes_received"],
+				"peak_memory_kb": result["peak_memory_kb"],
+				"endpoints": {endpoint: entry["count"] for endpoint, entry in result["endpoints"].items()}
+			})
+	return results
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=1000, help="books in the synthetic library")
+	parser.add_argument("--sizes", help="comma separated library sizes, runs only startup once per size")
+	parser.add_argument("--chapters", type=int, default=20, help="chapters per book")
+	parser.add_argument("--tracks", type=int, default=1, help="audio files per book")
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds the server adds to every request")
+	parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds added to the latency")
+	parser.add_argument("--pages", type=int, default=20, help="grid pages to flip through")
+	parser.add_argument("--play-seconds", type=float, default=3.0, help="wall-clock seconds of playback")
+	parser.add_argument("--speed", type=float, default=20.0, help="media seconds played per wall-clock second")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	fake_kodi.PlayerState.SPEED = args.speed
+	if args.sizes:
+		results = size_sweep(args, [int(size) for size in args.sizes.split(",")])
+	else:
+		results = run_scenarios(args, [("cold_start", startup), ("warm_start", startup), ("paging", paging), ("player", player)])
+
+	report = {"config": {key: value for key, value in vars(args).items() if key != "output"}, "results": results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+		for result in results:
+			print("{:>6} {scenario:<12} {wall_ms:>9.1f} ms {requests:>5} requests {bytes_received:>10} bytes {peak_memory_kb:>9.1f} KiB peak".format(
+				result.get("items", args.items), **result))
+	else:
+		print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,132 @@
+"""Measure type-ahead query latency of the search index over a large library.
+
+Builds the index page by page from a synthetic library, as the grid does while
+pages load, with some accented author names mixed in. Then times queries as
+they are typed: single letters that match most of the library, prefixes of
+titles, authors, narrators and series, several terms, and queries typed
+without accents. Checks that every query type stays under the latency
+budget and that prefix and accent-insensitive matching find what they should.
+
+Usage: python benchmarks/search.py [--items 10000] [--budget-ms 10]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stub_server  # noqa: E402
+from checks import Checks  # noqa: E402
+from media_item import Audiobook  # noqa: E402
+from search_index import SearchIndex, tokenize  # noqa: E402
+
+PAGE_SIZE = 6  # items per grid page
+ACCENTED_AUTHORS = ["Friedrich Dürrenmatt", "Émile Zola", "Bohumil Hrabal", "Sigrid Undset", "Halldór Laxness", "Jiří Kratochvil"]
+# Typed queries, each typed letter by letter
+QUERIES = {
+	"single letter": ["b", "a", "s"],
+	"title": ["buch 4711", "schatten", "nebel"],
+	"author": ["autor 17", "autor 399"],
+	"narrator": ["sprecher 42"],
+	"series": ["reihe 8"],
+	"several terms": ["buch meer autor 3", "reihe 1 nebel"],
+	"without accents": ["durrenmatt", "emile zola", "jiri"]
+}
+REPEAT = 5
+SEARCHED_FIELDS = ("title", "subtitle", "authorName", "narratorName", "seriesName")
+
+
+def percentile(values, fraction):
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def build(items):
+	index = SearchIndex()
+	started = time.perf_counter()
+	for start in range(0, len(items), PAGE_SIZE):
+		for item in items[start:start + PAGE_SIZE]:
+			index.add(Audiobook.from_dict(item))
+	return index, (time.perf_counter() - started) * 1000
+
+
+def time_query(index, query):
+	"""Latencies of every prefix of query, as the results update while typing"""
+	latencies = []
+	for end in range(1, len(query) + 1):
+		for _ in range(REPEAT):
+			started = time.perf_counter()
+			index.search(query[:end])
+			latencies.append((time.perf_counter() - started) * 1000)
+	return latencies
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=10000)
+	parser.add_argument("--budget-ms", type=float, default=10.0, help="p95 query latency each query type must stay under")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	items = stub_server.SyntheticLibrary(args.items, 1, 1).query({"minified": "1"})["results"]
+	for position, item in enumerate(items[::7]):
+		item["media"]["metadata"]["authorName"] = ACCENTED_AUTHORS[position % len(ACCENTED_AUTHORS)]
+	index, build_ms = build(items)
+
+	# The first query after pages were added sorts the new tokens
+	started = time.perf_counter()
+	index.search("buch")
+	first_query_ms = (time.perf_counter() - started) * 1000
+
+	checks = Checks()
+	results = []
+	for kind, queries in QUERIES.items():
+		latencies = [latency for query in queries for latency in time_query(index, query)]
+		result = {
+			"queries": kind,
+			"matches": [len(index.search(query)) for query in queries],
+			"p50_ms": round(percentile(latencies, 0.5), 3),
+			"p95_ms": round(percentile(latencies, 0.95), 3),
+			"max_ms": round(max(latencies), 3)
+		}
+		results.append(result)
+		checks.check("{} queries under {} ms".format(kind, args.budget_ms), result["p95_ms"] < args.budget_ms, result["p95_ms"])
+
+	def matches(query):
+		return {audiobook.id for audiobook in index.search(query)}
+
+	accented = {item["id"] for item in items if item["media"]["metadata"]["authorName"] == "Friedrich Dürrenmatt"}
+	checks.check("finds accented names typed without accents", matches("durrenmatt") == accented == matches("Dürrenmatt"))
+	checks.check("matches prefixes", matches("dürr") == accented)
+	# Every term must be the prefix of a word of one of the searched fields
+	words = {item["id"]: [tokenize(item["media"]["metadata"].get(field)) for field in SEARCHED_FIELDS] for item in items}
+	for query in [query for queries in QUERIES.values() for query in queries]:
+		expected = {item_id for item_id, fields in words.items()
+			if all(any(word.startswith(term) for tokens in fields for word in tokens) for term in tokenize(query))}
+		checks.check("same matches as a full scan for {!r}".format(query), matches(query) == expected,
+			"{} vs {}".format(len(matches(query)), len(expected)))
+	checks.check("unknown terms match nothing", not index.search("xyzzy"))
+
+	report = {
+		"config": {key: value for key, value in vars(args).items() if key != "output"},
+		"indexed": len(index),
+		"tokens": len(index.postings),
+		"build_ms": round(build_ms, 1),
+		"build_us_per_item": round(build_ms * 1000 / len(index), 1),
+		"first_query_ms": round(first_query_ms, 3),
+		"results": results,
+		"checks": checks.results
+	}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
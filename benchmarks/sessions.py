@@ -0,0 +1,189 @@
+"""Check the playback session requests of a simulated hour of listening.
+
+Plays a book with saved progress for half an hour, during which the stub
+server answers session updates with 503 for a few minutes, pauses, plays on
+(which closes the first session and opens a second one) for another half
+hour and closes the dialog. The add-on's clock runs --speed times faster, so
+the hour takes a minute. Checks the request sequence (play, syncs, close per
+session, no plain progress PATCHes), the listening time and final position
+the server recorded per session, and reports the request counts. Before that
+it opens a book's dialog and closes it after the dwell time without pressing
+Play, once as opened and once after moving the focus off Play and back, and
+checks that only the second opens a session in advance and closes it.
+
+Usage: python benchmarks/sessions.py [--minutes 60] [--speed 60] [--outage-minutes 3]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_kodi  # noqa: E402
+import run  # noqa: E402
+from checks import Checks  # noqa: E402
+
+SAVE_INTERVAL = 30  # seconds of playback between two session syncs, AudioBookPlayer.progress_save_interval
+# The scheduler ticks every 0.5s of real time, so positions and listening time are off by up to a tick
+TICK_TOLERANCE = 0.5
+
+
+def press(dialog, control_id):
+	import xbmcgui
+
+	dialog.setFocusId(control_id)
+	dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_SELECT_ITEM))
+
+
+def listen(args, minutes):
+	"""Wait while the player plays minutes of the book"""
+	time.sleep(minutes * 60 / args.speed)
+
+
+def choose_book(ui, library_service, minutes):
+	# A book with saved progress that does not end within the simulated playback
+	for audiobook in ui.audiobooks:
+		progress = library_service.progress_cache.get((audiobook.id, None))
+		if progress and progress["duration"] - progress["currentTime"] > minutes * 60 * 1.5:
+			return audiobook, progress["currentTime"]
+	raise RuntimeError("No book with enough time left, use more --items")
+
+
+def look_at_book(context, server, navigate):
+	"""Open the dialog of a book, stay longer than the dwell time without pressing Play and close it.
+
+	With navigate the focus is moved off Play and back first. Returns the
+	sessions opened for the book and whether one was opened in advance.
+	"""
+	import xbmcgui
+	from audio_book import AudioBookPlayer, SESSION_DWELL_TIME
+
+	audiobook = context["ui"].audiobooks[0]
+	before = set(server.sessions())
+	dialog = AudioBookPlayer("audiobook_dialog.xml", "", "default", "1080i", audiobook=audiobook, cover="")
+	dialog.onInit()
+	if navigate:
+		dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_MOVE_LEFT))
+		dialog.setFocus(dialog.getControl(1002))
+		dialog.onAction(fake_kodi.Action(xbmcgui.ACTION_MOVE_RIGHT))
+		dialog.setFocus(dialog.getControl(1001))
+	time.sleep(SESSION_DWELL_TIME + 0.5)
+	prefetched = dialog.prefetched_session is not None
+	dialog.close()
+	sessions = [session for session_id, session in server.sessions().items() if session_id not in before]
+	return sessions, prefetched
+
+
+def play_hour(args, context, server):
+	from audio_book import AudioBookPlayer
+	from library_service import AudioBookShelfLibraryService
+
+	library_service = AudioBookShelfLibraryService()
+	audiobook, start_time = choose_book(context["ui"], library_service, args.minutes)
+	half = args.minutes / 2.0
+	server.reset()
+	with run.fast_clock(args.speed):
+		dialog = AudioBookPlayer("audiobook_dialog.xml", "", "default", "1080i", audiobook=audiobook, cover="")
+		dialog.onInit()
+		press(dialog, 1001)
+		listen(args, (half - args.outage_minutes) / 2)
+		server.set_mode("session_error")
+		listen(args, args.outage_minutes)
+		server.set_mode("ok")
+		listen(args, (half - args.outage_minutes) / 2)
+		press(dialog, 1010)
+		first_position = fake_kodi.PLAYER.time()
+		# Playing on after the pause closes the first session and opens the next one
+		press(dialog, 1001)
+		listen(args, half)
+		final_position = fake_kodi.PLAYER.time()
+		dialog.close()
+		context["progress_writer"].stop()
+	return audiobook.id, start_time, first_position, final_position
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=200)
+	parser.add_argument("--minutes", type=float, default=60.0, help="minutes of playback")
+	parser.add_argument("--speed", type=float, default=60.0, help="how much faster the add-on's clock runs")
+	parser.add_argument("--outage-minutes", type=float, default=3.0, help="minutes the server rejects session updates with 503")
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	fake_kodi.install()
+	profile_dir = tempfile.mkdtemp(prefix="abs_sessions_")
+	fake_kodi.PROFILE_DIR = profile_dir
+	server = run.StubServerProcess(argparse.Namespace(items=args.items, chapters=20, tracks=1, latency=0.0, jitter=0.0))
+	context = {"url": server.url, "profile_dir": profile_dir}
+	try:
+		run.startup(context)
+		run.wait_for_background_syncs()
+		looked, _ = look_at_book(context, server, navigate=False)
+		dwelled, prefetched = look_at_book(context, server, navigate=True)
+		known = set(server.sessions())
+		item_id, start_time, first_position, final_position = play_hour(args, context, server)
+		requests_made = server.requests()
+		sessions = [session for session_id, session in server.sessions().items() if session["libraryItemId"] == item_id and session_id not in known]
+	finally:
+		run.reset_singletons()
+		if context.get("cover_cache"):
+			context["cover_cache"].shutdown()
+		server.stop()
+		shutil.rmtree(profile_dir, ignore_errors=True)
+
+	counts = {}
+	for endpoint, status in requests_made:
+		key = "{} {}".format(endpoint, status)
+		counts[key] = counts.get(key, 0) + 1
+	session_requests = [endpoint for endpoint, _ in requests_made if "/play" in endpoint or "/session/" in endpoint]
+	tolerance = SAVE_INTERVAL + TICK_TOLERANCE * args.speed
+	listened = args.minutes * 60
+
+	checks = Checks()
+	checks.check("session requests start with play and end with close",
+		session_requests[:1] == ["POST /api/items/{id}/play"] and session_requests[-1:] == ["POST /api/session/{id}/close"], session_requests[:2] + session_requests[-2:])
+	checks.check("no plain progress updates", not any("/api/me/progress" in endpoint for endpoint, _ in requests_made))
+	checks.check("no updates of unknown or closed sessions", not any(status == 404 for _, status in requests_made))
+	checks.check("two sessions opened, both closed", len(sessions) == 2 and all(session["closed"] for session in sessions), sessions)
+	if len(sessions) == 2:
+		first, second = sessions
+		checks.check("first session closed at the paused position", abs(first["currentTime"] - first_position) < 1,
+			"{} vs {}".format(first["currentTime"], first_position))
+		checks.check("second session resumed where the first ended", abs(second["currentTime"] - final_position) < 1
+			and abs(final_position - first_position - listened / 2) < tolerance, "{} -> {}".format(first_position, final_position))
+		checks.check("listening time of the first session survived the outage", abs(first["timeListened"] - listened / 2) < tolerance,
+			first["timeListened"])
+		checks.check("listening time adds up to the hour", abs(first["timeListened"] + second["timeListened"] - listened) < tolerance,
+			first["timeListened"] + second["timeListened"])
+		syncs = first["syncs"] + second["syncs"]
+		checks.check("about one sync per save interval", listened / SAVE_INTERVAL / 2 <= syncs <= listened / SAVE_INTERVAL + 2, syncs)
+	checks.check("opening and closing a book without Play leaves no session", not looked, looked)
+	checks.check("staying on Play opens the session in advance", prefetched)
+	checks.check("a session opened in advance but not played is closed", len(dwelled) == 1 and dwelled[0]["closed"], dwelled)
+	checks.check("whole playback continued from the saved position", abs(first_position - start_time - listened / 2) < tolerance,
+		"{} -> {}".format(start_time, first_position))
+
+	report = {
+		"config": {key: value for key, value in vars(args).items() if key != "output"},
+		"requests": len(requests_made),
+		"requests_per_endpoint": counts,
+		"sessions": sessions,
+		"sessions_without_play": looked + dwelled,
+		"positions": {"start": start_time, "paused": first_position, "final": final_position},
+		"checks": checks.results
+	}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+	checks.exit()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,107 @@
+"""Compare decoding a whole library listing at once with the streaming decoder.
+
+Each variant runs in its own process so peak RSS is not shared between them:
+- full: the non-minified listing in one response, decoded with response.json()
+- stream: the minified listing decoded item by item while it downloads
+
+Usage: python benchmarks/stream_decode.py [--items 20000] [--keep]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, BENCHMARK_DIR)
+
+VARIANTS = ("full", "stream")
+
+
+def peak_rss_kb():
+	# ru_maxrss is in KiB on Linux
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_variant(variant, url, keep):
+	"""Decode the listing once and report timings and memory of this process"""
+	import fake_kodi
+	fake_kodi.install()
+	from library_service import AudioBookShelfLibraryService
+	from login_service import AudioBookShelfService
+
+	service = AudioBookShelfService(url)
+	token, _ = service.get_tokens(service.login("bench", "bench"))
+	library_service = AudioBookShelfLibraryService(url, token)
+	kept = []
+	rss_before = peak_rss_kb()
+
+	started = time.perf_counter()
+	first_item = None
+	count = 0
+	if variant == "full":
+		response = library_service.session.get("{}/api/libraries/lib_books/items".format(url))
+		items = response.json()["results"]
+		for item in items:
+			if first_item is None:
+				first_item = time.perf_counter() - started
+			count += 1
+			if keep:
+				kept.append(item)
+		del items, response
+	else:
+		for item in library_service.stream_library_items("lib_books"):
+			if first_item is None:
+				first_item = time.perf_counter() - started
+			count += 1
+			if keep:
+				kept.append(item)
+
+	return {
+		"variant": variant,
+		"items": count,
+		"first_item_ms": round((first_item or 0) * 1000, 1),
+		"total_ms": round((time.perf_counter() - started) * 1000, 1),
+		"peak_rss_kb": peak_rss_kb(),
+		"peak_rss_growth_kb": peak_rss_kb() - rss_before
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=20000)
+	parser.add_argument("--keep", action="store_true", help="keep the decoded items, as the library cache does")
+	parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+	parser.add_argument("--url", help=argparse.SUPPRESS)
+	parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+	args = parser.parse_args()
+
+	if args.variant:
+		print(json.dumps(run_variant(args.variant, args.url, args.keep)))
+		return
+
+	import run
+	server = run.StubServerProcess(argparse.Namespace(items=args.items, chapters=20, tracks=1, latency=0.0, jitter=0.0))
+	try:
+		results = []
+		for variant in VARIANTS:
+			command = [sys.executable, os.path.abspath(__file__), "--variant", variant, "--url", server.url]
+			if args.keep:
+				command.append("--keep")
+			results.append(json.loads(subprocess.check_output(command, text=True)))
+	finally:
+		server.stop()
+
+	report = {"config": {"items": args.items, "keep": args.keep}, "results": results}
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(report, f, indent=2)
+	else:
+		print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,815 @@
+"""Stub Audiobookshelf server serving a synthetic library for the benchmarks.
+
+Implements the endpoints the add-on uses with deterministic generated data and
+counts requests and bytes per endpoint. GET /__stats returns the counters,
+GET /__connections the TCP connections accepted, and POST /__reset clears
+both. POST /__mode?mode=stall makes every request hang
+for --stall seconds, mode=drop closes connections without answering,
+mode=flaky cuts audio file transfers off midway, mode=session_error answers
+playback session updates with 503 and mode=ok restores normal service.
+Playback sessions are kept like the server does: syncs add up the listening
+time and update the progress, updates of unknown or closed sessions get a
+404. GET /__sessions returns them and GET /__requests the endpoints
+requested since the last reset with the status of each answer, in order. Audio files are random bytes of --file-size, served with range
+support at --file-rate per connection. With --podcasts a second library holds
+podcasts of --episodes episodes each. POST /__episodes?publish=N adds N new
+episodes to the first podcast and remove=N deletes its N oldest ones.
+/socket.io/ stands in for the server's socket on the long-polling transport:
+POST /__emit?event=item_updated&id=li_000001&title=... (or item_added,
+item_removed, user_item_progress_updated&id=...&currentTime=...) changes the
+library accordingly and pushes the event to every authenticated socket.
+
+Usage: python benchmarks/stub_server.py [--items 1000] [--chapters 20] [--latency 0.02]
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LIBRARY_ID = "lib_books"
+PODCAST_LIBRARY_ID = "lib_podcasts"
+GENRES = ["Fantasy", "Krimi", "Sachbuch", "Science Fiction", "Biografie", "Historisch", "Thriller", "Kinder"]
+ID_PATTERN = re.compile(r"/(li_\d+|lib_\w+|play_[0-9a-f]+|pod_\d+|ep_\d+_\d+|\d+)(?=/|$)")
+COVER_BYTES = os.urandom(8 * 1024)
+FILE_SIZE = 2 * 1024 * 1024
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+FILE_MTIME = "Mon, 05 Oct 2026 12:00:00 GMT"
+PING_INTERVAL = 25.0  # seconds an Engine.IO poll is held open without events, like socket.io's default
+PING_TIMEOUT = 20.0  # seconds a socket may go without polling before it is dropped
+RECORD_SEPARATOR = "\x1e"
+
+
+class SyntheticLibrary:
+	"""Generated books with chapters, audio tracks and listening progress for some of them,
+	and optionally podcasts with many episodes"""
+
+	def __init__(self, items, chapters, tracks, seed=1, file_size=FILE_SIZE, podcasts=0, episodes=0):
+		rng = random.Random(seed)
+		self.rng = rng
+		self.chapters_per_item = chapters
+		self.tracks_per_item = tracks
+		self.file_size = file_size
+		self.files = {}
+		self.podcasts = []
+		self.episodes = {}
+		self.episode_progress = {}
+		self.recent_episodes = None
+		self.items = []
+		self.progress = {}
+		now = int(time.time() * 1000)
+		self.items_by_id = {}
+		for index in range(items):
+			self.add_item(index, now)
+		for index in range(podcasts):
+			self.add_podcast(index, episodes, now)
+
+	def add_item(self, index, now):
+		rng = self.rng
+		item_id = "li_{:06d}".format(index)
+		duration = rng.uniform(3600, 72000)
+		added_at = now - rng.randint(0, 5 * 365 * 86400 * 1000)
+		item = {
+			"id": item_id,
+			"ino": str(1000000 + index),
+			"libraryId": LIBRARY_ID,
+			"folderId": "fol_books",
+			"path": "/audiobooks/Autor {}/Buch {}".format(index % 400, index),
+			"relPath": "Autor {}/Buch {}".format(index % 400, index),
+			"isFile": False,
+			"mtimeMs": added_at,
+			"ctimeMs": added_at,
+			"birthtimeMs": added_at,
+			"addedAt": added_at,
+			"updatedAt": added_at + rng.randint(0, 86400 * 1000),
+			"isMissing": False,
+			"isInvalid": False,
+			"mediaType": "book",
+			"media": {
+				"id": "book_{:06d}".format(index),
+				"metadata": {
+					"title": "Buch {} {}".format(index, rng.choice(["der Schatten", "im Nebel", "am Meer", "der Zeit"])),
+					"titleIgnorePrefix": "Buch {}".format(index),
+					"subtitle": None,
+					"authorName": "Autor {}".format(index % 400),
+					"authorNameLF": "{}, Autor".format(index % 400),
+					"narratorName": "Sprecher {}".format(index % 150),
+					"seriesName": "Reihe {}".format(index % 90) if index % 3 == 0 else "",
+					"genres": rng.sample(GENRES, 2),
+					"publishedYear": str(rng.randint(1950, 2025)),
+					"publishedDate": None,
+					"publisher": "Verlag {}".format(index % 30),
+					"description": "Beschreibung von Buch {}. ".format(index) * 8,
+					"isbn": None,
+					"asin": None,
+					"language": "de",
+					"explicit": False,
+					"abridged": False
+				},
+				"coverPath": "/metadata/items/{}/cover.jpg".format(item_id),
+				"tags": [],
+				"numTracks": self.tracks_per_item,
+				"numAudioFiles": self.tracks_per_item,
+				"numChapters": self.chapters_per_item,
+				"numMissingParts": 0,
+				"numInvalidAudioFiles": 0,
+				"duration": duration,
+				"size": int(duration * 16000),
+				"ebookFormat": None
+			},
+			"numFiles": self.tracks_per_item + 1,
+			"size": int(duration * 16000)
+		}
+		self.items.append(item)
+		self.items_by_id[item_id] = item
+		if rng.random() < 0.1:
+			current_time = rng.uniform(0, duration)
+			self.progress[item_id] = {
+				"id": "prog_{}".format(item_id),
+				"libraryItemId": item_id,
+				"episodeId": None,
+				"duration": duration,
+				"progress": current_time / duration,
+				"currentTime": current_time,
+				"isFinished": False,
+				"lastUpdate": now
+			}
+		return item
+
+	def update_item(self, item_id, title):
+		"""Rename a book, which also changes its updatedAt like any edit on the server"""
+		item = self.items_by_id[item_id]
+		item["media"]["metadata"]["title"] = title
+		item["updatedAt"] = int(time.time() * 1000)
+		return item
+
+	def remove_item(self, item_id):
+		item = self.items_by_id.pop(item_id)
+		self.items.remove(item)
+		self.progress.pop(item_id, None)
+		return item
+
+	def set_progress(self, item_id, current_time):
+		"""Save progress of a book as another device of the user does"""
+		duration = self.items_by_id[item_id]["media"]["duration"]
+		progress = dict(self.progress.get(item_id) or {"libraryItemId": item_id, "episodeId": None, "isFinished": False})
+		progress.setdefault("id", "prog_{}".format(item_id))
+		progress.update({"duration": duration, "progress": current_time / duration, "currentTime": current_time, "lastUpdate": int(time.time() * 1000)})
+		self.progress[item_id] = progress
+		return progress
+
+	def add_podcast(self, index, episodes, now):
+		rng = self.rng
+		podcast_id = "pod_{:06d}".format(index)
+		self.podcasts.append({
+			"id": podcast_id,
+			"ino": str(3000000 + index),
+			"libraryId": PODCAST_LIBRARY_ID,
+			"folderId": "fol_podcasts",
+			"path": "/podcasts/Podcast {}".format(index),
+			"relPath": "Podcast {}".format(index),
+			"isFile": False,
+			"addedAt": now - rng.randint(0, 365 * 86400 * 1000),
+			"updatedAt": now,
+			"isMissing": False,
+			"isInvalid": False,
+			"mediaType": "podcast",
+			"media": {
+				"id": "podmedia_{:06d}".format(index),
+				"metadata": {
+					"title": "Podcast {}".format(index),
+					"titleIgnorePrefix": "Podcast {}".format(index),
+					"author": "Sender {}".format(index % 20),
+					"description": "Beschreibung von Podcast {}. ".format(index) * 4,
+					"genres": rng.sample(GENRES, 1),
+					"language": "de",
+					"explicit": False
+				},
+				"coverPath": "/metadata/items/{}/cover.jpg".format(podcast_id),
+				"tags": [],
+				"numEpisodes": 0,
+				"autoDownloadEpisodes": False,
+				"size": 0
+			},
+			"numFiles": 0,
+			"size": 0
+		})
+		self.items_by_id[podcast_id] = self.podcasts[-1]
+		self.episodes[podcast_id] = []
+		self.publish_episodes(podcast_id, episodes, now - episodes * 7 * 86400 * 1000, 7 * 86400 * 1000)
+
+	def publish_episodes(self, podcast_id, count, published_at, interval):
+		"""Add count episodes to a podcast, published interval ms apart starting at published_at"""
+		podcast = self.items_by_id[podcast_id]
+		episodes = self.episodes[podcast_id]
+		for _ in range(count):
+			number = len(episodes) + 1
+			episode_id = "ep_{}_{}".format(podcast_id[4:], number)
+			duration = self.rng.uniform(600, 7200)
+			ino = str(4000000 + number)
+			episodes.append({
+				"libraryItemId": podcast_id,
+				"podcastId": podcast["media"]["id"],
+				"id": episode_id,
+				"index": number,
+				"season": "",
+				"episode": str(number),
+				"episodeType": "full",
+				"title": "Folge {}: {}".format(number, self.rng.choice(["Neues aus der Stadt", "Im Gespräch", "Rückblick", "Hintergrund"])),
+				"subtitle": "Folge {} von {}".format(number, podcast["media"]["metadata"]["title"]),
+				"description": "<p>In Folge {} geht es um viele Themen. </p>".format(number) * 12,
+				"enclosure": {"url": "https://example.org/feed/{}.mp3".format(episode_id), "type": "audio/mpeg", "length": str(int(duration * 16000))},
+				"guid": "guid-{}".format(episode_id),
+				"pubDate": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(published_at / 1000)),
+				"chapters": [],
+				"audioFile": {
+					"index": 1,
+					"ino": ino,
+					"metadata": {"filename": "{}.mp3".format(episode_id), "ext": ".mp3", "path": "{}/{}.mp3".format(podcast["path"], episode_id), "size": int(duration * 16000)},
+					"addedAt": published_at,
+					"updatedAt": published_at,
+					"duration": duration,
+					"bitRate": 128000,
+					"codec": "mp3",
+					"mimeType": "audio/mpeg"
+				},
+				"audioTrack": {"index": 1, "startOffset": 0, "duration": duration, "title": "{}.mp3".format(episode_id),
+					"contentUrl": "/api/items/{}/file/{}".format(podcast_id, ino), "mimeType": "audio/mpeg"},
+				"publishedAt": published_at,
+				"addedAt": published_at,
+				"updatedAt": published_at,
+				"duration": duration,
+				"size": int(duration * 16000)
+			})
+			if self.rng.random() < 0.05:
+				self.episode_progress[(podcast_id, episode_id)] = {
+					"id": "prog_{}".format(episode_id),
+					"libraryItemId": podcast_id,
+					"episodeId": episode_id,
+					"duration": duration,
+					"progress": 0.5,
+					"currentTime": duration / 2,
+					"isFinished": False,
+					"lastUpdate": published_at
+				}
+			published_at += interval
+		podcast["media"]["numEpisodes"] = len(episodes)
+		podcast["updatedAt"] = int(time.time() * 1000)
+		self.recent_episodes = None
+
+	def remove_episodes(self, podcast_id, count):
+		"""Delete the oldest episodes of a podcast"""
+		del self.episodes[podcast_id][:count]
+		self.items_by_id[podcast_id]["media"]["numEpisodes"] = len(self.episodes[podcast_id])
+		self.items_by_id[podcast_id]["updatedAt"] = int(time.time() * 1000)
+		self.recent_episodes = None
+
+	def get_recent_episodes(self, params):
+		"""Episodes of all podcasts newest first, like the recent episodes endpoint of a podcast library"""
+		if self.recent_episodes is None:
+			episodes = [episode for podcast in self.podcasts for episode in self.episodes[podcast["id"]]]
+			self.recent_episodes = sorted(episodes, key=lambda episode: episode["publishedAt"], reverse=True)
+		limit = int(params.get("limit") or 25)
+		page = int(params.get("page") or 0)
+		results = []
+		for episode in self.recent_episodes[page * limit:(page + 1) * limit]:
+			podcast = self.items_by_id[episode["libraryItemId"]]
+			results.append(dict(episode, podcast={"id": podcast["media"]["id"], "metadata": podcast["media"]["metadata"]}))
+		return {"episodes": results, "total": len(self.recent_episodes), "limit": limit, "page": page}
+
+	def full_item(self, item_id):
+		item = json.loads(json.dumps(self.items_by_id[item_id]))
+		if item["mediaType"] == "podcast":
+			item["media"]["episodes"] = self.episodes[item_id]
+			return item
+		duration = item["media"]["duration"]
+		length = duration / max(self.chapters_per_item, 1)
+		item["media"]["chapters"] = [
+			{"id": index, "start": index * length, "end": (index + 1) * length, "title": "Kapitel {}".format(index + 1)}
+			for index in range(self.chapters_per_item)
+		]
+		item["media"]["audioFiles"] = self.audio_tracks(item_id)
+		item["media"]["tracks"] = self.audio_tracks(item_id)
+		item["libraryFiles"] = [
+			{"ino": track["contentUrl"].rsplit("/", 1)[1], "metadata": {"filename": track["title"], "ext": ".mp3", "path": item["path"] + "/" + track["title"], "size": item["size"]}, "fileType": "audio"}
+			for track in item["media"]["audioFiles"]
+		]
+		return item
+
+	def audio_tracks(self, item_id):
+		item = self.items_by_id[item_id]
+		duration = item["media"]["duration"] / self.tracks_per_item
+		return [
+			{
+				"index": index + 1,
+				"startOffset": index * duration,
+				"duration": duration,
+				"title": "Teil {}.mp3".format(index + 1),
+				"ino": str(2000000 + index),
+				"contentUrl": "/api/items/{}/file/{}".format(item_id, 2000000 + index),
+				"mimeType": "audio/mpeg",
+				"metadata": {"filename": "Teil {}.mp3".format(index + 1), "ext": ".mp3", "size": self.file_size}
+			}
+			for index in range(self.tracks_per_item)
+		]
+
+	def file_bytes(self, item_id, ino):
+		"""Return the content of an audio file, generated once per file"""
+		key = (item_id, ino)
+		if key not in self.files:
+			self.files[key] = random.Random("{}/{}".format(item_id, ino)).randbytes(self.file_size)
+		return self.files[key]
+
+	def query(self, params, library_id=LIBRARY_ID):
+		items = self.podcasts if library_id == PODCAST_LIBRARY_ID else self.items
+		group, _, value = (params.get("filter") or "").partition(".")
+		if group:
+			value = base64.b64decode(value).decode("utf-8")
+			if group == "genres":
+				items = [item for item in items if value in item["media"]["metadata"]["genres"]]
+			elif group == "progress":
+				def state(item):
+					progress = self.progress.get(item["id"])
+					if not progress:
+						return "not-started"
+					return "finished" if progress["isFinished"] else "in-progress"
+				items = [item for item in items if state(item) == value]
+
+		sort = params.get("sort")
+		if sort:
+			def sort_key(item):
+				if sort == "progress":
+					return (self.progress.get(item["id"]) or {}).get("lastUpdate") or 0
+				value = item
+				for part in sort.split("."):
+					value = value.get(part) or ""
+				return value
+			items = sorted(items, key=sort_key, reverse=params.get("desc") == "1")
+
+		limit = int(params.get("limit") or 0)
+		page = int(params.get("page") or 0)
+		results = items[page * limit:(page + 1) * limit] if limit else items
+		if params.get("minified") != "1":
+			results = [self.full_item(item["id"]) for item in results]
+		return {"results": results, "total": len(items), "limit": limit, "page": page}
+
+
+class StubState:
+	def __init__(self, library, latency, jitter, seed=1, stall=60.0, file_rate=0, ping_interval=PING_INTERVAL):
+		self.library = library
+		self.ping_interval = ping_interval
+		self.latency = latency
+		self.jitter = jitter
+		self.file_rate = file_rate
+		self.mode = "ok"
+		self.stall = stall
+		self.rng = random.Random(seed)
+		self.lock = threading.Lock()
+		self.tokens = set()
+		self.refresh_tokens = set()
+		# Packets waiting for the next poll of each socket, by Engine.IO session id
+		self.sockets = {}
+		self.socket_condition = threading.Condition(self.lock)
+		# Playback sessions by id, open or closed
+		self.sessions = {}
+		self.stats = None
+		self.reset_stats()
+
+	def reset_stats(self):
+		with self.lock:
+			self.stats = defaultdict(lambda: {"count": 0, "bytes_in": 0, "bytes_out": 0})
+			self.requests = []
+			self.connections = 0
+
+	def record(self, endpoint, bytes_in, bytes_out, status=200):
+		with self.lock:
+			self.requests.append([endpoint, status])
+			entry = self.stats[endpoint]
+			entry["count"] += 1
+			entry["bytes_in"] += bytes_in
+			entry["bytes_out"] += bytes_out
+
+	def delay(self):
+		with self.lock:
+			delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+		if delay > 0:
+			time.sleep(delay)
+
+	def issue_tokens(self):
+		token = "tok_" + uuid.uuid4().hex
+		refresh_token = "ref_" + uuid.uuid4().hex
+		with self.lock:
+			self.tokens.add(token)
+			self.refresh_tokens.add(refresh_token)
+		return token, refresh_token
+
+	def emit(self, event, data):
+		"""Queue an event for every authenticated socket, returns how many there are"""
+		packet = "42" + json.dumps([event, data])
+		with self.socket_condition:
+			clients = [client for client in self.sockets.values() if client["authenticated"]]
+			for client in clients:
+				client["packets"].append(packet)
+			self.socket_condition.notify_all()
+		return len(clients)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"  # Keep connections alive like the real server
+	disable_nagle_algorithm = True  # Headers and body are written separately
+
+	def log_message(self, format, *args):
+		pass
+
+	def end_headers(self):
+		if self.close_connection:
+			# Announced like a real server does, so clients do not reuse the connection
+			self.send_header("Connection", "close")
+		super().end_headers()
+
+	def setup(self):
+		super().setup()
+		state = self.server.state
+		with state.lock:
+			state.connections += 1
+
+	def do_GET(self):
+		self.handle_request("GET")
+
+	def do_POST(self):
+		self.handle_request("POST")
+
+	def do_PATCH(self):
+		self.handle_request("PATCH")
+
+	def handle_request(self, method):
+		state = self.server.state
+		url = urlparse(self.path)
+		params = {key: values[0] for key, values in parse_qs(url.query).items()}
+		length = int(self.headers.get("Content-Length") or 0)
+		body = self.rfile.read(length) if length else b""
+
+		if url.path == "/__stats":
+			with state.lock:
+				return self.send_json(200, dict(state.stats), record=False)
+		if url.path == "/__requests":
+			with state.lock:
+				return self.send_json(200, list(state.requests), record=False)
+		if url.path == "/__sessions":
+			with state.lock:
+				return self.send_json(200, dict(state.sessions), record=False)
+		if url.path == "/__connections":
+			# Not counting the connection of this request
+			with state.lock:
+				return self.send_json(200, {"connections": state.connections - 1}, record=False)
+		if url.path == "/__reset":
+			state.reset_stats()
+			return self.send_json(200, {}, record=False)
+		if url.path == "/__mode":
+			state.mode = params.get("mode", "ok")
+			return self.send_json(200, {"mode": state.mode}, record=False)
+		if url.path == "/__episodes":
+			library = state.library
+			podcast_id = library.podcasts[0]["id"]
+			with state.lock:
+				if params.get("publish"):
+					library.publish_episodes(podcast_id, int(params["publish"]), int(time.time() * 1000), 1000)
+				if params.get("remove"):
+					library.remove_episodes(podcast_id, int(params["remove"]))
+			return self.send_json(200, {"numEpisodes": len(library.episodes[podcast_id])}, record=False)
+		if url.path == "/__emit":
+			return self.send_json(200, self.emit_event(params), record=False)
+
+		if state.mode == "drop":
+			self.close_connection = True
+			return
+		if state.mode == "stall":
+			time.sleep(state.stall)
+
+		state.delay()
+		self.endpoint = "{} {}".format(method, ID_PATTERN.sub("/{id}", url.path))
+		self.bytes_in = len(self.requestline) + len(str(self.headers)) + len(body)
+		try:
+			if url.path == "/socket.io/":
+				# Engine.IO packets are plain text
+				payload = body.decode("utf-8")
+			else:
+				payload = json.loads(body) if body else None
+		except ValueError:
+			return self.send_json(400, {"error": "Invalid JSON"})
+		self.route(method, url.path, params, payload)
+
+	def authorized(self, params):
+		header = self.headers.get("Authorization") or ""
+		token = header[len("Bearer "):] if header.startswith("Bearer ") else params.get("token")
+		return token in self.server.state.tokens
+
+	def route(self, method, path, params, payload):
+		state = self.server.state
+		library = state.library
+		if path in ("/status", "/ping", "/healthcheck"):
+			return self.send_json(200, {"isInit": True, "success": True})
+		if path == "/socket.io/":
+			return self.handle_socket(method, params, payload)
+		if path == "/login" and method == "POST":
+			token, refresh_token = state.issue_tokens()
+			user = {"id": "usr_bench", "username": payload.get("username"), "token": token}
+			if self.headers.get("x-return-tokens") == "true":
+				user.update({"accessToken": token, "refreshToken": refresh_token})
+			return self.send_json(200, {"user": user})
+		if path == "/auth/refresh" and method == "POST":
+			if self.headers.get("x-refresh-token") not in state.refresh_tokens:
+				return self.send_json(401, {"error": "Unauthorized"})
+			token, refresh_token = state.issue_tokens()
+			return self.send_json(200, {"user": {"id": "usr_bench", "accessToken": token, "refreshToken": refresh_token}})
+
+		if not self.authorized(params):
+			return self.send_json(401, {"error": "Unauthorized"})
+
+		parts = path.strip("/").split("/")
+		if path == "/api/authorize":
+			return self.send_json(200, {"user": {"id": "usr_bench"}})
+		if path == "/api/libraries":
+			libraries = [{"id": LIBRARY_ID, "name": "Hörbücher", "mediaType": "book"}]
+			if library.podcasts:
+				libraries.append({"id": PODCAST_LIBRARY_ID, "name": "Podcasts", "mediaType": "podcast"})
+			return self.send_json(200, {"libraries": libraries})
+		if parts[:2] == ["api", "libraries"] and len(parts) >= 3:
+			if len(parts) == 3:
+				data = {"id": parts[2], "name": "Hörbücher"}
+				if params.get("include") == "filterdata":
+					data["filterdata"] = {"genres": GENRES}
+				return self.send_json(200, data)
+			if parts[3] == "items":
+				return self.send_json(200, library.query(params, parts[2]))
+			if parts[3] == "recent-episodes":
+				return self.send_json(200, library.get_recent_episodes(params))
+			if parts[3] == "personalized":
+				in_progress = [library.items_by_id[item_id] for item_id in library.progress][:int(params.get("limit") or 10)]
+				return self.send_json(200, [{"id": "continue-listening", "entities": in_progress}])
+		if parts[:2] == ["api", "items"] and len(parts) >= 3 and parts[2] in library.items_by_id:
+			item_id = parts[2]
+			if len(parts) == 3:
+				return self.send_json(200, library.full_item(item_id))
+			if parts[3] == "cover":
+				return self.send_bytes(200, COVER_BYTES, "image/jpeg")
+			if parts[3] == "file" and len(parts) == 5:
+				return self.send_file(library.file_bytes(item_id, parts[4]))
+			if parts[3] == "play" and method == "POST":
+				item = library.items_by_id[item_id]
+				if len(parts) == 5:
+					episode = next(episode for episode in library.episodes[item_id] if episode["id"] == parts[4])
+					progress = library.episode_progress.get((item_id, parts[4])) or {}
+					session = {
+						"id": "play_" + uuid.uuid4().hex[:16],
+						"libraryItemId": item_id,
+						"episodeId": parts[4],
+						"duration": episode["duration"],
+						"currentTime": progress.get("currentTime", 0),
+						"audioTracks": [episode["audioTrack"]]
+					}
+				else:
+					progress = library.progress.get(item_id) or {}
+					session = {
+						"id": "play_" + uuid.uuid4().hex[:16],
+						"libraryItemId": item_id,
+						"duration": item["media"]["duration"],
+						"currentTime": progress.get("currentTime", 0),
+						"audioTracks": library.audio_tracks(item_id)
+					}
+				with state.lock:
+					state.sessions[session["id"]] = {"libraryItemId": item_id, "episodeId": session.get("episodeId"),
+						"currentTime": session["currentTime"], "timeListened": 0.0, "syncs": 0, "closed": False}
+				return self.send_json(200, session)
+		if parts[:2] == ["api", "session"] and len(parts) == 4 and method == "POST":
+			return self.update_session(parts[2], parts[3], payload)
+		if path == "/api/me":
+			progress = list(library.progress.values()) + list(library.episode_progress.values())
+			return self.send_json(200, {"id": "usr_bench", "mediaProgress": progress})
+		if path == "/api/me/progress/batch/update" and method == "PATCH":
+			return self.send_json(200, {})
+		if parts[:3] == ["api", "me", "progress"] and len(parts) == 5:
+			key = (parts[3], parts[4])
+			progress = library.episode_progress.get(key)
+			if method == "PATCH":
+				progress = dict(progress or {"libraryItemId": parts[3], "episodeId": parts[4]}, **(payload or {}))
+				library.episode_progress[key] = progress
+			if progress is None:
+				return self.send_json(404, {"error": "Not found"})
+			return self.send_json(200, progress)
+		if parts[:3] == ["api", "me", "progress"] and len(parts) >= 4:
+			progress = library.progress.get(parts[3])
+			if method == "PATCH":
+				progress = dict(progress or {"libraryItemId": parts[3]}, **(payload or {}))
+				library.progress[parts[3]] = progress
+			if progress is None:
+				return self.send_json(404, {"error": "Not found"})
+			return self.send_json(200, progress)
+		return self.send_json(404, {"error": "Not found"})
+
+	def update_session(self, session_id, action, payload):
+		state = self.server.state
+		if state.mode == "session_error":
+			return self.send_json(503, {"error": "Service unavailable"})
+		with state.lock:
+			session = state.sessions.get(session_id)
+			if session is None or session["closed"] or action not in ("sync", "close"):
+				return self.send_json(404, {"error": "Session not found"})
+			if payload:
+				session["syncs"] += 1
+				session["timeListened"] += payload.get("timeListened") or 0
+				session["currentTime"] = payload["currentTime"]
+				# The server keeps the progress of the user up to date from the session
+				key = (session["libraryItemId"], session["episodeId"])
+				if session["episodeId"]:
+					state.library.episode_progress[key] = dict(state.library.episode_progress.get(key) or {},
+						libraryItemId=key[0], episodeId=key[1], currentTime=payload["currentTime"], lastUpdate=int(time.time() * 1000))
+				else:
+					state.library.set_progress(key[0], payload["currentTime"])
+			session["closed"] = action == "close"
+		return self.send_json(200, {})
+
+	def emit_event(self, params):
+		"""Change the library like another client of the server does and push the event for it"""
+		state = self.server.state
+		library = state.library
+		event = params["event"]
+		with state.lock:
+			if event == "item_added":
+				index = max(int(item["id"][3:]) for item in library.items) + 1
+				now = int(time.time() * 1000)
+				item = library.add_item(index, now)
+				# A book added just now was last updated just now
+				item["addedAt"] = item["updatedAt"] = now
+				data = library.full_item(item["id"])
+				# Where a new item appears in the default listing is up to the server, not at the end here
+				library.items.insert(0, library.items.pop())
+			elif event == "item_updated":
+				data = library.full_item(library.update_item(params["id"], params.get("title") or "Neuer Titel")["id"])
+			elif event == "item_removed":
+				item = library.remove_item(params["id"])
+				data = {"id": item["id"], "libraryId": item["libraryId"]}
+			elif event == "user_item_progress_updated":
+				progress = library.set_progress(params["id"], float(params["currentTime"]))
+				data = {"id": progress["id"], "sessionId": None, "deviceDescription": "Smartphone", "data": progress}
+			else:
+				data = json.loads(params.get("data") or "null")
+		return {"sockets": state.emit(event, data), "data": data}
+
+	def handle_socket(self, method, params, payload):
+		"""Minimal socket.io server on the Engine.IO v4 polling transport, as the real server offers it"""
+		state = self.server.state
+		sid = params.get("sid")
+		if sid is None:
+			sid = uuid.uuid4().hex
+			now = time.monotonic()
+			with state.lock:
+				# Sockets of clients that went away without closing them
+				for stale in [key for key, client in state.sockets.items() if now - client["seen"] > state.ping_interval + PING_TIMEOUT]:
+					del state.sockets[stale]
+				state.sockets[sid] = {"packets": [], "authenticated": False, "seen": now}
+			handshake = {"sid": sid, "upgrades": [], "pingInterval": int(state.ping_interval * 1000), "pingTimeout": int(PING_TIMEOUT * 1000),
+				"maxPayload": 1000000}
+			return self.send_bytes(200, ("0" + json.dumps(handshake)).encode("utf-8"), "text/plain; charset=UTF-8")
+		with state.socket_condition:
+			client = state.sockets.get(sid)
+			if client is None:
+				packets = None
+			elif method == "GET":
+				client["seen"] = time.monotonic()
+				# Held open until there is something to send, at most until the next ping
+				if not state.socket_condition.wait_for(lambda: client["packets"] or sid not in state.sockets, state.ping_interval):
+					client["packets"].append("2")
+				packets, client["packets"] = client["packets"] or ["1"], []
+			else:
+				for packet in payload.split(RECORD_SEPARATOR):
+					if packet == "40":
+						client["packets"].append("40" + json.dumps({"sid": uuid.uuid4().hex}))
+					elif packet.startswith("42"):
+						event, *args = json.loads(packet[2:])
+						if event == "auth":
+							client["authenticated"] = bool(args) and args[0] in state.tokens
+							client["packets"].append("42" + json.dumps(["init", {"userId": "usr_bench"}] if client["authenticated"] else ["auth_failed"]))
+					elif packet == "1":
+						del state.sockets[sid]
+				state.socket_condition.notify_all()
+				packets = ["ok"]
+		if packets is None:
+			return self.send_json(400, {"code": 1, "message": "Session ID unknown"})
+		return self.send_bytes(200, RECORD_SEPARATOR.join(packets).encode("utf-8"), "text/plain; charset=UTF-8")
+
+	def send_file(self, data):
+		"""Send an audio file or the requested range of it, like the static file handler of the server"""
+		state = self.server.state
+		start, end, status = 0, len(data), 200
+		match = RANGE_PATTERN.match(self.headers.get("Range") or "")
+		if_range = self.headers.get("If-Range")
+		if match and (if_range is None or if_range == FILE_MTIME):
+			start = int(match.group(1))
+			end = min(int(match.group(2)) + 1, len(data)) if match.group(2) else len(data)
+			if start >= len(data) or start >= end:
+				return self.send_json(416, {"error": "Range not satisfiable"})
+			status = 206
+		self.send_response(status)
+		self.send_header("Content-Type", "audio/mpeg")
+		self.send_header("Accept-Ranges", "bytes")
+		self.send_header("Last-Modified", FILE_MTIME)
+		if status == 206:
+			self.send_header("Content-Range", "bytes {}-{}/{}".format(start, end - 1, len(data)))
+		self.send_header("Content-Length", str(end - start))
+		self.end_headers()
+
+		# In flaky mode half of the transfers break off somewhere in the middle
+		cut = end
+		if state.mode == "flaky":
+			with state.lock:
+				if state.rng.random() < 0.5:
+					cut = start + int((end - start) * state.rng.random())
+		sent = start
+		block = 64 * 1024
+		started = time.perf_counter()
+		while sent < cut:
+			chunk = data[sent:min(sent + block, cut)]
+			self.wfile.write(chunk)
+			sent += len(chunk)
+			if state.file_rate:
+				# Throttle each connection, as a slow link or a busy server does
+				ahead = (sent - start) / state.file_rate - (time.perf_counter() - started)
+				if ahead > 0:
+					time.sleep(ahead)
+		state.record(self.endpoint, self.bytes_in, sent - start, status)
+		if cut < end:
+			self.close_connection = True
+			self.connection.shutdown(socket.SHUT_RDWR)
+
+	def send_json(self, status, data, record=True):
+		self.send_bytes(status, json.dumps(data).encode("utf-8"), "application/json", record)
+
+	def send_bytes(self, status, body, content_type, record=True):
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		if len(body) > 1024 and content_type == "application/json" and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+			# Like the compression middleware of the real server, at a level that keeps the stub fast
+			body = gzip.compress(body, compresslevel=1)
+			self.send_header("Content-Encoding", "gzip")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		if record:
+			self.server.state.record(self.endpoint, self.bytes_in, len(body), status)
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def handle_error(self, request, client_address):
+		# Clients hang up on stalled requests when they time out
+		pass
+
+
+def create_server(items=1000, chapters=20, tracks=1, latency=0.0, jitter=0.0, port=0, seed=1, stall=60.0, file_size=FILE_SIZE, file_rate=0,
+		podcasts=0, episodes=0, ping_interval=PING_INTERVAL):
+	server = StubHTTPServer(("127.0.0.1", port), StubHandler)
+	library = SyntheticLibrary(items, chapters, tracks, seed, file_size, podcasts, episodes)
+	server.state = StubState(library, latency, jitter, seed, stall, file_rate, ping_interval)
+	return server
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--items", type=int, default=1000)
+	parser.add_argument("--chapters", type=int, default=20)
+	parser.add_argument("--tracks", type=int, default=1, help="audio files per book")
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+	parser.add_argument("--jitter", type=float, default=0.0, help="random +/- seconds added to the latency")
+	parser.add_argument("--stall", type=float, default=60.0, help="seconds a request hangs in stall mode")
+	parser.add_argument("--file-size", type=int, default=FILE_SIZE, help="bytes per audio file")
+	parser.add_argument("--file-rate", type=int, default=0, help="bytes per second per connection for audio files, 0 for unlimited")
+	parser.add_argument("--podcasts", type=int, default=0, help="podcasts in a second library")
+	parser.add_argument("--episodes", type=int, default=0, help="episodes per podcast")
+	parser.add_argument("--ping-interval", type=float, default=PING_INTERVAL, help="seconds a socket poll is held open without events")
+	parser.add_argument("--port", type=int, default=0)
+	parser.add_argument("--seed", type=int, default=1)
+	args = parser.parse_args()
+
+	server = create_server(args.items, args.chapters, args.tracks, args.latency, args.jitter, args.port, args.seed, args.stall,
+		args.file_size, args.file_rate, args.podcasts, args.episodes, args.ping_interval)
+	# The harness reads the port from the first line
+	print(server.server_address[1], flush=True)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,65 @@
+from bisect import bisect_right
+
+
+class ChapterIndex:
+	"""Sorted start-time index over the chapters of a book.
+
+	A time belongs to the chapter that started last at or before it, so a time
+	exactly on the boundary of two chapters (or inside an overlap) resolves to
+	the later chapter and a time inside a gap to the chapter before the gap.
+	The current chapter is cached until the time leaves its interval.
+	"""
+
+	def __init__(self, chapters):
+		self.chapters = sorted(chapters or [], key=lambda chapter: chapter['start'])
+		self.starts = [chapter['start'] for chapter in self.chapters]
+		self.cached_position = None
+		self.cached_interval = (0.0, 0.0)
+
+	def __len__(self):
+		return len(self.chapters)
+
+	def _in_cached_interval(self, time):
+		if self.cached_position is None:
+			return False
+		low, high = self.cached_interval
+		if self.cached_position == len(self.chapters) - 1:
+			# The last chapter ends with its end time (inclusive)
+			return low <= time <= high
+		return low <= time < high
+
+	def position_at(self, time):
+		"""Return the index of the chapter playing at time, or None outside of all chapters"""
+		if self._in_cached_interval(time):
+			return self.cached_position
+
+		position = bisect_right(self.starts, time) - 1
+		if position < 0:
+			return None
+
+		if position < len(self.chapters) - 1:
+			high = self.starts[position + 1]
+		else:
+			high = self.chapters[position]['end']
+			if time > high:
+				return None
+
+		self.cached_position = position
+		self.cached_interval = (self.starts[position], high)
+		return position
+
+	def chapter_at(self, time):
+		position = self.position_at(time)
+		return self.chapters[position] if position is not None else None
+
+	def next_chapter(self, time):
+		position = self.position_at(time)
+		if position is not None and position < len(self.chapters) - 1:
+			return self.chapters[position + 1]
+		return None
+
+	def previous_chapter(self, time):
+		position = self.position_at(time)
+		if position is not None and position > 0:
+			return self.chapters[position - 1]
+		return None
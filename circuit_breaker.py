@@ -0,0 +1,92 @@
+import threading
+import time
+import requests
+import xbmc
+
+FAILURE_THRESHOLD = 3  # Consecutive failures before the circuit opens
+PROBE_INTERVAL = 2.0  # seconds, doubled after every failed probe
+MAX_PROBE_INTERVAL = 30.0
+PROBE_TIMEOUT = (2.0, 2.0)  # connect, read
+
+
+class CircuitOpenError(requests.ConnectionError):
+	"""Raised instead of sending a request while the server is considered down"""
+
+
+class CircuitBreaker:
+	"""Stops sending requests to a server after repeated connection failures.
+
+	While the circuit is open every request fails immediately, so callers fall
+	back to cached data instead of waiting for timeouts. A background thread
+	pings the server and closes the circuit once it answers again.
+	"""
+
+	def __init__(self, failure_threshold=FAILURE_THRESHOLD, probe_interval=PROBE_INTERVAL):
+		self.failure_threshold = failure_threshold
+		self.probe_interval = probe_interval
+		self.lock = threading.Lock()
+		self.failures = 0
+		self.open_since = None
+		self.server_url = None
+		self.probe_thread = None
+		self.stop_event = threading.Event()
+		self.close_listeners = []
+
+	def is_open(self):
+		return self.open_since is not None
+
+	def add_close_listener(self, callback):
+		"""Call callback() whenever the server becomes reachable again"""
+		self.close_listeners.append(callback)
+
+	def before_request(self, url):
+		if self.open_since is not None:
+			raise CircuitOpenError("Server unavailable since {:.0f}s, not sending request to {}".format(time.monotonic() - self.open_since, url))
+
+	def record_success(self):
+		if self.failures:
+			with self.lock:
+				self.failures = 0
+
+	def record_failure(self, url):
+		with self.lock:
+			self.failures += 1
+			if self.open_since is not None or self.failures < self.failure_threshold:
+				return
+			self.open_since = time.monotonic()
+			# Probe the server the failing request went to, e.g. http://host:port
+			self.server_url = "/".join(url.split("/", 3)[:3])
+			self.stop_event = threading.Event()
+			self.probe_thread = threading.Thread(target=self._probe, args=(self.stop_event,))
+			self.probe_thread.daemon = True
+			self.probe_thread.start()
+		xbmc.log("Server unavailable after {} failed requests, failing fast until it answers again".format(self.failures), xbmc.LOGWARNING)
+
+	def close(self):
+		with self.lock:
+			if self.open_since is None:
+				return
+			downtime = time.monotonic() - self.open_since
+			self.open_since = None
+			self.failures = 0
+		xbmc.log("Server reachable again after {:.1f}s".format(downtime), xbmc.LOGINFO)
+		for callback in self.close_listeners:
+			try:
+				callback()
+			except Exception as e:
+				xbmc.log("Circuit close listener failed: {}".format(str(e)), xbmc.LOGERROR)
+
+	def stop(self):
+		self.stop_event.set()
+
+	def _probe(self, stop_event):
+		interval = self.probe_interval
+		while not stop_event.wait(interval):
+			try:
+				# A plain request, the shared session would refuse it while the circuit is open
+				requests.get(self.server_url + "/ping", timeout=PROBE_TIMEOUT).raise_for_status()
+			except requests.RequestException:
+				interval = min(interval * 2, MAX_PROBE_INTERVAL)
+				continue
+			self.close()
+			return
@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import xbmc
+
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 4
+
+
+class CoverCache:
+	"""Size-capped LRU directory of server-resized cover images.
+
+	Covers are keyed by item id and the item's updatedAt, so a changed cover
+	gets a new file while the URL token never ends up in Kodi's texture cache.
+	"""
+
+	def __init__(self, cache_dir, library_service, width, height, max_bytes=DEFAULT_MAX_BYTES, max_workers=DEFAULT_MAX_WORKERS):
+		self.cache_dir = cache_dir
+		self.library_service = library_service
+		self.width = width
+		self.height = height
+		self.max_bytes = max_bytes
+		self.lock = threading.Lock()
+		self.pending = {}
+		self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+		if not os.path.isdir(cache_dir):
+			os.makedirs(cache_dir)
+
+		# File name -> size, least recently used first
+		self.entries = OrderedDict()
+		self.total_bytes = 0
+		files = [entry for entry in os.scandir(cache_dir) if entry.is_file() and entry.name.endswith(".jpg")]
+		for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+			size = entry.stat().st_size
+			self.entries[entry.name] = size
+			self.total_bytes += size
+
+	def _file_name(self, item_id, updated_at):
+		return "{}_{}.jpg".format(item_id, updated_at or 0)
+
+	def get_cached(self, item_id, updated_at):
+		"""Return the local path of a cached cover, or None when it is not cached yet"""
+		name = self._file_name(item_id, updated_at)
+		path = os.path.join(self.cache_dir, name)
+		with self.lock:
+			if name not in self.entries:
+				return None
+			self.entries.move_to_end(name)
+		try:
+			os.utime(path)
+		except OSError:
+			pass
+		return path
+
+	def get_paths(self, keys):
+		"""Return local cover paths for (item_id, updated_at) keys without waiting, None for covers not cached yet.
+
+		Missing covers are downloaded in parallel, see notify_when_ready.
+		"""
+		paths = []
+		for item_id, updated_at in keys:
+			path = self.get_cached(item_id, updated_at)
+			if path is None:
+				self._submit(item_id, updated_at)
+			paths.append(path)
+		return paths
+
+	def notify_when_ready(self, keys, on_ready):
+		"""Call on_ready(key, path) for each cover once it is written, from the download worker or right away"""
+		for item_id, updated_at in keys:
+			key = (item_id, updated_at)
+			with self.lock:
+				future = self.pending.get(self._file_name(item_id, updated_at))
+			if future is not None:
+				future.add_done_callback(lambda future, key=key: self._notify(on_ready, key, future))
+				continue
+			# Downloaded meanwhile, or failed
+			path = self.get_cached(item_id, updated_at)
+			if path is not None:
+				on_ready(key, path)
+
+	def _notify(self, on_ready, key, future):
+		try:
+			path = future.result()
+		except Exception as e:
+			xbmc.log("Failed to download cover: {}".format(str(e)), xbmc.LOGWARNING)
+			return
+		try:
+			on_ready(key, path)
+		except Exception as e:
+			xbmc.log("Cover listener failed: {}".format(str(e)), xbmc.LOGERROR)
+
+	def prefetch(self, load_keys):
+		"""Download the covers for the keys returned by load_keys on the background pool"""
+		def run():
+			for item_id, updated_at in load_keys():
+				self._submit(item_id, updated_at)
+		self.executor.submit(run)
+
+	def _submit(self, item_id, updated_at):
+		name = self._file_name(item_id, updated_at)
+		with self.lock:
+			future = self.pending.get(name)
+			if future is None:
+				future = self.executor.submit(self._download, item_id, updated_at, name)
+				self.pending[name] = future
+		return future
+
+	def _download(self, item_id, updated_at, name):
+		try:
+			path = self.get_cached(item_id, updated_at)
+			if path:
+				return path
+
+			data = self.library_service.download_cover(item_id, self.width, self.height)
+			path = os.path.join(self.cache_dir, name)
+			tmp_path = path + ".tmp"
+			with open(tmp_path, "wb") as f:
+				f.write(data)
+			os.replace(tmp_path, path)
+
+			with self.lock:
+				self.entries[name] = len(data)
+				self.total_bytes += len(data)
+			self._evict()
+			return path
+		finally:
+			with self.lock:
+				self.pending.pop(name, None)
+
+	def invalidate(self, item_id, keep_updated_at=None):
+		"""Delete the cached covers of an item, except the one for keep_updated_at"""
+		prefix = "{}_".format(item_id)
+		keep = self._file_name(item_id, keep_updated_at) if keep_updated_at is not None else None
+		with self.lock:
+			names = [name for name in self.entries if name.startswith(prefix) and name != keep]
+			for name in names:
+				self.total_bytes -= self.entries.pop(name)
+		for name in names:
+			try:
+				os.remove(os.path.join(self.cache_dir, name))
+			except OSError:
+				pass
+		return len(names)
+
+	def _evict(self):
+		"""Remove least recently used covers until the cache fits into max_bytes"""
+		while True:
+			with self.lock:
+				if self.total_bytes <= self.max_bytes or len(self.entries) <= 1:
+					return
+				name, size = self.entries.popitem(last=False)
+				self.total_bytes -= size
+			try:
+				os.remove(os.path.join(self.cache_dir, name))
+			except OSError:
+				pass
+
+	def shutdown(self):
+		self.executor.shutdown(wait=False)
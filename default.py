@@ -1,15 +1,28 @@
 import os
+import threading
+import requests
 import xbmc
 import xbmcgui
 import xbmcaddon
+import xbmcvfs
 from login_service import AudioBookShelfService
 from library_service import AudioBookShelfLibraryService
-#from media_item import Audiobook
+from library_pager import LibraryPager
+from cover_cache import CoverCache
+from download_manager import DownloadManager, DownloadInUse
+from focus_prefetch import FocusPrefetcher
+from progress_sync import ProgressSyncWriter
+from realtime_listener import RealtimeListener
+from search_index import SearchIndex
+from media_item import Audiobook, PodcastEpisode
+from token_store import TokenStore
+from startup_timeline import StartupTimeline
+from request_stats import RequestStats
+import profiler
+from http_session import get_session, configure_session
+from concurrent.futures import ThreadPoolExecutor
 from audio_book import AudioBookPlayer
 
-MAX_COLUMNS = 3
-MAX_ROWS = 2
-MAX_PER_PAGE = MAX_COLUMNS * MAX_ROWS
 COVER_WIDTH = 200
 COVER_HEIGHT = 200
 HORIZONTAL_PADDING = 50
@@ -17,8 +30,42 @@ VERTICAL_PADDING = 50
 
 ADDON = xbmcaddon.Addon()
 
+
+def get_int_setting(setting_id, default, minimum, maximum):
+	try:
+		value = int(ADDON.getSetting(setting_id))
+	except ValueError:
+		return default
+	return max(minimum, min(maximum, value))
+
+
+# The grid has to fit between the top of the screen and the page buttons
+MAX_COLUMNS = get_int_setting('columns', 3, 1, 7)
+MAX_ROWS = get_int_setting('rows', 2, 1, 3)
+MAX_PER_PAGE = MAX_COLUMNS * MAX_ROWS
+# Parallel range requests per download, on a connection pool of their own
+DOWNLOAD_CONNECTIONS = get_int_setting('download_connections', 4, 1, 6)
+DOWNLOAD_QUOTA_BYTES = get_int_setting('download_quota', 2, 1, 100) * 1024 * 1024 * 1024
+POOL_SIZE = get_int_setting('pool_size', 10, 2, 20)
+KEEP_ALIVE = ADDON.getSetting('keep_alive') != 'false'
+
 CWD = ADDON.getAddonInfo('path')
+PROFILE_DIR = xbmcvfs.translatePath(ADDON.getAddonInfo('profile'))
 ERROR_MSG = "Fehler"
+CONTINUE_LISTENING_LIMIT = 24
+
+# Sort orders and filters are applied by the server
+SORT_OPTIONS = [
+	("Zuletzt hinzugefügt", {"sort": "addedAt", "desc": 1}),
+	("Titel", {"sort": "media.metadata.title", "desc": 0}),
+	("Autor", {"sort": "media.metadata.authorName", "desc": 0}),
+	("Zuletzt gehört", {"sort": "progress", "desc": 1}),
+]
+PROGRESS_FILTERS = [
+	("In Bearbeitung", "in-progress"),
+	("Beendet", "finished"),
+	("Nicht begonnen", "not-started"),
+]
 
 
 class SettingsDialog(xbmcgui.Dialog):
@@ -42,84 +89,136 @@ class SettingsDialog(xbmcgui.Dialog):
 class GUI(xbmcgui.WindowXML):
 	def __init__(self, *args, **kwargs):
 		self.audiobooks = kwargs.get("optional1", [])
+		self.cover_cache = kwargs.get("cover_cache")
+		self.download_manager = kwargs.get("download_manager")
+		self.prefetcher = kwargs.get("prefetcher")
+		self.search_index = kwargs.get("search_index")
+		self.library_id = kwargs.get("library_id")
+		self.library_query = {}
+		self.genres = None
+		# While search results or a shelf are shown, the library and its page are kept here
+		self.library_audiobooks = None
+		self.library_page = 0
+		self.library_service = AudioBookShelfLibraryService()
 		self.page = 0
+		# Grid controls are created once and reused for every page
+		self.cover_controls = []
 		self.button_controls = []
 		self.play_controls = []
+		self.slot_by_control_id = {}
+		self.slot_visible = []
+		self.slot_textures = []
+		self.audiobooks_to_display = []
+		# Covers downloaded in the background are swapped in from the cover cache's workers
+		self.texture_lock = threading.Lock()
+		self.wired_count = None
 		self.prev_button = None
 		self.next_button = None
-		self.last_row = False
 		self.selected_index = None
 
 	def onInit(self):
-		self.set_background()
+		if not self.button_controls:
+			self.set_background()
+			self.create_grid()
 		self.display_audiobooks()
 
-	def clear_audiobooks(self):
-		for button in self.button_controls:
-			self.removeControl(button)
-		for play_control in self.play_controls:
-			self.removeControl(play_control)
-
-		# Entfernen der prev und next Buttons, wenn sie existieren
-		if hasattr(self, 'prev_button') and self.prev_button:
-			self.removeControl(self.prev_button)
-			self.prev_button = None
-
-		if hasattr(self, 'next_button') and self.next_button:
-			self.removeControl(self.next_button)
-			self.next_button = None
-
-		# Listen leeren
-		self.button_controls = []
-		self.play_controls = []
-
 	def set_background(self):
 		bg_path = os.path.join(CWD, 'resources', 'skins', 'default', 'media', 'background.png')
 		background_control = xbmcgui.ControlImage(0, 0, 1920, 1080, bg_path)
 		self.addControl(background_control)
 
+	@profiler.traced()
 	def display_audiobooks(self):
-		self.clear_audiobooks()
-		self.audiobooks_to_display = self.audiobooks[self.page * MAX_PER_PAGE: (self.page + 1) * MAX_PER_PAGE]
+		"""Show the current page by swapping textures and visibility of the existing grid controls"""
+		audiobooks = self.audiobooks[self.page * MAX_PER_PAGE: (self.page + 1) * MAX_PER_PAGE]
+		count = len(audiobooks)
+		# Shown at once, covers still downloading appear by URL and are swapped for the file when it is written
+		cover_keys = [(audiobook.id, audiobook.updated_at) for audiobook in audiobooks]
+		cover_paths = self.cover_cache.get_paths(cover_keys) if self.cover_cache else [None] * count
+		cover_textures = [path or self.get_cover_url(audiobook) for path, audiobook in zip(cover_paths, audiobooks)]
+
+		with self.texture_lock:
+			self.audiobooks_to_display = audiobooks
+			for slot in range(count):
+				self.set_cover_texture(slot, cover_textures[slot])
+		for slot in range(MAX_PER_PAGE):
+			visible = slot < count
+			if self.slot_visible[slot] != visible:
+				self.cover_controls[slot].setVisible(visible)
+				self.button_controls[slot].setVisible(visible)
+				self.slot_visible[slot] = visible
+
+		if self.cover_cache:
+			self.cover_cache.notify_when_ready([key for key, path in zip(cover_keys, cover_paths) if path is None], self.on_cover_ready)
+
+		# Only a partially filled page needs different navigation
+		if count != self.wired_count:
+			self.set_audiobook_navigation(count)
+
+		if count:
+			self.setFocus(self.button_controls[0])
+			self.show_play_overlay(0)
+		else:
+			self.show_play_overlay(None)
+
+		self.prefetch_neighbour_covers()
+
+	def set_cover_texture(self, slot, texture):
+		"""Set the texture of a slot, with texture_lock held"""
+		if self.slot_textures[slot] != texture:
+			self.cover_controls[slot].setImage(texture, False)
+			self.slot_textures[slot] = texture
+
+	def on_cover_ready(self, key, path):
+		"""Show a downloaded cover instead of its URL if the book is still on the page"""
+		with self.texture_lock:
+			for slot, audiobook in enumerate(self.audiobooks_to_display):
+				if (audiobook.id, audiobook.updated_at) == key:
+					self.set_cover_texture(slot, path)
+
+	def get_cover_url(self, audiobook):
+		return audiobook.cover_url(self.library_service.base_url, self.library_service.token)
+
+	def prefetch_neighbour_covers(self):
+		"""Warm the cover cache for the next and previous page in the background"""
+		if not self.cover_cache:
+			return
+
+		audiobooks = self.audiobooks
+		page = self.page
+
+		def load_keys():
+			neighbours = list(audiobooks[(page + 1) * MAX_PER_PAGE: (page + 2) * MAX_PER_PAGE])
+			if page > 0:
+				neighbours += audiobooks[(page - 1) * MAX_PER_PAGE: page * MAX_PER_PAGE]
+			return [(audiobook.id, audiobook.updated_at) for audiobook in neighbours]
+
+		self.cover_cache.prefetch(load_keys)
+
+	def create_grid(self):
+		media_dir = os.path.join(CWD, 'resources', 'skins', 'default', 'media')
+		play_path = os.path.join(media_dir, 'play.png')
+		transparent_path = os.path.join(media_dir, 'transparent.png')
+
 		total_width_for_books = MAX_COLUMNS * COVER_WIDTH + (MAX_COLUMNS - 1) * HORIZONTAL_PADDING
 		start_x = (1920 - total_width_for_books) // 2
-
 		total_height_for_books = MAX_ROWS * COVER_HEIGHT + (MAX_ROWS - 1) * VERTICAL_PADDING
 		start_y = (1080 - total_height_for_books) // 2
 
-		self.create_audiobook_buttons(start_x, start_y)
-		self.set_audiobook_navigation()
-		
-		if self.button_controls:
-			self.setFocus(self.button_controls[0])
-
-	def create_audiobook_buttons(self, start_x, start_y):
-		addon_dir = xbmcaddon.Addon().getAddonInfo('path')
-		play_path = os.path.join(addon_dir, 'resources', 'skins', 'default', 'media', 'play.png')
-
+		# Button textures cannot be changed later, so each cover is an image
+		# below a transparent button that takes the focus
 		for row in range(MAX_ROWS):
 			for column in range(MAX_COLUMNS):
-				index = row * MAX_COLUMNS + column
-				#xbmc.log("Roger, addon here..index: " + str(index), xbmc.LOGINFO)
-				if index >= len(self.audiobooks_to_display):
-					break
-
-				audiobook = self.audiobooks_to_display[index]
 				x_pos = start_x + (COVER_WIDTH + HORIZONTAL_PADDING) * column
 				y_pos = start_y + (COVER_HEIGHT + VERTICAL_PADDING) * row
 
-				button_control = xbmcgui.ControlButton(
+				self.cover_controls.append(xbmcgui.ControlImage(x_pos, y_pos, COVER_WIDTH, COVER_HEIGHT, ""))
+				self.play_controls.append(xbmcgui.ControlImage(x_pos, y_pos, COVER_WIDTH, COVER_HEIGHT, play_path))
+				self.button_controls.append(xbmcgui.ControlButton(
 					x_pos, y_pos, COVER_WIDTH, COVER_HEIGHT, "",
-					focusTexture=audiobook['cover_url'],
-					noFocusTexture=audiobook['cover_url']
-				)
-				self.addControl(button_control)
-				self.button_controls.append(button_control)
-
-				play_control = xbmcgui.ControlImage(x_pos, y_pos, COVER_WIDTH, COVER_HEIGHT, play_path)
-				self.addControl(play_control)
-				self.play_controls.append(play_control)
-				play_control.setVisible(False)
+					focusTexture=transparent_path,
+					noFocusTexture=transparent_path
+				))
 
 		button_width = 50
 		button_height = 50
@@ -131,72 +230,74 @@ class GUI(xbmcgui.WindowXML):
 		next_button_x = prev_button_x + button_width + 150
 		next_button_y = prev_button_y
 
-		prev_button_image = os.path.join(addon_dir, 'resources', 'skins', 'default', 'media', 'prev.png')
-		next_button_image = os.path.join(addon_dir, 'resources', 'skins', 'default', 'media', 'next.png')
-		prev_button_image_focus = os.path.join(addon_dir, 'resources', 'skins', 'default', 'media', 'prevb.png')
-		next_button_image_focus = os.path.join(addon_dir, 'resources', 'skins', 'default', 'media', 'nextb.png')
-
 		self.prev_button = xbmcgui.ControlButton(
 			prev_button_x, prev_button_y, button_width, button_height, "",
-			focusTexture=prev_button_image_focus,
-			noFocusTexture=prev_button_image
+			focusTexture=os.path.join(media_dir, 'prevb.png'),
+			noFocusTexture=os.path.join(media_dir, 'prev.png')
 		)
-		self.addControl(self.prev_button)
-
 		self.next_button = xbmcgui.ControlButton(
 			next_button_x, next_button_y, button_width, button_height, "",
-			focusTexture=next_button_image_focus,
-			noFocusTexture=next_button_image
+			focusTexture=os.path.join(media_dir, 'nextb.png'),
+			noFocusTexture=os.path.join(media_dir, 'next.png')
 		)
-		self.addControl(self.next_button)
-
-	def set_audiobook_navigation(self):
-		for row in range(MAX_ROWS):
-			for column in range(MAX_COLUMNS):
-				index = row * MAX_COLUMNS + column
-				if index >= len(self.button_controls):
-					break
-
-				button = self.button_controls[index]
-				above = self.button_controls[index - MAX_COLUMNS] if index - MAX_COLUMNS >= 0 else button
-
-				below = self.button_controls[index + MAX_COLUMNS] if (index + MAX_COLUMNS) < len(self.button_controls) else button
-				rows_on_current_page = -(-len(self.audiobooks_to_display) // MAX_COLUMNS)  # Ceiling Division
-				if row == rows_on_current_page - 1:  # Wenn es die letzte Zeile auf der aktuellen Seite ist
-					below = self.next_button
 
-				if column == 0:
-					left = button
-				else:
-					left = self.button_controls[index - 1]
+		self.addControls(self.cover_controls + self.play_controls + self.button_controls + [self.prev_button, self.next_button])
+		for play_control in self.play_controls:
+			play_control.setVisible(False)
+
+		self.slot_by_control_id = {button.getId(): slot for slot, button in enumerate(self.button_controls)}
+		self.slot_visible = [True] * MAX_PER_PAGE
+		self.slot_textures = [""] * MAX_PER_PAGE
+
+	def set_audiobook_navigation(self, count):
+		"""Wire up navigation between the first count slots and the page buttons"""
+		rows_on_current_page = -(-count // MAX_COLUMNS)  # Ceiling Division
+		for index in range(count):
+			row, column = divmod(index, MAX_COLUMNS)
+			button = self.button_controls[index]
+			above = self.button_controls[index - MAX_COLUMNS] if row > 0 else button
+			if row == rows_on_current_page - 1:  # Wenn es die letzte Zeile auf der aktuellen Seite ist
+				below = self.next_button
+			else:
+				below = self.button_controls[min(index + MAX_COLUMNS, count - 1)]
 
-				# Navigation rechts
-				if column == MAX_COLUMNS - 1:
-					right = button
-				else:
-					right = self.button_controls[index + 1]
+			left = self.button_controls[index - 1] if column > 0 else button
+			# Navigation rechts
+			right = self.button_controls[index + 1] if column < MAX_COLUMNS - 1 and index + 1 < count else button
 
-				button.setNavigation(above, below, left, right)
+			button.setNavigation(above, below, left, right)
 
-		self.prev_button.setNavigation(self.button_controls[0], self.prev_button, self.prev_button, self.next_button)
-		self.next_button.setNavigation(self.button_controls[0], self.next_button, self.prev_button, self.next_button)
+		up = self.button_controls[0] if count else self.prev_button
+		self.prev_button.setNavigation(up, self.prev_button, self.prev_button, self.next_button)
+		self.next_button.setNavigation(up, self.next_button, self.prev_button, self.next_button)
+		self.wired_count = count
 
 	def onFocus(self, controlId):
-		for index, button in enumerate(self.button_controls):
-			self.play_controls[index].setVisible(button.getId() == controlId)
-			if button.getId() == controlId:
-				self.selected_index = index 
+		slot = self.slot_by_control_id.get(controlId)
+		self.show_play_overlay(slot)
+		if self.prefetcher:
+			index = None if slot is None else self.page * MAX_PER_PAGE + slot
+			audiobook = self.audiobooks[index] if index is not None and index < len(self.audiobooks) else None
+			# Podcasts would be fetched with all their episodes, episodes come from the episode index
+			self.prefetcher.focus(audiobook.id if audiobook is not None and audiobook.media_type == 'book' else None)
+
+	def show_play_overlay(self, slot):
+		if slot == self.selected_index:
+			return
+		if self.selected_index is not None:
+			self.play_controls[self.selected_index].setVisible(False)
+		if slot is not None:
+			self.play_controls[slot].setVisible(True)
+		self.selected_index = slot
 
 	def next_page(self):
 		if (self.page + 1) * MAX_PER_PAGE < len(self.audiobooks):
 			self.page += 1
-			self.selected_index = None
 			self.display_audiobooks()		
 
 	def previous_page(self):
 		if self.page > 0:
 			self.page -= 1
-			self.selected_index = None
 			self.display_audiobooks()		
 
 	def getRealIndex(self, current_index):
@@ -210,110 +311,298 @@ class GUI(xbmcgui.WindowXML):
 	def onAction(self, action):
 		if action.getButtonCode() == 216:
 			self.close()
-		if action.getId() == xbmcgui.ACTION_SELECT_ITEM:
+		if action.getId() == xbmcgui.ACTION_CONTEXT_MENU:
+			self.show_context_menu()
+		elif action.getId() in (xbmcgui.ACTION_NAV_BACK, xbmcgui.ACTION_PREVIOUS_MENU) and self.library_audiobooks is not None:
+			self.close_results()
+		elif action.getId() == xbmcgui.ACTION_SELECT_ITEM:
 			focus_id = self.getFocusId()
 			if focus_id == self.prev_button.getId():  # ID des prev_button
 				self.previous_page()
 			elif focus_id == self.next_button.getId():  # ID des next_button
 				self.next_page()
+			elif focus_id in self.slot_by_control_id:
+				index = self.slot_by_control_id[focus_id]
+				xbmc.log("index: {}".format(index), xbmc.LOGINFO)
+				rindex = self.getRealIndex(index)
+				xbmc.log("realindex: {}".format(rindex), xbmc.LOGINFO)
+				self.show_audiobook_player(rindex)
+
+	def show_context_menu(self):
+		entries = [
+			("Suchen", self.search),
+			("Weiterhören", self.show_continue_listening),
+			("Sortieren", self.choose_sort),
+			("Filtern", self.choose_filter)
+		]
+		if self.library_audiobooks is not None or self.library_query:
+			entries.append(("Ganze Bibliothek anzeigen", self.show_whole_library))
+		slot = self.slot_by_control_id.get(self.getFocusId())
+		audiobook = self.audiobooks[self.getRealIndex(slot)] if slot is not None else None
+		# Only books can be downloaded
+		if audiobook is not None and audiobook.media_type == 'book' and self.download_manager:
+			if self.download_manager.is_downloaded(audiobook.id):
+				entries.append(("Download löschen", lambda: self.remove_download(audiobook)))
 			else:
-				for index, button in enumerate(self.button_controls):
-					if focus_id == button.getId():
-						xbmc.log("index: {}".format(index), xbmc.LOGINFO)
-						rindex = self.getRealIndex(index)
-						xbmc.log("realindex: {}".format(rindex), xbmc.LOGINFO)
-						self.show_audiobook_player(rindex)
-						break
+				entries.append(("Herunterladen", lambda: self.download(audiobook)))
+
+		selected = xbmcgui.Dialog().contextmenu([label for label, _ in entries])
+		if selected != -1:
+			entries[selected][1]()
+
+	def search(self):
+		if not self.search_index:
+			return
+		query = xbmcgui.Dialog().input("Suchen")
+		if not query:
+			return
+
+		# The index grows as pages load, so pull the pages not visited yet
+		library = self.library_audiobooks if self.library_audiobooks is not None else self.audiobooks
+		if hasattr(library, 'load_all'):
+			xbmc.executebuiltin('ActivateWindow(busydialognocancel)')
+			try:
+				library.load_all()
+			finally:
+				xbmc.executebuiltin('Dialog.Close(busydialognocancel)')
+
+		results = self.search_index.search(query)
+		if not results:
+			xbmcgui.Dialog().notification("Suchen", "Keine Treffer für '{}'".format(query), xbmcgui.NOTIFICATION_INFO, 2000)
+			return
+		self.show_results(results)
+
+	def download(self, audiobook):
+		if self.download_manager.enqueue(audiobook.id, audiobook.title):
+			xbmcgui.Dialog().notification("Herunterladen", audiobook.title, xbmcgui.NOTIFICATION_INFO, 2000)
+		else:
+			status = self.download_manager.get_status(audiobook.id)
+			if status and status['total']:
+				message = "{} ({}%)".format(audiobook.title, int(status['done'] * 100 / status['total']))
+			else:
+				message = audiobook.title
+			xbmcgui.Dialog().notification("Wird bereits heruntergeladen", message, xbmcgui.NOTIFICATION_INFO, 2000)
+
+	def remove_download(self, audiobook):
+		try:
+			self.download_manager.remove(audiobook.id)
+		except DownloadInUse:
+			xbmcgui.Dialog().notification("Wird gerade abgespielt", audiobook.title, xbmcgui.NOTIFICATION_INFO, 2000)
+
+	def show_continue_listening(self):
+		try:
+			items = self.library_service.get_continue_listening(self.library_id, CONTINUE_LISTENING_LIMIT)
+		except Exception as e:
+			xbmc.log("Failed to load continue listening shelf: {}".format(str(e)), xbmc.LOGERROR)
+			items = []
+
+		if not items:
+			xbmcgui.Dialog().notification("Weiterhören", "Keine begonnenen Hörbücher", xbmcgui.NOTIFICATION_INFO, 2000)
+			return
+		self.show_results([create_audiobook(item) for item in items])
+
+	def choose_sort(self):
+		selected = xbmcgui.Dialog().select("Sortieren", [label for label, _ in SORT_OPTIONS])
+		if selected != -1:
+			query = {key: value for key, value in self.library_query.items() if key == "filter"}
+			query.update(SORT_OPTIONS[selected][1])
+			self.open_library_view(query)
+
+	def choose_filter(self):
+		labels = ["Genre"] + [label for label, _ in PROGRESS_FILTERS] + ["Kein Filter"]
+		selected = xbmcgui.Dialog().select("Filtern", labels)
+		if selected == -1:
+			return
+
+		query = {key: value for key, value in self.library_query.items() if key != "filter"}
+		if selected == 0:
+			genre = self.choose_genre()
+			if genre is None:
+				return
+			query["filter"] = self.library_service.encode_filter("genres", genre)
+		elif selected <= len(PROGRESS_FILTERS):
+			query["filter"] = self.library_service.encode_filter("progress", PROGRESS_FILTERS[selected - 1][1])
+		self.open_library_view(query)
+
+	def choose_genre(self):
+		if self.genres is None:
+			try:
+				self.genres = self.library_service.get_library_genres(self.library_id)
+			except Exception as e:
+				xbmc.log("Failed to load genres: {}".format(str(e)), xbmc.LOGERROR)
+				return None
+
+		selected = xbmcgui.Dialog().select("Genre", self.genres)
+		return self.genres[selected] if selected != -1 else None
+
+	def open_library_view(self, query):
+		"""Show the library sorted and filtered by the server according to query"""
+		self.library_query = query
+		self.library_audiobooks = None
+		self.audiobooks = open_library(self.library_id, self.search_index, **query)
+		self.page = 0
+		self.display_audiobooks()
+
+	def show_whole_library(self):
+		if self.library_query:
+			self.open_library_view({})
+		else:
+			self.close_results()
+
+	def show_results(self, results):
+		"""Show a list of audiobooks in the grid until the user goes back to the library"""
+		if self.library_audiobooks is None:
+			self.library_audiobooks = self.audiobooks
+			self.library_page = self.page
+		self.audiobooks = results
+		self.page = 0
+		self.display_audiobooks()
+
+	def close_results(self):
+		self.audiobooks = self.library_audiobooks
+		self.page = self.library_page
+		self.library_audiobooks = None
+		self.display_audiobooks()
+
+	def show_episodes(self, podcast):
+		"""Show the episodes of a podcast in the grid, newest first"""
+		episodes = open_podcast(self.library_id, podcast)
+		if not len(episodes):
+			xbmcgui.Dialog().notification(podcast.title, "Keine Episoden", xbmcgui.NOTIFICATION_INFO, 2000)
+			return
+		self.show_results(episodes)
 
 	def show_audiobook_player(self, index):
-		self.selected_index = index
 		selected_audiobook = self.audiobooks[index]
-		cover = selected_audiobook['cover_url']
-		iid = selected_audiobook['id']
-		# Use original title (without progress indicator) for the player
-		title_for_player = selected_audiobook.get('original_title', selected_audiobook['title'])
-		
-		audiobook_data = {
-			'id': iid,
-			'title': title_for_player,
-			'cover': cover,
-			'description': selected_audiobook['description'],
-			'narrator_name': selected_audiobook['narrator_name'],
-			'published_year': selected_audiobook['published_year'],
-			'publisher': selected_audiobook['publisher'],
-			'duration': selected_audiobook['duration'],
-
-		}
-			
-		dialog = AudioBookPlayer('audiobook_dialog.xml', xbmcaddon.Addon().getAddonInfo('path'), 'default', '1080i', **audiobook_data)
+		if selected_audiobook.is_podcast:
+			self.show_episodes(selected_audiobook)
+			return
+		if self.prefetcher:
+			self.prefetcher.claim(selected_audiobook.id)
+		cover = None
+		if self.cover_cache:
+			cover = self.cover_cache.get_cached(selected_audiobook.id, selected_audiobook.updated_at)
+
+		dialog = AudioBookPlayer('audiobook_dialog.xml', xbmcaddon.Addon().getAddonInfo('path'), 'default', '1080i',
+			audiobook=selected_audiobook, cover=cover or self.get_cover_url(selected_audiobook))
 		dialog.doModal()
 		del dialog
 
 
-def select_library(url, token):
-	library_service = AudioBookShelfLibraryService(url, token)
+def create_audiobook(item, search_index=None):
+	library_service = AudioBookShelfLibraryService()
+	audiobook = Audiobook.from_dict(item, library_service.progress_cache.get((item['id'], None)))
+	if search_index is not None:
+		search_index.add(audiobook)
+	return audiobook
+
+
+def open_library(library_id, search_index=None, **query):
+	"""Return the items of a library, loaded page by page as the GUI pages through them"""
+	library_service = AudioBookShelfLibraryService()
+	return LibraryPager(
+		lambda start_page: library_service.iter_library_items(library_id, MAX_PER_PAGE, start_page, minified=1, **query),
+		lambda item: create_audiobook(item, search_index),
+		MAX_PER_PAGE
+	)
+
+
+def create_episode(podcast, episode):
+	library_service = AudioBookShelfLibraryService()
+	return PodcastEpisode.from_dict(podcast, episode, library_service.progress_cache.get((podcast.id, episode['id'])))
+
+
+def open_podcast(library_id, podcast):
+	"""Return the episodes of a podcast, converted page by page as the GUI pages through them"""
+	library_service = AudioBookShelfLibraryService()
+	return LibraryPager(
+		lambda start_page: library_service.iter_podcast_episodes(library_id, podcast.id, MAX_PER_PAGE, start_page, podcast.media.num_episodes),
+		lambda episode: create_episode(podcast, episode),
+		MAX_PER_PAGE
+	)
 
-	data = library_service.get_all_libraries()
-	libraries = data['libraries']
+
+def is_unauthorized(error):
+	return isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 401
+
+
+def start_session(service, username, password, token_store, timeline):
+	"""Authenticate and return the libraries of the user.
+
+	A stored token is validated while the libraries are already being fetched
+	with it, so a warm start takes a single round trip. Only when the server
+	rejects the token is it refreshed or replaced by a password login.
+	"""
+	library_service = AudioBookShelfLibraryService()
+	stored = token_store.load(service.base_url, username)
+	if stored:
+		library_service.set_token(stored["token"])
+		with ThreadPoolExecutor(max_workers=2) as executor:
+			authorized = executor.submit(service.authorize, stored["token"])
+			libraries = executor.submit(library_service.get_all_libraries)
+			try:
+				authorized.result()
+				result = libraries.result()
+				timeline.mark("stored token accepted, libraries loaded")
+				return result
+			except requests.HTTPError as e:
+				if not is_unauthorized(e):
+					raise
+		timeline.mark("stored token rejected")
+
+		if stored.get("refresh_token"):
+			try:
+				token, refresh_token = service.get_tokens(service.refresh(stored["refresh_token"]))
+			except requests.HTTPError as e:
+				if not is_unauthorized(e):
+					raise
+				token = None
+			if token:
+				token_store.save(service.base_url, username, token, refresh_token or stored["refresh_token"])
+				library_service.set_token(token)
+				timeline.mark("token refreshed")
+				result = library_service.get_all_libraries()
+				timeline.mark("libraries loaded")
+				return result
+
+	user = service.login(username, password)
+	token, refresh_token = service.get_tokens(user or {})
+	if not token:
+		raise ValueError("Kein Token in der Antwort")
+	token_store.save(service.base_url, username, token, refresh_token)
+	library_service.set_token(token)
+	timeline.mark("logged in")
+	result = library_service.get_all_libraries()
+	timeline.mark("libraries loaded")
+	return result
+
+
+@profiler.traced()
+def select_library(libraries):
+	library_service = AudioBookShelfLibraryService()
 	library_names = [lib['name'] for lib in libraries]
 
 	dialog = xbmcgui.Dialog()
 	selected = dialog.select('Wählen Sie eine Bibliothek', library_names)
 
 	if selected != -1:
-		selected_library = libraries[selected]
-		items = library_service.get_library_items(selected_library['id'])
-		audiobooks = []
-
-		for item in items["results"]:
-			cover_path = item['media'].get('coverPath', "") or ""
-			icon_id = os.path.basename(os.path.dirname(cover_path))
-			cover_url = "{}/api/items/{}/cover?token={}".format(url, icon_id, token)
-			title = item['media']['metadata'].get('title', "") or ""
-			description = item['media']['metadata'].get('description', "") or ""
-			narrator_name = item['media']['metadata'].get('narratorName', "") or ""
-			#xbmc.log("Roger, addon here..item" + str(item), xbmc.LOGINFO)
-			publisher = item['media']['metadata'].get('publisher', "") or ""
-			published_year = item['media']['metadata'].get('publishedYear', "") or ""
-			duration = item['media'].get('duration', 0.0) or 0.0
-			iid = item['id']
-
-			# Get progress information
-			progress_info = {"currentTime": 0.0, "progress": 0.0}
-			try:
-				progress_data = library_service.get_media_progress(iid)
-				if progress_data and 'currentTime' in progress_data:
-					progress_info = {
-						"currentTime": float(progress_data.get('currentTime', 0.0)),
-						"progress": float(progress_data.get('progress', 0.0))
-					}
-			except:
-				pass  # If progress fetch fails, use defaults
-
-			# Add progress indicator to title if book has been started
-			display_title = title
-			if progress_info["progress"] > 0.01:  # Show if more than 1% complete
-				progress_percent = int(progress_info["progress"] * 100)
-				display_title = "{} ({}%)".format(title, progress_percent)
-
-			audiobook = {
-				"id": iid,
-				"title": display_title,
-				"original_title": title,  # Keep original for player
-				"cover_url": cover_url,
-				"description": description,
-				"narrator_name": "Narrator: "+narrator_name,
-				"published_year": "Year: "+published_year,
-				"publisher": "Publisher: "+publisher,
-				"duration": duration,
-				"progress": progress_info
-			}
-			audiobooks.append(audiobook)
-
-		return audiobooks
+		# Fetch the progress of all items at once instead of one request per item
+		try:
+			library_service.get_all_media_progress()
+		except Exception as e:
+			xbmc.log("Failed to fetch media progress: {}".format(str(e)), xbmc.LOGERROR)
 
+		return libraries[selected]['id']
 
-if __name__ == '__main__':
+
+def notify_download_finished(item_id, title, error):
+	if error is None:
+		xbmcgui.Dialog().notification("Download abgeschlossen", title or item_id, xbmcgui.NOTIFICATION_INFO, 3000)
+	else:
+		xbmcgui.Dialog().notification("Download fehlgeschlagen", title or item_id, xbmcgui.NOTIFICATION_ERROR, 3000)
+
+
+def main():
 	ip_address = ADDON.getSetting('ipaddress')
 	port = ADDON.getSetting('port')
 	username = ADDON.getSetting('username')
@@ -323,26 +612,74 @@ if __name__ == '__main__':
 		dialog = SettingsDialog()
 		dialog.get_and_store_settings()
 
+	timeline = StartupTimeline()
 	url = "http://{}:{}".format(ip_address, port)
 	service = AudioBookShelfService(url)
+	if not os.path.isdir(PROFILE_DIR):
+		os.makedirs(PROFILE_DIR)
+	AudioBookShelfLibraryService(url, cache_dir=PROFILE_DIR)
 
 	try:
-		server_status = service.server_status()
-	except Exception:
+		data = start_session(service, username, password, TokenStore(PROFILE_DIR), timeline)
+	except (requests.ConnectionError, requests.Timeout):
 		xbmcgui.Dialog().ok('Fehler', 'Audiobookshelf Server ist nicht erreichbar')
-		exit()
-
-	try:
-		response_data = service.login(username, password)
-		token = response_data.get('token')
-		#xbmc.log("Roger, addon here..token: " + str(token), xbmc.LOGINFO)
-		if not token:
-			raise ValueError("Kein Token in der Antwort")
-	except Exception:
+		return
+	except Exception as e:
+		xbmc.log("Login failed: {}".format(str(e)), xbmc.LOGERROR)
 		xbmcgui.Dialog().ok('Fehler', 'überprüfen Sie Benutzernamen oder Passwort')
-		exit()
-
-	audiobooks = select_library(url, token)
-	ui = GUI('script-mainwindow.xml', CWD, 'default', '1080i', True, optional1=audiobooks)
+		return
+
+	timeline.mark("library dialog shown")
+	library_id = select_library(data['libraries'])
+	if library_id is None:
+		return
+	timeline.mark("library selected, progress loaded")
+
+	search_index = SearchIndex()
+	audiobooks = open_library(library_id, search_index)
+	# Also sends progress left in the journal by a previous session
+	progress_writer = ProgressSyncWriter(AudioBookShelfLibraryService(), PROFILE_DIR)
+	progress_writer.start()
+	get_session().breaker.add_close_listener(progress_writer.retry_now)
+	cover_cache = CoverCache(os.path.join(PROFILE_DIR, 'covers'), AudioBookShelfLibraryService(), COVER_WIDTH, COVER_HEIGHT)
+	download_manager = DownloadManager(AudioBookShelfLibraryService(), os.path.join(PROFILE_DIR, 'downloads'), DOWNLOAD_CONNECTIONS, DOWNLOAD_QUOTA_BYTES)
+	download_manager.add_finished_listener(notify_download_finished)
+	prefetcher = FocusPrefetcher(AudioBookShelfLibraryService())
+	get_session().breaker.add_close_listener(download_manager.retry_failed)
+	# Progress from other devices and library changes then reach the caches without polling
+	realtime_listener = None
+	if ADDON.getSetting('realtime') != 'false':
+		realtime_listener = RealtimeListener(AudioBookShelfLibraryService(), cover_cache, progress_writer, search_index, library_id)
+		realtime_listener.start()
+		get_session().breaker.add_close_listener(realtime_listener.wake)
+	timeline.mark("opening library grid")
+	timeline.log_summary()
+	ui = GUI('script-mainwindow.xml', CWD, 'default', '1080i', True, optional1=audiobooks, cover_cache=cover_cache, search_index=search_index, library_id=library_id,
+		download_manager=download_manager, prefetcher=prefetcher)
 	ui.doModal()
 	del ui
+	if realtime_listener:
+		realtime_listener.stop()
+	prefetcher.shutdown()
+	cover_cache.shutdown()
+	download_manager.stop()
+	progress_writer.stop()
+	get_session().breaker.stop()
+
+
+if __name__ == '__main__':
+	# Before the request stats or any service take the shared session
+	configure_session(POOL_SIZE, KEEP_ALIVE)
+	request_stats = None
+	if ADDON.getSetting('request_stats') == 'true':
+		request_stats = RequestStats()
+		get_session().stats = request_stats
+	if ADDON.getSetting('profiling') == 'true':
+		profiler.enable(PROFILE_DIR)
+	try:
+		profiler.run(main)
+	finally:
+		if request_stats:
+			request_stats.log_summary()
+			request_stats.save(PROFILE_DIR)
+		profiler.save()
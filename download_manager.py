@@ -0,0 +1,484 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import xbmc
+from file_utils import atomic_write_json
+from http_session import BACKGROUND_TIMEOUT, create_session
+
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_QUOTA_BYTES = 2 * 1024 * 1024 * 1024
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024  # Smaller files are fetched with a single request
+CHUNK_SIZE = 64 * 1024  # A dropped connection loses at most the chunk being read
+MAX_RETRIES = 5  # failed attempts in a row without receiving any bytes
+RETRY_DELAY = 1.0  # seconds, doubled after every failed attempt
+MAX_RETRY_DELAY = 30.0
+STATE_INTERVAL = 2.0  # seconds between writes of the resume state
+MANIFEST_FILE_NAME = "manifest.json"
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+class DownloadError(Exception):
+	"""A book could not be downloaded, its partial files are kept for a later resume"""
+
+
+class DownloadInUse(DownloadError):
+	"""The files of a book are playing and cannot be deleted"""
+
+
+class DownloadCancelled(DownloadError):
+	pass
+
+
+class RestartDownload(Exception):
+	"""The server ignored the range or the file changed, the file has to start over"""
+
+
+class DownloadManager:
+	"""Downloads the audio files of books into the profile for offline playback.
+
+	Each file is fetched in parallel segments with HTTP range requests into a
+	.part file. The downloaded bytes of every segment are recorded next to it,
+	so an interrupted download resumes where it stopped, and If-Range makes
+	sure a file changed on the server starts over. Every file is recorded in
+	the manifest of the book with the ino and size of the server's audio file,
+	a download only completes with exactly that many bytes on disk, and a file
+	whose ino changed on the server is fetched again. Before a book plays from
+	its files they are checked again against the tracks of the playback
+	session. The server reports no checksum of its files, so ino and size are
+	all a file can be checked against: a hash taken here would only compare
+	the file with itself, and hashing a whole book before every playback would
+	delay it by seconds on small devices.
+
+	Books are downloaded one after another, max_connections bounds the range
+	requests in flight and quota_bytes the space all downloads may take. Range
+	requests use a session of their own without a circuit breaker: they retry
+	on their own, and a failing download must not cut off the user interface.
+	"""
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if not cls._instance:
+			cls._instance = super(DownloadManager, cls).__new__(cls)
+		return cls._instance
+
+	def __init__(self, library_service=None, download_dir=None, max_connections=DEFAULT_MAX_CONNECTIONS, quota_bytes=DEFAULT_QUOTA_BYTES):
+		if not hasattr(self, 'initialized'):
+			self.library_service = library_service
+			self.download_dir = download_dir
+			self.max_connections = max_connections
+			self.quota_bytes = quota_bytes
+			self.lock = threading.Lock()
+			# Item id -> status of queued, running and failed downloads
+			self.status = {}
+			self.cancelled = set()
+			# Books playing from their downloaded files, which must not be deleted
+			self.playing = set()
+			self.stop_event = threading.Event()
+			self.finished_listeners = []
+			self.executor = ThreadPoolExecutor(max_workers=1)
+			self.segment_executor = ThreadPoolExecutor(max_workers=max_connections)
+			self.session = create_session(max_connections, breaker=False)
+			if download_dir and not os.path.isdir(download_dir):
+				os.makedirs(download_dir)
+			self.initialized = True
+
+	def add_finished_listener(self, callback):
+		"""Call callback(item_id, title, error) when a download finished, error is None on success"""
+		self.finished_listeners.append(callback)
+
+	def _book_dir(self, item_id):
+		return os.path.join(self.download_dir, item_id)
+
+	def _read_json(self, path):
+		try:
+			with open(path, "r", encoding="utf-8") as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return None
+
+	def get_manifest(self, item_id):
+		if not self.download_dir:
+			return None
+		return self._read_json(os.path.join(self._book_dir(item_id), MANIFEST_FILE_NAME))
+
+	def is_downloaded(self, item_id):
+		manifest = self.get_manifest(item_id)
+		return bool(manifest and manifest.get("complete"))
+
+	def get_status(self, item_id):
+		"""Return the status dict of a queued, running or failed download, or None"""
+		with self.lock:
+			status = self.status.get(item_id)
+			return dict(status) if status else None
+
+	def get_local_tracks(self, item_id):
+		"""Return the downloaded tracks of a book with their local path, or None if it is not fully downloaded"""
+		manifest = self.get_manifest(item_id)
+		if not manifest or not manifest.get("complete"):
+			return None
+		return self._check_files(item_id, manifest)
+
+	def _check_files(self, item_id, manifest):
+		"""Return the tracks of a manifest with their local path, or None if a file is missing or its size differs"""
+		book_dir = self._book_dir(item_id)
+		tracks = []
+		for track in manifest["tracks"]:
+			path = os.path.join(book_dir, track["file"])
+			try:
+				size = os.path.getsize(path)
+			except OSError:
+				size = None
+			if size != track["size"]:
+				xbmc.log("Downloaded file {} of {} is missing or incomplete".format(track["file"], item_id), xbmc.LOGWARNING)
+				return None
+			tracks.append(dict(track, path=path))
+		return tracks
+
+	def verify(self, item_id, audio_tracks=None):
+		"""Return the downloaded tracks of a book if they match the server's audio tracks, otherwise None.
+
+		audio_tracks are the tracks of a playback session, without them the
+		book's audio files are requested from the server.
+		"""
+		tracks = self.get_local_tracks(item_id)
+		if tracks is None:
+			return None
+		if audio_tracks is None:
+			_, server_tracks = self._get_tracks(item_id)
+		else:
+			server_tracks = [{
+				"ino": track.get("ino") or (track.get("contentUrl") or "").rsplit("/", 1)[-1],
+				"size": (track.get("metadata") or {}).get("size")
+			} for track in audio_tracks]
+		downloaded = [(track.get("ino"), track["size"]) for track in tracks]
+		if downloaded != [(track["ino"], track["size"]) for track in server_tracks]:
+			xbmc.log("Downloaded files of {} differ from the server, streaming instead".format(item_id), xbmc.LOGWARNING)
+			return None
+		return tracks
+
+	def set_playing(self, item_id, playing):
+		"""Record whether the player uses the downloaded files of a book"""
+		with self.lock:
+			if playing:
+				self.playing.add(item_id)
+			else:
+				self.playing.discard(item_id)
+
+	def used_bytes(self, exclude=None):
+		"""Return the space taken by all downloads except the book exclude"""
+		if not self.download_dir or not os.path.isdir(self.download_dir):
+			return 0
+		return sum(self._dir_bytes(book.path) for book in os.scandir(self.download_dir) if book.is_dir() and book.name != exclude)
+
+	def _dir_bytes(self, book_dir):
+		"""Return the bytes of a book on disk, partial files counted by their downloaded bytes"""
+		total = 0
+		for entry in os.scandir(book_dir):
+			if entry.name.endswith(PART_SUFFIX):
+				state = self._read_json(entry.path[:-len(PART_SUFFIX)] + STATE_SUFFIX)
+				total += sum(segment[2] for segment in state["segments"]) if state else 0
+			elif entry.is_file():
+				total += entry.stat().st_size
+		return total
+
+	def enqueue(self, item_id, title=None):
+		"""Queue the download of a book, returns False if it is already downloaded or queued"""
+		with self.lock:
+			status = self.status.get(item_id)
+			if status and status["state"] in ("queued", "downloading"):
+				return False
+			self.cancelled.discard(item_id)
+			if self.is_downloaded(item_id):
+				return False
+			self.status[item_id] = {"state": "queued", "title": title, "done": 0, "total": 0, "error": None}
+		self.executor.submit(self._run, item_id, title)
+		return True
+
+	def retry_failed(self):
+		"""Queue failed downloads again, e.g. once the server is reachable after an outage"""
+		with self.lock:
+			failed = [(item_id, status["title"]) for item_id, status in self.status.items() if status["state"] == "failed"]
+		for item_id, title in failed:
+			self.enqueue(item_id, title)
+
+	def remove(self, item_id):
+		"""Cancel a running download and delete all files of the book.
+
+		Raises DownloadInUse while the book plays from its downloaded files.
+		"""
+		with self.lock:
+			if item_id in self.playing:
+				raise DownloadInUse("{} is playing from its downloaded files".format(item_id))
+			status = self.status.get(item_id)
+			if status and status["state"] in ("queued", "downloading"):
+				self.cancelled.add(item_id)
+			self.status.pop(item_id, None)
+		# A running download notices the cancellation after its current chunk
+		self.executor.submit(shutil.rmtree, self._book_dir(item_id), True)
+
+	def stop(self):
+		"""Stop all downloads, their progress is kept for the next launch"""
+		self.stop_event.set()
+		self.executor.shutdown(wait=False)
+		self.segment_executor.shutdown(wait=False)
+
+	def _is_cancelled(self, item_id):
+		return self.stop_event.is_set() or item_id in self.cancelled
+
+	def _set_status(self, item_id, **values):
+		with self.lock:
+			if item_id in self.status:
+				self.status[item_id].update(values)
+
+	def _add_done(self, item_id, size):
+		with self.lock:
+			if item_id in self.status:
+				self.status[item_id]["done"] += size
+
+	def _run(self, item_id, title):
+		if self._is_cancelled(item_id):
+			return
+		self._set_status(item_id, state="downloading")
+		started = time.perf_counter()
+		error = None
+		try:
+			size = self._download_book(item_id, title)
+			with self.lock:
+				self.status.pop(item_id, None)
+			xbmc.log("Downloaded {} ({} bytes) in {:.1f}s".format(item_id, size, time.perf_counter() - started), xbmc.LOGINFO)
+		except DownloadCancelled:
+			with self.lock:
+				self.status.pop(item_id, None)
+			return
+		except Exception as e:
+			error = str(e)
+			self._set_status(item_id, state="failed", error=error)
+			xbmc.log("Download of {} failed: {}".format(item_id, error), xbmc.LOGERROR)
+
+		for callback in self.finished_listeners:
+			try:
+				callback(item_id, title, error)
+			except Exception as e:
+				xbmc.log("Download listener failed: {}".format(str(e)), xbmc.LOGERROR)
+
+	def _get_tracks(self, item_id):
+		"""Return the audio tracks of a book with their content URL and size"""
+		item = self.library_service.get_library_item_by_id(item_id, expanded=1)
+		media = item.get("media") or {}
+		# Tracks carry the order, the audio files the ino and size the downloaded files are checked against
+		audio_files = {audio_file.get("ino"): audio_file for audio_file in media.get("audioFiles") or []}
+		tracks = []
+		for track in media.get("tracks") or media.get("audioFiles") or []:
+			content_url = track.get("contentUrl") or "/api/items/{}/file/{}".format(item_id, track["ino"])
+			ino = track.get("ino") or content_url.rsplit("/", 1)[-1]
+			metadata = (audio_files.get(ino) or track).get("metadata") or {}
+			if metadata.get("size") is None:
+				raise DownloadError("Size of {} unknown".format(content_url))
+			tracks.append({
+				"url": content_url,
+				"ino": ino,
+				"size": metadata["size"],
+				"ext": metadata.get("ext") or ".mp3",
+				"startOffset": track.get("startOffset") or 0.0,
+				"duration": track.get("duration")
+			})
+		if not tracks:
+			raise DownloadError("No audio files found")
+		tracks.sort(key=lambda track: track["startOffset"])
+		return item, tracks
+
+	def _download_book(self, item_id, title):
+		item, tracks = self._get_tracks(item_id)
+		total = sum(track["size"] for track in tracks)
+		self._set_status(item_id, total=total)
+
+		book_dir = self._book_dir(item_id)
+		if not os.path.isdir(book_dir):
+			os.makedirs(book_dir)
+		used = self.used_bytes(exclude=item_id)
+		if used + total > self.quota_bytes:
+			raise DownloadError("Download quota exceeded: {} of {} bytes used, {} needed".format(used, self.quota_bytes, total))
+		if shutil.disk_usage(self.download_dir).free < total - self._dir_bytes(book_dir):
+			raise DownloadError("Not enough free disk space")
+
+		# Files of a previous attempt are only kept if they are still the same on the server
+		previous = {entry["file"]: entry.get("ino") for entry in (self.get_manifest(item_id) or {}).get("tracks", [])}
+		manifest = {
+			"itemId": item_id,
+			"title": title or ((item.get("media") or {}).get("metadata") or {}).get("title"),
+			"complete": False,
+			"tracks": []
+		}
+		for index, track in enumerate(tracks):
+			manifest["tracks"].append({
+				"file": "{:03d}{}".format(index + 1, track["ext"]),
+				"ino": track["ino"],
+				"size": track["size"],
+				"startOffset": track["startOffset"],
+				"duration": track["duration"]
+			})
+		for entry in manifest["tracks"]:
+			if entry["file"] in previous and previous[entry["file"]] != entry["ino"]:
+				xbmc.log("{} of {} changed on the server, downloading it again".format(entry["file"], item_id), xbmc.LOGINFO)
+				for suffix in ("", PART_SUFFIX, STATE_SUFFIX):
+					if os.path.exists(os.path.join(book_dir, entry["file"] + suffix)):
+						os.remove(os.path.join(book_dir, entry["file"] + suffix))
+		manifest_path = os.path.join(book_dir, MANIFEST_FILE_NAME)
+		atomic_write_json(manifest_path, manifest)
+
+		for track, entry in zip(tracks, manifest["tracks"]):
+			path = os.path.join(book_dir, entry["file"])
+			url = "{}{}".format(self.library_service.base_url, track["url"])
+			self._download_file(item_id, url, path, track["size"])
+
+		if self._check_files(item_id, manifest) is None:
+			raise DownloadError("Downloaded files of {} do not have the server's sizes".format(item_id))
+		manifest["complete"] = True
+		manifest["downloadedAt"] = int(time.time() * 1000)
+		atomic_write_json(manifest_path, manifest)
+		return total
+
+	def _load_state(self, path, size):
+		"""Return the resume state of a partial file, or None if it has to start over"""
+		state = self._read_json(path + STATE_SUFFIX)
+		if not state or state.get("size") != size or not os.path.exists(path + PART_SUFFIX):
+			return None
+		return state
+
+	def _new_state(self, path, size, segments):
+		"""Split a file into segments of [start, end, downloaded bytes] and create its .part file"""
+		length = -(-size // segments)
+		state = {
+			"size": size,
+			"validator": None,
+			"segments": [[start, min(start + length, size), 0] for start in range(0, size, length)] or [[0, 0, 0]]
+		}
+		with open(path + PART_SUFFIX, "wb") as f:
+			f.truncate(size)
+		atomic_write_json(path + STATE_SUFFIX, state)
+		return state
+
+	def _download_file(self, item_id, url, path, size):
+		"""Download one file in parallel ranges"""
+		if os.path.exists(path) and os.path.getsize(path) == size:
+			self._add_done(item_id, size)
+			return
+
+		segments = max(1, min(self.max_connections, size // MIN_SEGMENT_SIZE))
+		state = self._load_state(path, size)
+		if state is None:
+			state = self._new_state(path, size, segments)
+		elif any(segment[2] for segment in state["segments"]):
+			xbmc.log("Resuming download of {} at {} of {} bytes".format(path, sum(segment[2] for segment in state["segments"]), size), xbmc.LOGINFO)
+
+		try:
+			self._download_segments(item_id, url, path, state)
+		except RestartDownload as e:
+			xbmc.log("Restarting download of {}: {}".format(path, str(e)), xbmc.LOGWARNING)
+			self._add_done(item_id, -sum(segment[2] for segment in state["segments"]))
+			# Without working ranges the file can only be fetched in one piece
+			state = self._new_state(path, size, 1)
+			self._download_segments(item_id, url, path, state)
+
+		if os.path.getsize(path + PART_SUFFIX) != size or sum(segment[2] for segment in state["segments"]) != size:
+			raise DownloadError("Size of {} does not match the server".format(path))
+		os.replace(path + PART_SUFFIX, path)
+		os.remove(path + STATE_SUFFIX)
+
+	def _download_segments(self, item_id, url, path, state):
+		"""Download all unfinished segments of a file in parallel"""
+		self._add_done(item_id, sum(segment[2] for segment in state["segments"]))
+		state_lock = threading.Lock()
+		saved_at = [time.monotonic()]
+		# Set by the first failing segment so the others stop and keep what they have
+		abort = threading.Event()
+
+		def save_state(force=False):
+			with state_lock:
+				if force or time.monotonic() - saved_at[0] >= STATE_INTERVAL:
+					atomic_write_json(path + STATE_SUFFIX, state)
+					saved_at[0] = time.monotonic()
+
+		futures = [
+			self.segment_executor.submit(self._download_segment, item_id, url, path, state, segment, save_state, abort)
+			for segment in state["segments"] if segment[0] + segment[2] < segment[1]
+		]
+		error = None
+		for future in futures:
+			try:
+				future.result()
+			except Exception as e:
+				abort.set()
+				if error is None or isinstance(error, DownloadCancelled):
+					error = e
+		save_state(force=True)
+		if error is not None:
+			raise error
+
+	def _download_segment(self, item_id, url, path, state, segment, save_state, abort):
+		start, end = segment[0], segment[1]
+		failures = 0
+		delay = RETRY_DELAY
+		while start + segment[2] < end:
+			if abort.is_set() or self._is_cancelled(item_id):
+				raise DownloadCancelled()
+			offset = start + segment[2]
+			headers = {"Authorization": self.library_service.headers["Authorization"], "Range": "bytes={}-{}".format(offset, end - 1)}
+			if state["validator"]:
+				headers["If-Range"] = state["validator"]
+			received = 0
+			try:
+				with self.session.get(url, headers=headers, stream=True, timeout=BACKGROUND_TIMEOUT) as response:
+					if response.status_code == 416:
+						raise RestartDownload("Range not satisfiable")
+					response.raise_for_status()
+					if response.status_code == 206:
+						match = CONTENT_RANGE.match(response.headers.get("Content-Range") or "")
+						if not match or int(match.group(1)) != offset or int(match.group(3)) != state["size"]:
+							raise RestartDownload("Unexpected Content-Range {}".format(response.headers.get("Content-Range")))
+					elif offset != 0 or end != state["size"]:
+						raise RestartDownload("Server sent the whole file instead of a range")
+					if not state["validator"]:
+						state["validator"] = self._get_validator(response)
+
+					with open(path + PART_SUFFIX, "r+b") as f:
+						f.seek(offset)
+						for chunk in response.iter_content(CHUNK_SIZE):
+							if abort.is_set() or self._is_cancelled(item_id):
+								raise DownloadCancelled()
+							chunk = chunk[:end - offset - received]
+							f.write(chunk)
+							received += len(chunk)
+							# The bytes are in the file before they are recorded as downloaded
+							segment[2] += len(chunk)
+							self._add_done(item_id, len(chunk))
+							save_state()
+				if start + segment[2] < end:
+					raise requests.ConnectionError("Connection closed after {} of {} bytes".format(received, end - offset))
+			except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+				xbmc.log("Download of {} interrupted at {} bytes: {}".format(path, start + segment[2], str(e)), xbmc.LOGDEBUG)
+				if received:
+					# The connection dropped mid-transfer, continue right away from where it stopped
+					failures, delay = 0, RETRY_DELAY
+					continue
+				failures += 1
+				if failures > MAX_RETRIES:
+					raise DownloadError("Giving up on {} after {} attempts: {}".format(url, failures, str(e)))
+				if self.stop_event.wait(delay):
+					raise DownloadCancelled()
+				delay = min(delay * 2, MAX_RETRY_DELAY)
+
+	def _get_validator(self, response):
+		"""Return the If-Range value that makes resumed ranges fail over to the whole file if it changed"""
+		etag = response.headers.get("ETag")
+		# Weak ETags never match If-Range, the server would always send the whole file
+		if etag and not etag.startswith("W/"):
+			return etag
+		return response.headers.get("Last-Modified")
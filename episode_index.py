@@ -0,0 +1,129 @@
+import json
+import os
+import threading
+import xbmc
+from file_utils import atomic_write_json
+
+SCHEMA_VERSION = 1
+INDEX_FILE_NAME = "episode_index.json"
+MAX_DESCRIPTION_LENGTH = 1000  # Feed descriptions can be long HTML, the dialog only shows the start
+
+
+def compact_episode(episode):
+	"""Keep only the fields of an episode the grid and the player need"""
+	audio_file = episode.get("audioFile") or {}
+	compact = {
+		"id": episode["id"],
+		"title": episode.get("title") or "",
+		"subtitle": episode.get("subtitle"),
+		"description": (episode.get("description") or "")[:MAX_DESCRIPTION_LENGTH],
+		"publishedAt": episode.get("publishedAt") or 0,
+		"duration": episode.get("duration") or audio_file.get("duration") or 0.0
+	}
+	if episode.get("chapters"):
+		compact["chapters"] = episode["chapters"]
+	return compact
+
+
+class EpisodeIndex:
+	"""Persistent on-disk index of podcast episodes, per library and show.
+
+	The episodes of a show are stored newest first, in compact form. Each
+	library keeps the newest publishedAt seen, so a later session only needs
+	the episodes published since from the recent episodes endpoint. Episodes
+	deleted on the server or missed by that endpoint show up as a difference
+	to the episode count of the show, which then gets fetched again.
+	"""
+
+	def __init__(self, cache_dir=None):
+		# Without a cache directory the index only lives as long as the session
+		self.path = os.path.join(cache_dir, INDEX_FILE_NAME) if cache_dir else None
+		self.lock = threading.RLock()
+		self.synced_libraries = set()  # Libraries refreshed during this session
+		self.checked_shows = set()  # Shows compared with their episode count during this session
+		self.libraries = self._load()
+
+	def _load(self):
+		if self.path is None:
+			return {}
+		try:
+			with open(self.path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError) as e:
+			xbmc.log("Episode index is corrupt, starting from scratch: {}".format(str(e)), xbmc.LOGWARNING)
+			return {}
+
+		if not isinstance(data, dict) or data.get("version") != SCHEMA_VERSION:
+			xbmc.log("Episode index has an unknown schema version, starting from scratch", xbmc.LOGINFO)
+			return {}
+		return data.get("libraries") or {}
+
+	def save(self):
+		if self.path is None:
+			return
+		with self.lock:
+			data = {"version": SCHEMA_VERSION, "libraries": self.libraries}
+			try:
+				atomic_write_json(self.path, data, separators=(",", ":"))
+			except OSError as e:
+				xbmc.log("Failed to write episode index: {}".format(str(e)), xbmc.LOGERROR)
+
+	def has_library(self, library_id):
+		return library_id in self.libraries
+
+	def has_show(self, library_id, show_id):
+		return show_id in (self.libraries.get(library_id) or {}).get("shows", {})
+
+	def is_synced(self, library_id):
+		return library_id in self.synced_libraries
+
+	def needs_fetch(self, library_id, show_id, num_episodes=None):
+		"""Return whether a show has to be fetched as a whole, comparing its count once per session"""
+		if not self.has_show(library_id, show_id):
+			return True
+		if num_episodes is None or show_id in self.checked_shows:
+			return False
+		self.checked_shows.add(show_id)
+		return self.count(library_id, show_id) != num_episodes
+
+	def mark_synced(self, library_id):
+		self.synced_libraries.add(library_id)
+
+	def last_published_at(self, library_id):
+		return self.libraries[library_id]["last_published_at"]
+
+	def count(self, library_id, show_id):
+		return len(self.libraries[library_id]["shows"][show_id])
+
+	def get_episodes(self, library_id, show_id, start=0, stop=None):
+		"""Return episodes of a show newest first, optionally only a slice of them"""
+		with self.lock:
+			return self.libraries[library_id]["shows"][show_id][start:stop]
+
+	def replace_show(self, library_id, show_id, episodes):
+		"""Replace the episodes of a show with its full episode list"""
+		compact = sorted((compact_episode(episode) for episode in episodes), key=lambda episode: episode["publishedAt"], reverse=True)
+		with self.lock:
+			entry = self.libraries.setdefault(library_id, {"last_published_at": 0, "shows": {}})
+			entry["shows"][show_id] = compact
+			self.checked_shows.add(show_id)
+			if compact:
+				entry["last_published_at"] = max(entry["last_published_at"], compact[0]["publishedAt"])
+
+	def merge_recent(self, library_id, episodes):
+		"""Add recently published episodes of indexed shows, returns how many were new"""
+		added = 0
+		with self.lock:
+			entry = self.libraries[library_id]
+			for episode in episodes:
+				entry["last_published_at"] = max(entry["last_published_at"], episode.get("publishedAt") or 0)
+				show = entry["shows"].get(episode.get("libraryItemId"))
+				# Shows not opened yet get their full list when they are
+				if show is None or any(known["id"] == episode["id"] for known in show):
+					continue
+				show.append(compact_episode(episode))
+				show.sort(key=lambda known: known["publishedAt"], reverse=True)
+				added += 1
+		return added
@@ -0,0 +1,17 @@
+import json
+import os
+
+
+def atomic_write_json(path, data, mode=None, **dump_args):
+	"""Write data as JSON to a temporary file and move it over path.
+
+	Readers see the old or the new file, never a partly written one, even if
+	Kodi is stopped in the middle of the write. mode sets the permissions
+	before the file becomes visible. OSError is left to the caller.
+	"""
+	tmp_path = path + ".tmp"
+	with open(tmp_path, "w", encoding="utf-8") as f:
+		json.dump(data, f, **dump_args)
+	if mode is not None:
+		os.chmod(tmp_path, mode)
+	os.replace(tmp_path, path)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+import xbmc
+
+DWELL_TIME = 0.4  # seconds a cover has to stay focused before its details are fetched
+MAX_TRACKED = 200  # prefetched items remembered for the hit rate
+
+
+class FocusPrefetcher:
+	"""Fetches the details of the focused book while the user decides whether to open it.
+
+	Only the item focused for DWELL_TIME is fetched, focus changes before that
+	cancel the pending prefetch, so scrolling through the grid costs nothing.
+	Fetches run one at a time on a single thread into the shared item and
+	progress caches, which the player dialog reads when it opens. Items that
+	are never opened simply age out of the bounded item cache.
+	"""
+
+	def __init__(self, library_service, dwell_time=DWELL_TIME):
+		self.library_service = library_service
+		self.dwell_time = dwell_time
+		self.condition = threading.Condition()
+		self.focused = None
+		self.focused_at = 0.0
+		self.stopping = False
+		# Prefetched items that were not opened yet
+		self.prefetched = OrderedDict()
+		self.counts = {"prefetched": 0, "used": 0, "cancelled": 0, "hit": 0, "in_flight": 0, "miss": 0}
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def focus(self, item_id):
+		"""Note that item_id got the focus, None when no cover is focused"""
+		with self.condition:
+			if self.focused is not None and self.focused != item_id:
+				self.counts["cancelled"] += 1
+			self.focused = item_id
+			self.focused_at = time.monotonic()
+			self.condition.notify()
+
+	def claim(self, item_id):
+		"""Record whether the details of an item being opened were ready, for the hit rate"""
+		with self.condition:
+			was_prefetched = self.prefetched.pop(item_id, False)
+			if self.focused == item_id:
+				# Opened before the dwell time passed, nothing to prefetch any more
+				self.focused = None
+		item_cache = self.library_service.item_cache
+		if item_id in item_cache:
+			outcome = "hit"
+		elif item_cache.is_pending(item_id):
+			outcome = "in_flight"
+		else:
+			outcome = "miss"
+		with self.condition:
+			self.counts[outcome] += 1
+			if was_prefetched:
+				self.counts["used"] += 1
+		xbmc.log("Details of {} on open: {}".format(item_id, outcome), xbmc.LOGDEBUG)
+
+	def _run(self):
+		while True:
+			with self.condition:
+				while not self.stopping and self.focused is None:
+					self.condition.wait()
+				if self.stopping:
+					return
+				remaining = self.focused_at + self.dwell_time - time.monotonic()
+				if remaining > 0:
+					self.condition.wait(remaining)
+					continue
+				item_id = self.focused
+				self.focused = None
+				if item_id in self.library_service.item_cache:
+					continue
+				self.prefetched[item_id] = True
+				self.prefetched.move_to_end(item_id)
+				while len(self.prefetched) > MAX_TRACKED:
+					self.prefetched.popitem(last=False)
+				self.counts["prefetched"] += 1
+			self._prefetch(item_id)
+
+	def _prefetch(self, item_id):
+		try:
+			self.library_service.get_cached_library_item(item_id)
+			self.library_service.get_cached_media_progress(item_id)
+		except Exception as e:
+			xbmc.log("Failed to prefetch {}: {}".format(item_id, str(e)), xbmc.LOGDEBUG)
+
+	def log_summary(self):
+		with self.condition:
+			counts = dict(self.counts)
+		opened = counts["hit"] + counts["in_flight"] + counts["miss"]
+		hit_rate = counts["hit"] * 100.0 / opened if opened else 0.0
+		xbmc.log("Prefetch: {} items fetched ({} never opened), {} cancelled by focus changes, {} opened: {} ready ({:.0f}%), {} still loading, {} missed".format(
+			counts["prefetched"], counts["prefetched"] - counts["used"], counts["cancelled"], opened, counts["hit"], hit_rate,
+			counts["in_flight"], counts["miss"]), xbmc.LOGINFO)
+
+	def shutdown(self):
+		with self.condition:
+			self.stopping = True
+			self.condition.notify()
+		self.log_summary()
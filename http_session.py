@@ -0,0 +1,104 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from circuit_breaker import CircuitBreaker
+
+DEFAULT_POOL_SIZE = 10
+CONNECT_TIMEOUT = 3.05  # seconds, slightly above a multiple of the 3s TCP retransmit window
+# Read timeouts: the user waits for interactive calls, background calls may take longer
+INTERACTIVE_TIMEOUT = (CONNECT_TIMEOUT, 10)
+BACKGROUND_TIMEOUT = (CONNECT_TIMEOUT, 30)
+# Gateway errors of a reverse proxy in front of a server that is down
+SERVER_DOWN_STATUSES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_session_options = {"pool_size": DEFAULT_POOL_SIZE, "keep_alive": True}
+
+
+class ServerSession(requests.Session):
+	"""Session shared by all services.
+
+	Requests without an explicit timeout get the interactive one, failures feed
+	the circuit breaker, and every request is recorded in stats once a
+	RequestStats is assigned.
+	"""
+
+	stats = None
+	breaker = None
+	timeout = INTERACTIVE_TIMEOUT
+
+	def request(self, method, url, *args, **kwargs):
+		kwargs.setdefault("timeout", self.timeout)
+		breaker = self.breaker
+		if breaker is not None:
+			breaker.before_request(url)
+
+		stats = self.stats
+		started = time.perf_counter()
+		try:
+			response = super().request(method, url, *args, **kwargs)
+		except (requests.ConnectionError, requests.Timeout):
+			if breaker is not None:
+				breaker.record_failure(url)
+			if stats is not None:
+				stats.record(method, url, (time.perf_counter() - started) * 1000)
+			raise
+		except Exception:
+			if stats is not None:
+				stats.record(method, url, (time.perf_counter() - started) * 1000)
+			raise
+
+		if breaker is not None:
+			if response.status_code in SERVER_DOWN_STATUSES:
+				breaker.record_failure(url)
+			else:
+				breaker.record_success()
+
+		if stats is not None:
+			if kwargs.get("stream"):
+				# Reading the body here would defeat streaming, so rely on the announced size
+				size = int(response.headers.get("Content-Length") or 0)
+			else:
+				size = len(response.content)
+			stats.record(method, url, (time.perf_counter() - started) * 1000, response.status_code, size)
+		return response
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, keep_alive=True, breaker=True):
+	"""Create a session whose connections are pooled and kept alive between requests.
+
+	Sessions of background work that retries on its own pass breaker=False, so
+	their failures do not make the user interface fail fast.
+	"""
+	session = ServerSession()
+	if breaker:
+		session.breaker = CircuitBreaker()
+	adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	session.headers["Connection"] = "keep-alive" if keep_alive else "close"
+	return session
+
+
+def configure_session(pool_size=DEFAULT_POOL_SIZE, keep_alive=True):
+	"""Set pool size and keep-alive of the shared session, before anything uses it"""
+	with _session_lock:
+		if _session is not None:
+			raise RuntimeError("The shared session is already in use, configure it at startup")
+		_session_options.update(pool_size=pool_size, keep_alive=keep_alive)
+
+
+def get_session():
+	"""Return the session shared by all services, creating it on first use.
+
+	The connection pool of the session is thread-safe, so the player's background
+	threads can use it concurrently. Headers must only be changed while no
+	requests are in flight (i.e. when a service is set up).
+	"""
+	global _session
+	with _session_lock:
+		if _session is None:
+			_session = create_session(**_session_options)
+		return _session
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+
+class ItemCache:
+	"""Thread-safe cache of per-item data shared by the library view and the player.
+
+	Concurrent get_or_fetch calls for the same key share a single fetch. With
+	max_entries set, the least recently used entries are dropped beyond it.
+	"""
+
+	def __init__(self, max_entries=None):
+		self.lock = threading.Lock()
+		self.values = OrderedDict()
+		self.pending = {}
+		self.max_entries = max_entries
+
+	def __contains__(self, key):
+		with self.lock:
+			return key in self.values
+
+	def _store(self, key, value):
+		# Called with the lock held
+		self.values[key] = value
+		if self.max_entries is not None:
+			self.values.move_to_end(key)
+			while len(self.values) > self.max_entries:
+				self.values.popitem(last=False)
+
+	def get(self, key, default=None):
+		with self.lock:
+			if key not in self.values:
+				return default
+			if self.max_entries is not None:
+				self.values.move_to_end(key)
+			return self.values[key]
+
+	def put(self, key, value):
+		with self.lock:
+			self._store(key, value)
+
+	def update(self, values):
+		with self.lock:
+			for key, value in values.items():
+				self._store(key, value)
+
+	def invalidate(self, key):
+		with self.lock:
+			self.values.pop(key, None)
+
+	def is_pending(self, key):
+		"""Return whether a fetch for key is in flight"""
+		with self.lock:
+			return key in self.pending
+
+	def get_or_fetch(self, key, fetch):
+		"""Return the cached value for key, calling fetch() once if it is missing"""
+		with self.lock:
+			if key in self.values:
+				if self.max_entries is not None:
+					self.values.move_to_end(key)
+				return self.values[key]
+			event = self.pending.get(key)
+			owner = event is None
+			if owner:
+				event = threading.Event()
+				self.pending[key] = event
+
+		if not owner:
+			event.wait()
+			with self.lock:
+				if key in self.values:
+					return self.values[key]
+			# The other fetch failed, try on our own
+			return fetch()
+
+		try:
+			value = fetch()
+			with self.lock:
+				self._store(key, value)
+			return value
+		finally:
+			with self.lock:
+				self.pending.pop(key, None)
+			event.set()
@@ -0,0 +1,85 @@
+import codecs
+import json
+import re
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class JsonArrayStream:
+	"""Decodes the elements of one array of a JSON object while its bytes arrive.
+
+	Iterating yields the elements of the array under key one by one, so only the
+	element being decoded and one chunk are held in memory instead of the whole
+	document. The other fields of the object (e.g. total) are available in
+	envelope once iteration has finished.
+	"""
+
+	# Whitespace and the commas between elements
+	SEPARATORS = re.compile(r"[ \t\n\r,]*")
+
+	def __init__(self, chunks, key):
+		self.chunks = chunks
+		self.key_pattern = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+		# Decoding element by element loses the key sharing json.loads does for a
+		# whole document, so share the keys across all elements here
+		keys = {}
+		self.decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: {keys.setdefault(key, key): value for key, value in pairs})
+		self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+		self.envelope = None
+		self.count = 0
+
+	def _read(self):
+		"""Return the next piece of text, or None at the end of the stream"""
+		for chunk in self.chunks:
+			text = self.text_decoder.decode(chunk)
+			if text:
+				return text
+		return None
+
+	def __iter__(self):
+		buffer = ""
+		# Everything before the array, kept to decode the envelope at the end
+		while True:
+			match = self.key_pattern.search(buffer)
+			if match:
+				break
+			text = self._read()
+			if text is None:
+				raise ValueError("Array not found in JSON stream")
+			buffer += text
+		prefix = buffer[:match.end() - 1]
+		buffer = buffer[match.end():]
+		position = 0
+
+		while True:
+			position = self.SEPARATORS.match(buffer, position).end()
+			if position < len(buffer) and buffer[position] == "]":
+				position += 1
+				break
+			try:
+				element, end = self.decoder.raw_decode(buffer, position)
+				# A number at the end of the buffer might still be incomplete
+				complete = end < len(buffer)
+			except ValueError:
+				complete = False
+
+			if not complete:
+				text = self._read()
+				if text is None:
+					raise ValueError("JSON stream ended inside the array")
+				buffer = buffer[position:] + text
+				position = 0
+				continue
+
+			self.count += 1
+			yield element
+			position = end
+
+		# The rest of the object is small, decode it with the array left out
+		tail = [buffer[position:]]
+		while True:
+			text = self._read()
+			if text is None:
+				break
+			tail.append(text)
+		self.envelope = json.loads(prefix + "null" + "".join(tail))
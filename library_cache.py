@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import xbmc
+from file_utils import atomic_write_json
+
+SCHEMA_VERSION = 2  # 2: items are stored minified
+CACHE_FILE_NAME = "library_cache.json"
+
+
+class LibraryCache:
+	"""Persistent on-disk cache of library items keyed by id.
+
+	Each library entry stores the items in server order together with the
+	newest updatedAt seen, so later syncs only need the items changed since.
+	An entry whose order is no longer known is marked for a full sync.
+	"""
+
+	def __init__(self, cache_dir):
+		self.path = os.path.join(cache_dir, CACHE_FILE_NAME)
+		self.lock = threading.RLock()
+		self.synced_libraries = set()  # Libraries already synced during this session
+		self.libraries = self._load()
+
+	def _load(self):
+		try:
+			with open(self.path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError) as e:
+			xbmc.log("Library cache is corrupt, starting from scratch: {}".format(str(e)), xbmc.LOGWARNING)
+			return {}
+
+		if not isinstance(data, dict) or data.get("version") != SCHEMA_VERSION:
+			xbmc.log("Library cache has an unknown schema version, starting from scratch", xbmc.LOGINFO)
+			return {}
+		return data.get("libraries") or {}
+
+	def save(self):
+		with self.lock:
+			data = {"version": SCHEMA_VERSION, "libraries": self.libraries}
+			try:
+				atomic_write_json(self.path, data, separators=(",", ":"))
+			except OSError as e:
+				xbmc.log("Failed to write library cache: {}".format(str(e)), xbmc.LOGERROR)
+
+	def has_library(self, library_id):
+		return library_id in self.libraries
+
+	def is_synced(self, library_id):
+		return library_id in self.synced_libraries
+
+	def mark_synced(self, library_id):
+		self.synced_libraries.add(library_id)
+
+	def needs_full_sync(self, library_id):
+		"""Return whether items were added in an unknown position, so only a full listing restores the order"""
+		return bool(self.libraries[library_id].get("unordered"))
+
+	def last_updated_at(self, library_id):
+		return self.libraries[library_id]["last_updated_at"]
+
+	def count(self, library_id):
+		return len(self.libraries[library_id]["items"])
+
+	def get_items(self, library_id, start=0, stop=None):
+		"""Return the cached items of a library in server order, optionally only a slice of them"""
+		with self.lock:
+			entry = self.libraries.get(library_id)
+			if not entry:
+				return []
+			items = entry["items"]
+			return [items[iid] for iid in entry["order"][start:stop]]
+
+	def replace(self, library_id, items):
+		"""Replace all cached items of a library with a full listing, consuming items in a single pass"""
+		entry = {"last_updated_at": 0, "order": [], "items": {}}
+		for item in items:
+			entry["order"].append(item["id"])
+			entry["items"][item["id"]] = item
+			entry["last_updated_at"] = max(entry["last_updated_at"], item.get("updatedAt") or 0)
+		with self.lock:
+			self.libraries[library_id] = entry
+
+	def patch(self, library_id, item):
+		"""Replace a single item pushed by the server, or append a new one and mark the library for a full sync.
+
+		The position of a new item in the server's order is not known, it is
+		shown at the end until the next access replaces the listing. The sync
+		position is left alone, so the next delta sync still fetches
+		everything changed since the last sync and nothing can be skipped.
+		"""
+		with self.lock:
+			entry = self.libraries.get(library_id)
+			if not entry:
+				return False
+			if item["id"] not in entry["items"]:
+				entry["order"].append(item["id"])
+				entry["unordered"] = True
+				self.synced_libraries.discard(library_id)
+			entry["items"][item["id"]] = item
+			return True
+
+	def remove(self, library_id, item_id):
+		with self.lock:
+			entry = self.libraries.get(library_id)
+			if not entry or item_id not in entry["items"]:
+				return False
+			del entry["items"][item_id]
+			entry["order"].remove(item_id)
+			return True
+
+	def merge(self, library_id, changed_items):
+		"""Merge changed items into the cache and return how many were not seen before.
+
+		New items are appended and the library is marked for a full sync, as
+		with patch(), since a delta sorted by updatedAt does not tell their
+		place in the server's order.
+		"""
+		added = 0
+		with self.lock:
+			entry = self.libraries[library_id]
+			for item in changed_items:
+				if item["id"] not in entry["items"]:
+					entry["order"].append(item["id"])
+					entry["unordered"] = True
+					added += 1
+				entry["items"][item["id"]] = item
+				entry["last_updated_at"] = max(entry["last_updated_at"], item.get("updatedAt") or 0)
+		return added
@@ -0,0 +1,79 @@
+import threading
+import xbmc
+
+
+class LibraryPager:
+	"""List-like view of a library that pulls server pages on demand.
+
+	Supports len() and indexing/slicing like the plain list it replaces, so the
+	GUI can page through it unchanged. Only the pages up to the highest index
+	accessed (plus one page read ahead in the background) are kept in memory.
+	"""
+
+	def __init__(self, iter_pages, convert_item, page_size):
+		# iter_pages(start_page) returns a generator of (results, total) tuples
+		self.iter_pages = iter_pages
+		self.convert_item = convert_item
+		self.page_size = page_size
+		self.items = []
+		self.total = None
+		self.exhausted = False
+		self.page_iter = None
+		self.lock = threading.RLock()
+		self.read_ahead_thread = None
+
+	def __len__(self):
+		if self.total is None:
+			self._ensure_loaded(0)
+		return self.total or 0
+
+	def __getitem__(self, key):
+		if isinstance(key, slice):
+			start, stop, step = key.indices(len(self))
+			self._ensure_loaded(stop - 1)
+			self.read_ahead(stop)
+			return self.items[start:stop:step]
+
+		if key < 0:
+			key += len(self)
+		self._ensure_loaded(key)
+		return self.items[key]
+
+	def _ensure_loaded(self, index):
+		"""Pull pages from the server until the item at index is available"""
+		with self.lock:
+			while len(self.items) <= index and not self.exhausted:
+				if self.page_iter is None:
+					self.page_iter = self.iter_pages(len(self.items) // self.page_size)
+				try:
+					results, total = next(self.page_iter)
+				except StopIteration:
+					self.exhausted = True
+					break
+				except Exception as e:
+					xbmc.log("Failed to load library page: {}".format(str(e)), xbmc.LOGERROR)
+					# Restart from the next missing page on the following access
+					self.page_iter = None
+					break
+
+				self.total = total
+				self.items.extend(self.convert_item(item) for item in results)
+				if len(self.items) >= total:
+					self.exhausted = True
+
+			if self.total is None and self.exhausted:
+				self.total = len(self.items)
+
+	def load_all(self):
+		"""Pull all remaining pages, e.g. before searching the whole library"""
+		self._ensure_loaded(float("inf"))
+
+	def read_ahead(self, index):
+		"""Load the page following index on a background thread"""
+		if self.exhausted or len(self.items) > index:
+			return
+		if self.read_ahead_thread and self.read_ahead_thread.is_alive():
+			return
+		self.read_ahead_thread = threading.Thread(target=self._ensure_loaded, args=(index + self.page_size - 1,))
+		self.read_ahead_thread.daemon = True
+		self.read_ahead_thread.start()
@@ -1,6 +1,18 @@
-import requests
 import xbmc
 import json
+import threading
+import base64
+import requests
+from http_session import get_session, BACKGROUND_TIMEOUT
+from library_cache import LibraryCache
+from episode_index import EpisodeIndex
+from item_cache import ItemCache
+from json_stream import JsonArrayStream, DEFAULT_CHUNK_SIZE
+
+SUPPORTED_MIME_TYPES = ["audio/flac", "audio/mpeg", "audio/mp4"]
+DELTA_PAGE_SIZE = 50
+RECENT_EPISODES_PAGE_SIZE = 50
+ITEM_CACHE_SIZE = 200  # Full items with chapters, kept for recently focused and opened books
 
 class AudioBookShelfLibraryService:
 	_instance = None
@@ -13,17 +25,42 @@ class AudioBookShelfLibraryService:
 			cls._instance = super(AudioBookShelfLibraryService, cls).__new__(cls)
 		return cls._instance
 
-	def __init__(self, base_url=None, token=None):
+	def __init__(self, base_url=None, token=None, cache_dir=None):
 		if not hasattr(self, 'initialized'):
 			self.token = token
+			self.library_cache = LibraryCache(cache_dir) if cache_dir else None
+			self.sync_threads = {}  # Background full syncs of library listings
+			self.delta_syncs = set()  # Libraries whose delta sync is running
+			self.episode_index = EpisodeIndex(cache_dir)
+			# Per-item details and progress shared by the library view and the player
+			self.item_cache = ItemCache(ITEM_CACHE_SIZE)
+			self.progress_cache = ItemCache()
+			self.progress_index_complete = False
 			self.base_url = base_url
 			self.headers = self.HEADERS_TEMPLATE.copy()
-			self.headers["Authorization"] = "Bearer {}".format(token)
+			# Headers and auth are set once on the shared keep-alive session
+			self.session = get_session()
+			self.set_token(token)
 			self.initialized = True
 
+	def set_token(self, token):
+		"""Switch to another token, only while no requests are in flight (i.e. during startup).
+
+		Without a token no Authorization header is sent, so login requests on the
+		shared session do not carry a stale one.
+		"""
+		self.token = token
+		if token:
+			self.headers["Authorization"] = "Bearer {}".format(token)
+		else:
+			self.headers.pop("Authorization", None)
+			self.session.headers.pop("Authorization", None)
+		self.session.headers.update(self.headers)
+
 	def get_all_libraries(self):
 		url = "{}/api/libraries".format(self.base_url)
-		response = requests.get(url, headers=self.headers)
+		response = self.session.get(url)
+		response.raise_for_status()
 		return response.json()
 
 	def get_library(self, library_id, include_filterdata=False):
@@ -32,10 +69,135 @@ class AudioBookShelfLibraryService:
 		if include_filterdata:
 			params["include"] = "filterdata"
 		
-		response = requests.get(url, headers=self.headers, params=params)
+		response = self.session.get(url, params=params)
+		return response.json()
+
+	def get_library_genres(self, library_id):
+		data = self.get_library(library_id, include_filterdata=True)
+		return (data.get("filterdata") or {}).get("genres") or []
+
+	def get_library_personalized(self, library_id, limit=None):
+		"""Return the personalized shelves of a library (continue listening, recently added, ...)"""
+		url = "{}/api/libraries/{}/personalized".format(self.base_url, library_id)
+		params = {}
+		if limit is not None:
+			params["limit"] = limit
+
+		response = self.session.get(url, params=params)
+		response.raise_for_status()
 		return response.json()
 
+	def get_continue_listening(self, library_id, limit=None):
+		for shelf in self.get_library_personalized(library_id, limit):
+			if shelf.get("id") == "continue-listening":
+				return shelf.get("entities") or []
+		return []
+
+	@staticmethod
+	def encode_filter(group, value):
+		"""Encode a library filter the way the server expects it, e.g. progress.<base64 of in-progress>"""
+		return "{}.{}".format(group, base64.b64encode(value.encode("utf-8")).decode("ascii"))
+
 	def get_library_items(self, library_id, limit=None, page=None, sort=None, desc=None, filter=None, minified=None, collapseseries=None, include=None):
+		# Plain listings are served from the persistent cache of minified items, synced with the server once per session
+		if self.library_cache and sort is None and filter is None and collapseseries is None and include is None:
+			return self._get_cached_library_items(library_id, limit, page)
+		return self._fetch_library_items(library_id, limit, page, sort, desc, filter, minified, collapseseries, include)
+
+	def _get_cached_library_items(self, library_id, limit=None, page=None):
+		cache = self.library_cache
+		delta_sync = False
+		with cache.lock:
+			if not cache.is_synced(library_id) and not self._is_syncing(library_id) and library_id not in self.delta_syncs:
+				if cache.has_library(library_id) and not cache.needs_full_sync(library_id):
+					self.delta_syncs.add(library_id)
+					delta_sync = True
+				else:
+					self._start_full_sync(library_id)
+		# The lock is only taken to merge, so the realtime listener and other pages are not held up by the requests
+		if delta_sync:
+			try:
+				self._sync_library_cache(library_id)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				# Serve the last known listing, the next access tries to sync again
+				xbmc.log("Library sync failed, showing cached items: {}".format(str(e)), xbmc.LOGWARNING)
+			finally:
+				with cache.lock:
+					self.delta_syncs.discard(library_id)
+		with cache.lock:
+			if cache.has_library(library_id):
+				total = cache.count(library_id)
+				if limit:
+					start = (page or 0) * limit
+					items = cache.get_items(library_id, start, start + limit)
+				else:
+					items = cache.get_items(library_id)
+				return {"results": items, "total": total, "limit": limit or 0, "page": page or 0}
+		# Nothing cached yet: pages come from small requests until the full listing is in the cache
+		return self._fetch_library_items(library_id, limit, page, minified=1)
+
+	def _sync_library_cache(self, library_id):
+		"""Bring the cached listing of a library up to date with as few requests as possible"""
+		cache = self.library_cache
+		# Fetch items by most recent update until reaching items already in the cache
+		with cache.lock:
+			last_updated_at = cache.last_updated_at(library_id)
+		changed_items = []
+		total = None
+		page = 0
+		while True:
+			response = self._fetch_library_items(library_id, limit=DELTA_PAGE_SIZE, page=page, sort="updatedAt", desc=1, minified=1)
+			results = response.get("results") or []
+			total = response.get("total", 0)
+			newer = [item for item in results if (item.get("updatedAt") or 0) > last_updated_at]
+			changed_items.extend(newer)
+			page += 1
+			if len(newer) < len(results) or not results or page * DELTA_PAGE_SIZE >= total:
+				break
+
+		with cache.lock:
+			added = cache.merge(library_id, changed_items)
+			xbmc.log("Library cache delta sync: {} changed items, {} of them new".format(len(changed_items), added), xbmc.LOGINFO)
+			if not added and cache.count(library_id) == total:
+				cache.mark_synced(library_id)
+				if changed_items:
+					cache.save()
+				return
+			# New items have no known place in the server's order and differing counts mean items were removed,
+			# the listing stays as it is until the full sync is done
+			xbmc.log("Library cache order or count differs from the server, running full sync", xbmc.LOGINFO)
+			self._start_full_sync(library_id)
+
+	def _is_syncing(self, library_id):
+		thread = self.sync_threads.get(library_id)
+		return thread is not None and thread.is_alive()
+
+	def _start_full_sync(self, library_id):
+		thread = threading.Thread(target=self._full_sync, args=(library_id,))
+		thread.daemon = True
+		self.sync_threads[library_id] = thread
+		thread.start()
+
+	def _full_sync(self, library_id):
+		# One streamed request, the items go into the cache as they are decoded
+		cache = self.library_cache
+		try:
+			stream = self.stream_library_items(library_id)
+			cache.replace(library_id, stream)
+		except (requests.RequestException, ValueError) as e:
+			# The next page access starts another attempt
+			xbmc.log("Library full sync failed: {}".format(str(e)), xbmc.LOGWARNING)
+			return
+		xbmc.log("Library cache full sync: {} items".format(stream.count), xbmc.LOGINFO)
+		cache.mark_synced(library_id)
+		cache.save()
+
+	def wait_for_sync(self, timeout=None):
+		"""Wait for background syncs of library listings to finish"""
+		for thread in list(self.sync_threads.values()):
+			thread.join(timeout)
+
+	def _fetch_library_items(self, library_id, limit=None, page=None, sort=None, desc=None, filter=None, minified=None, collapseseries=None, include=None):
 		url = "{}/api/libraries/{}/items".format(self.base_url, library_id)
 		params = {}
 		
@@ -56,9 +218,128 @@ class AudioBookShelfLibraryService:
 		if include is not None:
 			params["include"] = include
 			
-		response = requests.get(url, headers=self.headers, params=params)
+		response = self.session.get(url, params=params)
+		return response.json()
+
+	def stream_library_items(self, library_id, sort=None, desc=None, filter=None, chunk_size=DEFAULT_CHUNK_SIZE):
+		"""Return a JsonArrayStream over all minified items of a library, decoded while they download.
+
+		The response is compressed by the server, requests inflates it chunk by
+		chunk, so neither the compressed nor the decoded document is ever held in
+		memory as a whole. The total is in stream.envelope after iterating.
+		"""
+		url = "{}/api/libraries/{}/items".format(self.base_url, library_id)
+		params = {"minified": 1}
+		if sort is not None:
+			params["sort"] = sort
+		if desc is not None:
+			params["desc"] = desc
+		if filter is not None:
+			params["filter"] = filter
+
+		response = self.session.get(url, params=params, stream=True)
+		response.raise_for_status()
+
+		def chunks():
+			try:
+				for chunk in response.iter_content(chunk_size):
+					yield chunk
+			finally:
+				response.close()
+		return JsonArrayStream(chunks(), "results")
+
+	def iter_library_items(self, library_id, limit, start_page=0, **kwargs):
+		"""Yield (results, total) page by page, requesting each page only when it is consumed"""
+		page = start_page
+		while True:
+			response = self.get_library_items(library_id, limit=limit, page=page, **kwargs)
+			results = response.get("results") or []
+			total = response.get("total", 0)
+			yield results, total
+			page += 1
+			if not results or page * limit >= total:
+				return
+
+	def get_recent_episodes(self, library_id, limit=None, page=None):
+		"""Return the newest episodes of all podcasts of a library, each with its libraryItemId"""
+		url = "{}/api/libraries/{}/recent-episodes".format(self.base_url, library_id)
+		params = {}
+		if limit is not None:
+			params["limit"] = limit
+		if page is not None:
+			params["page"] = page
+
+		response = self.session.get(url, params=params)
+		response.raise_for_status()
 		return response.json()
 
+	def get_podcast_episodes(self, library_id, show_id, num_episodes=None, start=0, stop=None):
+		"""Return a slice of the episodes of a podcast, newest first, and their total.
+
+		Episodes come from the persistent episode index. A show is fetched as a
+		whole only the first time and when num_episodes (from the library
+		listing) disagrees with the index, otherwise the index is refreshed from
+		the recent episodes of the library once per session. Requests run
+		outside the index lock, and any failed request falls back to the
+		indexed episodes of a show that is in the index.
+		"""
+		index = self.episode_index
+		try:
+			with index.lock:
+				sync_recent = index.has_library(library_id) and not index.is_synced(library_id)
+			if sync_recent:
+				self._sync_recent_episodes(library_id)
+			with index.lock:
+				fetch_show = index.needs_fetch(library_id, show_id, num_episodes)
+			if fetch_show:
+				item = self.get_library_item_by_id(show_id)
+				with index.lock:
+					index.replace_show(library_id, show_id, item["media"].get("episodes") or [])
+					index.mark_synced(library_id)
+					xbmc.log("Episode index of {}: {} episodes fetched".format(show_id, index.count(library_id, show_id)), xbmc.LOGINFO)
+					index.save()
+		except requests.RequestException as e:
+			with index.lock:
+				indexed = index.has_show(library_id, show_id)
+			if not indexed:
+				raise
+			xbmc.log("Episode sync failed, showing indexed episodes: {}".format(str(e)), xbmc.LOGWARNING)
+		with index.lock:
+			return index.get_episodes(library_id, show_id, start, stop), index.count(library_id, show_id)
+
+	def _sync_recent_episodes(self, library_id):
+		"""Add the episodes published since the last session to the indexed shows"""
+		index = self.episode_index
+		with index.lock:
+			last_published_at = index.last_published_at(library_id)
+		recent = []
+		page = 0
+		while True:
+			response = self.get_recent_episodes(library_id, limit=RECENT_EPISODES_PAGE_SIZE, page=page)
+			episodes = response.get("episodes") or []
+			newer = [episode for episode in episodes if (episode.get("publishedAt") or 0) > last_published_at]
+			recent.extend(newer)
+			page += 1
+			if len(newer) < len(episodes) or len(episodes) < RECENT_EPISODES_PAGE_SIZE:
+				break
+
+		with index.lock:
+			added = index.merge_recent(library_id, recent)
+			index.mark_synced(library_id)
+			if recent:
+				index.save()
+		xbmc.log("Episode index delta sync: {} new episodes, {} of indexed shows".format(len(recent), added), xbmc.LOGINFO)
+
+	def iter_podcast_episodes(self, library_id, show_id, limit, start_page=0, num_episodes=None):
+		"""Yield (episodes, total) page by page from the episode index"""
+		page = start_page
+		while True:
+			episodes, total = self.get_podcast_episodes(library_id, show_id, num_episodes, page * limit, (page + 1) * limit)
+			yield episodes, total
+			page += 1
+			if not episodes or page * limit >= total:
+				return
+
 	def get_library_item_by_id(self, item_id, expanded=None, include=None, episode=None):
 		url = "{}/api/items/{}".format(self.base_url, item_id)
 		params = {}
@@ -70,9 +351,22 @@ class AudioBookShelfLibraryService:
 		if episode is not None:
 			params["episode"] = episode
 		
-		response = requests.get(url, headers=self.headers, params=params)
+		response = self.session.get(url, params=params)
 		return response.json()
 
+	def download_cover(self, item_id, width=None, height=None):
+		"""Download the cover of an item, resized by the server when width/height are given"""
+		url = "{}/api/items/{}/cover".format(self.base_url, item_id)
+		params = {"format": "jpeg"}
+		if width is not None:
+			params["width"] = width
+		if height is not None:
+			params["height"] = height
+
+		response = self.session.get(url, params=params)
+		response.raise_for_status()
+		return response.content
+
 	def play_library_item_by_id(self, item_id, episode_id=None, device_info=None, force_direct_play=False, force_transcode=False, supported_mime_types=None, media_player="unknown"):
 		if episode_id:
 			url = "{}/api/items/{}/play/{}".format(self.base_url, item_id, episode_id)
@@ -91,31 +385,55 @@ class AudioBookShelfLibraryService:
 		if supported_mime_types:
 			payload["supportedMimeTypes"] = supported_mime_types
 
-		response = requests.post(url, headers=self.headers, json=payload)
+		response = self.session.post(url, json=payload)
 
 		if response.status_code != 200:
 			raise Exception("Error fetching item by ID. Status code: {}".format(response.status_code))
 
 		return response.json()
 
-	def get_file_url(self, iid):
-		response = self.play_library_item_by_id(iid, supported_mime_types=["audio/flac", "audio/mpeg", "audio/mp4"])
+	def open_play_session(self, iid, episode_id=None):
+		"""Start a server playback session; its id is used to sync and close it later"""
+		return self.play_library_item_by_id(iid, episode_id, supported_mime_types=SUPPORTED_MIME_TYPES)
 
+	def get_session_file_url(self, session):
 		full_content_url = None
-		if "audioTracks" in response and len(response["audioTracks"]) > 0:
-			relative_content_url = response["audioTracks"][0]["contentUrl"]
+		if "audioTracks" in session and len(session["audioTracks"]) > 0:
+			relative_content_url = session["audioTracks"][0]["contentUrl"]
 			full_content_url = "{}{}?token={}".format(self.base_url, relative_content_url, self.token)
 
 		if not full_content_url:
 			raise Exception("Content URL not found or empty.")
-		return full_content_url  
+		return full_content_url
+
+	def get_session_track_urls(self, session):
+		"""Return the content URLs of all audio tracks of a session, ordered by their startOffset"""
+		tracks = sorted(session.get("audioTracks") or [], key=lambda track: track.get("startOffset") or 0.0)
+		if not tracks:
+			raise Exception("Content URL not found or empty.")
+		return ["{}{}?token={}".format(self.base_url, track["contentUrl"], self.token) for track in tracks]
+
+	def get_file_url(self, iid):
+		return self.get_session_file_url(self.open_play_session(iid))
+
+	def sync_session(self, session_id, data):
+		"""Report currentTime, timeListened and duration of an open playback session"""
+		url = "{}/api/session/{}/sync".format(self.base_url, session_id)
+		response = self.session.post(url, json=data, timeout=BACKGROUND_TIMEOUT)
+		response.raise_for_status()
+
+	def close_session(self, session_id, data=None):
+		"""Close a playback session, optionally with a final sync of its position"""
+		url = "{}/api/session/{}/close".format(self.base_url, session_id)
+		response = self.session.post(url, json=data, timeout=BACKGROUND_TIMEOUT)
+		response.raise_for_status()
 
 	def get_media_progress(self, library_item_id, episode_id=None):
 		endpoint = "/api/me/progress/{}".format(library_item_id)
 		if episode_id:
 			endpoint += "/{}".format(episode_id)
 
-		response = requests.get(self.base_url + endpoint, headers=self.headers)
+		response = self.session.get(self.base_url + endpoint)
 		response.raise_for_status()
 
 		try:
@@ -130,7 +448,7 @@ class AudioBookShelfLibraryService:
 		if episode_id:
 			endpoint += "/{}".format(episode_id)
 
-		response = requests.patch(self.base_url + endpoint, headers=self.headers, json=data)
+		response = self.session.patch(self.base_url + endpoint, json=data, timeout=BACKGROUND_TIMEOUT)
 		response.raise_for_status()
 
 		try:
@@ -139,8 +457,47 @@ class AudioBookShelfLibraryService:
 			xbmc.log("Ungültige oder leere JSON-Antwort erhalten:", xbmc.LOGERROR)
 			return {'message': 'Failed to decode JSON'}
 
+	def batch_update_media_progress(self, updates):
+		"""Update the progress of several items at once, each update carrying its libraryItemId"""
+		url = "{}/api/me/progress/batch/update".format(self.base_url)
+		response = self.session.patch(url, json=updates, timeout=BACKGROUND_TIMEOUT)
+		response.raise_for_status()
+
+	def get_me(self):
+		url = "{}/api/me".format(self.base_url)
+		response = self.session.get(url)
+		response.raise_for_status()
+		return response.json()
+
+	def get_all_media_progress(self):
+		"""Fetch all media progress of the user in one call, indexed by (libraryItemId, episodeId)"""
+		progress_index = {}
+		for progress in self.get_me().get("mediaProgress") or []:
+			key = (progress.get("libraryItemId"), progress.get("episodeId") or None)
+			progress_index[key] = progress
+
+		self.progress_cache.update(progress_index)
+		self.progress_index_complete = True
+		return progress_index
+
+	def get_cached_media_progress(self, library_item_id, episode_id=None):
+		"""Return the progress of an item from the shared cache, requesting it only if unknown"""
+		def fetch():
+			# Items missing from a complete bulk index have no progress yet
+			if self.progress_index_complete:
+				return {}
+			return self.get_media_progress(library_item_id, episode_id)
+		return self.progress_cache.get_or_fetch((library_item_id, episode_id or None), fetch)
+
+	def cache_media_progress(self, library_item_id, data, episode_id=None):
+		"""Record locally saved progress so later reads do not need the server"""
+		self.progress_cache.put((library_item_id, episode_id or None), data)
+
+	def get_cached_library_item(self, library_item_id):
+		return self.item_cache.get_or_fetch(library_item_id, lambda: self.get_library_item_by_id(library_item_id))
+
 	def get_chapters(self, library_item_id):
-		item = self.get_library_item_by_id(library_item_id)
+		item = self.get_cached_library_item(library_item_id)
 		chapters = item['media']['chapters']
 		return chapters
 
@@ -1,8 +1,9 @@
-import requests
+from http_session import get_session
 
 class AudioBookShelfService:
 	def __init__(self, base_url):
 		self.base_url = base_url
+		self.session = get_session()
 
 	def login(self, username, password):
 		url = "{}/login".format(self.base_url)
@@ -10,7 +11,22 @@ class AudioBookShelfService:
 			"username": username,
 			"password": password
 		}
-		return self._post(url, payload).get("user")
+		# Servers with refresh token support only return it when asked to
+		return self._post(url, payload, headers={"x-return-tokens": "true"}).get("user")
+
+	def authorize(self, token):
+		"""Validate a stored token, raising an HTTPError with status 401 if it is no longer accepted"""
+		url = "{}/api/authorize".format(self.base_url)
+		return self._post(url, headers={"Authorization": "Bearer {}".format(token)}).get("user")
+
+	def refresh(self, refresh_token):
+		url = "{}/auth/refresh".format(self.base_url)
+		return self._post(url, headers={"x-refresh-token": refresh_token}).get("user")
+
+	@staticmethod
+	def get_tokens(user):
+		"""Return the access and refresh token of a user, older servers only have a single token"""
+		return user.get("accessToken") or user.get("token"), user.get("refreshToken")
 
 	def logout(self, socketId=None):
 		url = "{}/logout".format(self.base_url)
@@ -41,13 +57,12 @@ class AudioBookShelfService:
 		url = "{}/healthcheck".format(self.base_url)
 		self._get(url)
 
-	def _post(self, url, payload=None):
-		headers = {"Content-Type": "application/json"}
-		response = requests.post(url, headers=headers, json=payload)
+	def _post(self, url, payload=None, headers=None):
+		response = self.session.post(url, json=payload, headers=headers)
 		response.raise_for_status()
 		return response.json()
 
 	def _get(self, url):
-		response = requests.get(url)
+		response = self.session.get(url)
 		response.raise_for_status()
 		return response.json()
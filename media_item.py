@@ -1,69 +1,189 @@
-from typing import List, Optional
+import sys
+import time
+from typing import Optional
 
 
 class Metadata:
-    def __init__(self, title: str, title_ignore_prefix: Optional[str] = None,
-                 subtitle: Optional[str] = None, author_name: str = '',
-                 author_name_lf: Optional[str] = None, narrator_name: Optional[str] = None,
-                 series_name: Optional[str] = None, genres: Optional[List[str]] = None,
-                 published_year: Optional[int] = None, published_date: Optional[str] = None,
-                 publisher: Optional[str] = None, description: Optional[str] = None,
-                 isbn: Optional[str] = None, asin: Optional[str] = None,
-                 language: Optional[str] = None, explicit: bool = False,
-                 abridged: bool = False) -> None:
+    # Only what the grid, the player dialog and the search index show; a large library keeps one per item
+    __slots__ = ('title', 'subtitle', 'author_name', 'narrator_name', 'series_name',
+                 'published_year', 'publisher', 'description')
+
+    def __init__(self, title: str, subtitle: Optional[str] = None, author_name: str = '',
+                 narrator_name: Optional[str] = None, series_name: Optional[str] = None,
+                 published_year: Optional[str] = None, publisher: Optional[str] = None,
+                 description: Optional[str] = None) -> None:
         self.title = title
-        self.title_ignore_prefix = title_ignore_prefix
         self.subtitle = subtitle
         self.author_name = author_name
-        self.author_name_lf = author_name_lf
         self.narrator_name = narrator_name
         self.series_name = series_name
-        self.genres = genres or []
         self.published_year = published_year
-        self.published_date = published_date
         self.publisher = publisher
         self.description = description
-        self.isbn = isbn
-        self.asin = asin
-        self.language = language
-        self.explicit = explicit
-        self.abridged = abridged
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Metadata':
+        """Build metadata from the minified items API, also accepting the full item format"""
+        narrator_name = data.get('narratorName')
+        if narrator_name is None and data.get('narrators'):
+            narrator_name = ', '.join(data['narrators'])
+        author_name = data.get('authorName')
+        if author_name is None and data.get('authors'):
+            author_name = ', '.join(author.get('name', '') for author in data['authors'])
+        if author_name is None:
+            # Podcasts only have the author of their feed
+            author_name = data.get('author')
+        return cls(
+            title=data.get('title') or '',
+            subtitle=data.get('subtitle'),
+            author_name=author_name or '',
+            narrator_name=narrator_name,
+            series_name=data.get('seriesName'),
+            published_year=data.get('publishedYear'),
+            publisher=data.get('publisher'),
+            description=data.get('description')
+        )
 
 
 class Media:
+    __slots__ = ('metadata', 'duration', 'num_episodes')
+
     def __init__(self, media_dict):
-        self.id = media_dict.get('id')
-        self.metadata = media_dict.get('metadata')
-        self.cover_path = media_dict.get('coverPath')
-        self.tags = media_dict.get('tags')
-        self.num_tracks = media_dict.get('numTracks')
-        self.num_audio_files = media_dict.get('numAudioFiles')
-        self.num_chapters = media_dict.get('numChapters')
-        self.num_missing_parts = media_dict.get('numMissingParts')
-        self.num_invalid_audio_files = media_dict.get('numInvalidAudioFiles')
+        self.metadata = Metadata.from_dict(media_dict.get('metadata') or {})
         self.duration = media_dict.get('duration')
-        self.size = media_dict.get('size')
-        self.ebook_format = media_dict.get('ebookFormat')
+        # Podcasts: minified items carry the count, full items the episodes
+        self.num_episodes = media_dict.get('numEpisodes')
+        if self.num_episodes is None and 'episodes' in media_dict:
+            self.num_episodes = len(media_dict['episodes'])
+
+    @classmethod
+    def from_dict(cls, media_dict: dict) -> 'Media':
+        return cls(media_dict)
 
 
 class Audiobook:
+    __slots__ = ('id', 'updated_at', 'media_type', 'media', 'current_time', 'progress')
+
+    # Books and podcasts are library items themselves, only episodes have an id of their own
+    episode_id = None
+
     def __init__(self, data):
         self.id = data.get('id')
-        self.ino = data.get('ino')
-        self.old_library_item_id = data.get('oldLibraryItemId')
-        self.library_id = data.get('libraryId')
-        self.folder_id = data.get('folderId')
-        self.path = data.get('path')
-        self.rel_path = data.get('relPath')
-        self.is_file = data.get('isFile')
-        self.mtime_ms = data.get('mtimeMs')
-        self.ctime_ms = data.get('ctimeMs')
-        self.birthtime_ms = data.get('birthtimeMs')
-        self.added_at = data.get('addedAt')
         self.updated_at = data.get('updatedAt')
-        self.is_missing = data.get('isMissing')
-        self.is_invalid = data.get('isInvalid')
-        self.media_type = data.get('mediaType')
+        media_type = data.get('mediaType')
+        # One shared string instead of a copy per parsed item
+        self.media_type = sys.intern(media_type) if media_type else media_type
         self.media = Media(data.get('media', {}))
-        self.num_files = data.get('numFiles')
-        self.size = data.get('size')
+        self.current_time = 0.0
+        self.progress = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict, progress: Optional[dict] = None) -> 'Audiobook':
+        """Build an audiobook from an item of the items API, joined with its media progress"""
+        audiobook = cls(data)
+        if progress:
+            audiobook.current_time = float(progress.get('currentTime') or 0.0)
+            audiobook.progress = float(progress.get('progress') or 0.0)
+        return audiobook
+
+    @property
+    def title(self) -> str:
+        return self.media.metadata.title
+
+    @property
+    def is_podcast(self) -> bool:
+        return self.media_type == 'podcast'
+
+    @property
+    def description(self) -> str:
+        return self.media.metadata.description or ''
+
+    @property
+    def duration(self) -> float:
+        return self.media.duration or 0.0
+
+    @property
+    def narrator_label(self) -> str:
+        return "Narrator: {}".format(self.media.metadata.narrator_name or '')
+
+    @property
+    def published_year_label(self) -> str:
+        return "Year: {}".format(self.media.metadata.published_year or '')
+
+    @property
+    def publisher_label(self) -> str:
+        return "Publisher: {}".format(self.media.metadata.publisher or '')
+
+    def cover_url(self, base_url: str, token: str) -> str:
+        return "{}/api/items/{}/cover?token={}".format(base_url, self.id, token)
+
+
+class PodcastEpisode:
+    """An episode of a podcast, shown in the grid and played like a book.
+
+    id is the library item of the podcast, so the cover, playback session and
+    progress requests address the podcast together with episode_id.
+    """
+    __slots__ = ('podcast', 'episode_id', 'episode_title', 'subtitle', 'episode_description',
+                 'published_at', 'episode_duration', 'chapters', 'current_time', 'progress')
+
+    media_type = 'podcastEpisode'
+    is_podcast = False
+
+    def __init__(self, podcast: Audiobook, data: dict) -> None:
+        self.podcast = podcast
+        self.episode_id = data.get('id')
+        self.episode_title = data.get('title') or ''
+        self.subtitle = data.get('subtitle')
+        self.episode_description = data.get('description')
+        self.published_at = data.get('publishedAt')
+        self.episode_duration = data.get('duration')
+        self.chapters = data.get('chapters') or []
+        self.current_time = 0.0
+        self.progress = 0.0
+
+    @classmethod
+    def from_dict(cls, podcast: Audiobook, data: dict, progress: Optional[dict] = None) -> 'PodcastEpisode':
+        """Build an episode from the episode index, joined with its media progress"""
+        episode = cls(podcast, data)
+        if progress:
+            episode.current_time = float(progress.get('currentTime') or 0.0)
+            episode.progress = float(progress.get('progress') or 0.0)
+        return episode
+
+    @property
+    def id(self) -> str:
+        return self.podcast.id
+
+    @property
+    def updated_at(self):
+        return self.podcast.updated_at
+
+    @property
+    def title(self) -> str:
+        return self.episode_title
+
+    @property
+    def description(self) -> str:
+        return self.episode_description or self.subtitle or ''
+
+    @property
+    def duration(self) -> float:
+        return self.episode_duration or 0.0
+
+    @property
+    def narrator_label(self) -> str:
+        return "Podcast: {}".format(self.podcast.title)
+
+    @property
+    def published_year_label(self) -> str:
+        if not self.published_at:
+            return "Published: "
+        return "Published: {}".format(time.strftime('%d.%m.%Y', time.localtime(self.published_at / 1000)))
+
+    @property
+    def publisher_label(self) -> str:
+        return "Author: {}".format(self.podcast.media.metadata.author_name or '')
+
+    def cover_url(self, base_url: str, token: str) -> str:
+        return self.podcast.cover_url(base_url, token)
@@ -0,0 +1,81 @@
+import threading
+import time
+import xbmc
+
+TICK_INTERVAL = 0.5  # seconds
+IDLE_TICKS_BEFORE_STOP = 4  # Tolerate short gaps, e.g. while the playlist switches files
+
+
+class PlaybackScheduler:
+	"""Runs periodic playback tasks on one background thread.
+
+	Each tick samples the player time once and hands it to every task that is
+	due. Starting an already running scheduler is a no-op, so repeated
+	play/pause cycles never stack threads.
+	"""
+
+	def __init__(self, player, get_time=None, tick_interval=TICK_INTERVAL):
+		self.player = player
+		self.get_time = get_time or player.getTime
+		self.tick_interval = tick_interval
+		self.tasks = []
+		self.lock = threading.Lock()
+		self.stop_event = threading.Event()
+		self.thread = None
+
+	def register(self, interval, callback):
+		"""Call callback(current_time) every interval seconds while playing"""
+		self.tasks.append([interval, callback, 0.0])
+
+	def is_running(self):
+		return self.thread is not None and self.thread.is_alive()
+
+	def start(self):
+		with self.lock:
+			if self.is_running() and not self.stop_event.is_set():
+				return
+			# Every run gets its own stop event so a stopping thread never sees a new run's event
+			self.stop_event = threading.Event()
+			for task in self.tasks:
+				task[2] = 0.0
+			self.thread = threading.Thread(target=self._run, args=(self.stop_event,))
+			self.thread.daemon = True
+			self.thread.start()
+
+	def stop(self, wait=True):
+		with self.lock:
+			self.stop_event.set()
+			thread = self.thread
+		if wait and thread and thread is not threading.current_thread():
+			thread.join(timeout=2)
+
+	def _run(self, stop_event):
+		monitor = xbmc.Monitor()
+		idle_ticks = 0
+		while not stop_event.is_set() and not monitor.abortRequested():
+			try:
+				current_time = self.get_time() if self.player.isPlayingAudio() else None
+			except RuntimeError:
+				current_time = None
+
+			if current_time is None:
+				idle_ticks += 1
+				if idle_ticks >= IDLE_TICKS_BEFORE_STOP:
+					break
+				if stop_event.wait(self.tick_interval):
+					break
+				continue
+			idle_ticks = 0
+
+			now = time.monotonic()
+			for task in self.tasks:
+				interval, callback, due = task
+				if now >= due:
+					task[2] = now + interval
+					try:
+						callback(current_time)
+					except Exception as e:
+						xbmc.log("Playback task failed: {}".format(str(e)), xbmc.LOGERROR)
+
+			if stop_event.wait(self.tick_interval):
+				break
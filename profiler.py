@@ -0,0 +1,153 @@
+import cProfile
+import functools
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+import xbmc
+
+PSTATS_FILE_NAME = "profile.pstats"
+TRACE_FILE_NAME = "trace.json"
+
+_profiler = None
+
+
+class Profiler:
+	"""Collects cProfile data of all profiled threads and spans for a Chrome trace"""
+
+	def __init__(self, output_dir):
+		self.output_dir = output_dir
+		self.lock = threading.Lock()
+		self.started = time.perf_counter()
+		self.events = []
+		self.thread_names = {}
+		self.profiles = []
+		self.active_profiles = set()
+		self.profiler_busy_logged = False
+
+	def profile_call(self, func, *args, **kwargs):
+		"""Run func under its own cProfile, which only sees the calling thread.
+
+		From Python 3.12 on only one cProfile can be active per process, and it
+		sees all threads. A thread started while another one is profiled then
+		runs without one and only records its spans.
+		"""
+		profile = cProfile.Profile()
+		try:
+			profile.enable()
+		except ValueError as e:
+			if not self.profiler_busy_logged:
+				self.profiler_busy_logged = True
+				xbmc.log("Profiling other threads by spans only: {}".format(str(e)), xbmc.LOGDEBUG)
+			return func(*args, **kwargs)
+		with self.lock:
+			self.profiles.append(profile)
+			self.active_profiles.add(profile)
+		try:
+			return func(*args, **kwargs)
+		finally:
+			profile.disable()
+			with self.lock:
+				self.active_profiles.discard(profile)
+
+	def add_span(self, name, start, end, args=None):
+		thread = threading.current_thread()
+		event = {
+			"name": name,
+			"ph": "X",
+			"ts": round((start - self.started) * 1e6),
+			"dur": round((end - start) * 1e6),
+			"pid": os.getpid(),
+			"tid": thread.ident
+		}
+		if args:
+			event["args"] = args
+		with self.lock:
+			self.events.append(event)
+			self.thread_names[thread.ident] = thread.name
+
+	def save(self):
+		with self.lock:
+			# Threads still running at exit cannot be merged
+			profiles = [profile for profile in self.profiles if profile not in self.active_profiles]
+			events = list(self.events)
+			thread_names = dict(self.thread_names)
+
+		try:
+			os.makedirs(self.output_dir, exist_ok=True)
+			if profiles:
+				stats = pstats.Stats(profiles[0])
+				for profile in profiles[1:]:
+					stats.add(profile)
+				stats.dump_stats(os.path.join(self.output_dir, PSTATS_FILE_NAME))
+
+			metadata = [
+				{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+				for tid, name in thread_names.items()
+			]
+			with open(os.path.join(self.output_dir, TRACE_FILE_NAME), "w", encoding="utf-8") as f:
+				json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+			xbmc.log("Profile written to {}".format(self.output_dir), xbmc.LOGINFO)
+		except OSError as e:
+			xbmc.log("Failed to write profile: {}".format(str(e)), xbmc.LOGERROR)
+
+
+def enable(output_dir):
+	global _profiler
+	_profiler = Profiler(output_dir)
+
+
+def is_enabled():
+	return _profiler is not None
+
+
+def save():
+	if _profiler is not None:
+		_profiler.save()
+
+
+@contextmanager
+def span(name, **args):
+	"""Record the enclosed block as a span of the trace"""
+	profiler = _profiler
+	if profiler is None:
+		yield
+		return
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		profiler.add_span(name, start, time.perf_counter(), args)
+
+
+def traced(name=None):
+	"""Decorator recording every call as a span, costing a single check while profiling is off"""
+	def decorator(func):
+		label = name or func.__qualname__
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if _profiler is None:
+				return func(*args, **kwargs)
+			with span(label):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorator
+
+
+def run(func, *args, **kwargs):
+	"""Call func, profiled as a whole while profiling is enabled"""
+	profiler = _profiler
+	if profiler is None:
+		return func(*args, **kwargs)
+	with span(getattr(func, "__qualname__", repr(func))):
+		return profiler.profile_call(func, *args, **kwargs)
+
+
+def wrap_thread_target(target):
+	"""Return a thread target that profiles the thread it runs on"""
+	if _profiler is None:
+		return target
+	return functools.partial(run, target)
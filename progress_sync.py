@@ -0,0 +1,225 @@
+import json
+import os
+import threading
+import time
+import xbmc
+from file_utils import atomic_write_json
+
+JOURNAL_FILE_NAME = "progress_journal.json"
+INITIAL_BACKOFF = 1.0  # seconds
+MAX_BACKOFF = 60.0
+# Bookkeeping fields of a queued update that are not part of a progress record
+SESSION_KEYS = ("sessionId", "timeListened", "closeSession")
+# Answers to a session update meaning the server does not know the session (any more), retrying will not help
+SESSION_GONE_STATUS = (403, 404, 410)
+
+
+class ProgressSyncWriter:
+	"""Background writer for media progress.
+
+	Updates are coalesced per item so only the latest position is sent. Updates
+	that cannot be sent are retried with exponential backoff and kept in a
+	journal in the profile directory, which is sent in bulk on the next launch
+	or as soon as the server is reachable again.
+
+	Updates made during a server playback session are sent through the
+	session sync endpoint instead, with their listening time summed up. They
+	are queued per session, so the close of a session is still sent when the
+	next session of the same item starts before it went out.
+	"""
+	_instance = None
+
+	def __new__(cls, *args, **kwargs):
+		if not cls._instance:
+			cls._instance = super(ProgressSyncWriter, cls).__new__(cls)
+		return cls._instance
+
+	def __init__(self, library_service=None, journal_dir=None):
+		if not hasattr(self, 'initialized'):
+			self.library_service = library_service
+			self.journal_path = os.path.join(journal_dir, JOURNAL_FILE_NAME)
+			self.condition = threading.Condition()
+			self.pending = {}
+			self.backoff = 0.0
+			self.retry_at = 0.0
+			self.stopping = False
+			self.thread = None
+			self.pending.update(self._load_journal())
+			self.initialized = True
+
+	def start(self):
+		with self.condition:
+			if self.thread and self.thread.is_alive():
+				return
+			self.stopping = False
+			self.thread = threading.Thread(target=self._run)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def submit(self, library_item_id, data, episode_id=None, session_id=None, time_listened=0.0, close_session=False):
+		"""Queue a progress update without waiting for the network"""
+		entry = dict(data)
+		entry["libraryItemId"] = library_item_id
+		if episode_id:
+			entry["episodeId"] = episode_id
+		if session_id:
+			entry["sessionId"] = session_id
+			entry["timeListened"] = time_listened
+			entry["closeSession"] = close_session
+		with self.condition:
+			key = (library_item_id, episode_id or None, session_id or None)
+			if session_id:
+				# The session update carries the position, so a plain update queued before it is superseded
+				self.pending.pop(key[:2] + (None,), None)
+			self.pending[key] = self._coalesce(self.pending.get(key), entry)
+			self.condition.notify()
+
+	def _coalesce(self, older, newer):
+		"""Merge two updates of one item and session, keeping the newer position and the summed listening time"""
+		if older and newer.get("sessionId") and older.get("sessionId") == newer["sessionId"]:
+			newer["timeListened"] += older["timeListened"]
+			newer["closeSession"] = newer["closeSession"] or older["closeSession"]
+		return newer
+
+	def _requeue(self, failed):
+		"""Put failed updates back, ahead of the updates submitted while they were being sent"""
+		pending = {}
+		for key, entry in failed.items():
+			newer = self.pending.pop(key, None)
+			pending[key] = self._coalesce(entry, newer) if newer else entry
+		pending.update(self.pending)
+		self.pending = pending
+
+	def retry_now(self):
+		"""Send pending updates right away, e.g. once the server is reachable again"""
+		with self.condition:
+			self.backoff = 0.0
+			self.retry_at = 0.0
+			self.condition.notify()
+
+	def get_pending(self, library_item_id, episode_id=None):
+		"""Return the latest unsent update for an item, if any"""
+		item_key = (library_item_id, episode_id or None)
+		with self.condition:
+			# Updates are queued oldest first
+			for key in reversed(self.pending):
+				if key[:2] == item_key:
+					return self.pending[key]
+		return None
+
+	def stop(self, timeout=5):
+		"""Stop the writer, try to send what is left and journal the rest"""
+		with self.condition:
+			self.stopping = True
+			self.condition.notify()
+		if self.thread:
+			self.thread.join(timeout=timeout)
+
+		with self.condition:
+			batch = self.pending
+			self.pending = {}
+		failed = self._send(batch) if batch else {}
+		with self.condition:
+			self._requeue(failed)
+			self._write_journal()
+
+	def _run(self):
+		while True:
+			with self.condition:
+				while not self.stopping and (not self.pending or time.monotonic() < self.retry_at):
+					timeout = self.retry_at - time.monotonic() if self.pending else None
+					self.condition.wait(timeout)
+				if self.stopping:
+					return
+				batch = self.pending
+				self.pending = {}
+
+			failed = self._send(batch)
+
+			with self.condition:
+				self._requeue(failed)
+				if failed:
+					self.backoff = min(self.backoff * 2 or INITIAL_BACKOFF, MAX_BACKOFF)
+					self.retry_at = time.monotonic() + self.backoff
+					xbmc.log("Progress sync failed, retrying in {}s".format(self.backoff), xbmc.LOGWARNING)
+				else:
+					self.backoff = 0.0
+					self.retry_at = 0.0
+				self._write_journal()
+
+	def _send(self, batch):
+		"""Send a batch of updates and return the ones that could not be sent"""
+		failed = {}
+		progress_entries = {}
+		# The batch is ordered oldest first, the last update of an item carries its position
+		latest = {key[:2]: key for key in batch}
+		for key, entry in batch.items():
+			if not entry.get("sessionId"):
+				progress_entries[key] = entry
+				continue
+			try:
+				self._send_session_update(entry)
+			except Exception as e:
+				response = getattr(e, "response", None)
+				if response is not None and response.status_code in SESSION_GONE_STATUS:
+					# The session is gone (e.g. it expired), store the position as progress instead
+					xbmc.log("Session sync rejected, falling back to progress update: {}".format(str(e)), xbmc.LOGWARNING)
+					if latest[key[:2]] == key:
+						progress_entries[key[:2] + (None,)] = self._without_session(entry)
+				else:
+					xbmc.log("Failed to sync session: {}".format(str(e)), xbmc.LOGERROR)
+					failed[key] = entry
+
+		if progress_entries:
+			try:
+				if len(progress_entries) > 1:
+					self.library_service.batch_update_media_progress(list(progress_entries.values()))
+				else:
+					for (library_item_id, episode_id, _), entry in progress_entries.items():
+						data = {key: value for key, value in entry.items() if key not in ("libraryItemId", "episodeId")}
+						self.library_service.update_media_progress(library_item_id, data, episode_id)
+			except Exception as e:
+				xbmc.log("Failed to sync progress: {}".format(str(e)), xbmc.LOGERROR)
+				failed.update(progress_entries)
+
+		if len(failed) < len(batch):
+			xbmc.log("Synced progress of {} item(s)".format(len(batch) - len(failed)), xbmc.LOGDEBUG)
+		return failed
+
+	def _send_session_update(self, entry):
+		data = {
+			"currentTime": entry["currentTime"],
+			"timeListened": entry["timeListened"],
+			"duration": entry.get("duration")
+		}
+		if entry["closeSession"]:
+			self.library_service.close_session(entry["sessionId"], data)
+		else:
+			self.library_service.sync_session(entry["sessionId"], data)
+
+	def _without_session(self, entry):
+		return {key: value for key, value in entry.items() if key not in SESSION_KEYS}
+
+	def _load_journal(self):
+		try:
+			with open(self.journal_path, "r", encoding="utf-8") as f:
+				entries = json.load(f)
+		except FileNotFoundError:
+			return {}
+		except (OSError, ValueError) as e:
+			xbmc.log("Progress journal is corrupt, discarding it: {}".format(str(e)), xbmc.LOGWARNING)
+			return {}
+
+		xbmc.log("Loaded {} unsent progress update(s) from journal".format(len(entries)), xbmc.LOGINFO)
+		# Playback sessions do not outlive the add-on, so journaled updates are sent as plain progress
+		return {(entry["libraryItemId"], entry.get("episodeId") or None, None): self._without_session(entry) for entry in entries}
+
+	def _write_journal(self):
+		"""Persist the unsent updates, or remove the journal when everything was sent"""
+		try:
+			if self.pending:
+				atomic_write_json(self.journal_path, list(self.pending.values()))
+			elif os.path.exists(self.journal_path):
+				os.remove(self.journal_path)
+		except OSError as e:
+			xbmc.log("Failed to write progress journal: {}".format(str(e)), xbmc.LOGERROR)
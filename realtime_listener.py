@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+import requests
+import xbmc
+from http_session import create_session, CONNECT_TIMEOUT
+from media_item import Audiobook
+
+SOCKET_PATH = "/socket.io/"
+RECORD_SEPARATOR = "\x1e"  # Separates packets in an Engine.IO v4 polling payload
+# Engine.IO packet types
+OPEN, CLOSE, PING, PONG, MESSAGE, NOOP = "0", "1", "2", "3", "4", "6"
+# Socket.IO packet types, sent inside Engine.IO messages
+CONNECT, DISCONNECT, EVENT, CONNECT_ERROR = "0", "1", "2", "4"
+POOL_SIZE = 2  # The held poll and a packet sent meanwhile, e.g. when stopping
+INITIAL_BACKOFF = 1.0  # seconds
+MAX_BACKOFF = 60.0
+SAVE_DELAY = 5.0  # seconds, a burst of events is written to disk once
+# Media fields of a full item the grid does not need, dropped before it goes into the library cache
+HEAVY_MEDIA_KEYS = ("audioFiles", "chapters", "tracks", "episodes", "missingParts", "ebookFile")
+
+
+class SocketClosed(Exception):
+	"""Raised when the server ends the socket, the listener then connects again"""
+
+
+def minify_item(item):
+	"""Strip a full item pushed by the server down to what the library cache stores"""
+	item = dict(item)
+	item.pop("libraryFiles", None)
+	media = dict(item.get("media") or {})
+	if "episodes" in media:
+		media["numEpisodes"] = len(media["episodes"])
+	if "tracks" in media:
+		media["numTracks"] = len(media["tracks"])
+	if "chapters" in media:
+		media["numChapters"] = len(media["chapters"])
+	for key in HEAVY_MEDIA_KEYS:
+		media.pop(key, None)
+	item["media"] = media
+	return item
+
+
+class RealtimeListener:
+	"""Keeps the client-side caches current from the server's socket events.
+
+	Audiobookshelf pushes item and progress changes to its socket.io clients.
+	The listener speaks the Engine.IO long-polling transport, so no websocket
+	library is needed: every poll is held open by the server until an event
+	arrives. It uses a session of its own, so the held poll takes no
+	connection of the shared pool and its reconnects do not feed the circuit
+	breaker. Changed items are patched
+	into the library, item, episode and search caches, covers of changed
+	items are dropped, and progress saved on another device replaces the
+	cached progress, unless this device still has a newer update waiting to
+	be sent.
+	"""
+
+	def __init__(self, library_service, cover_cache=None, progress_writer=None, search_index=None, library_id=None):
+		self.library_service = library_service
+		self.cover_cache = cover_cache
+		self.progress_writer = progress_writer
+		# Items of library_id shown in the grid are kept current in search_index
+		self.search_index = search_index
+		self.library_id = library_id
+		self.session = create_session(POOL_SIZE, breaker=False)
+		self.stop_event = threading.Event()
+		self.wake_event = threading.Event()
+		self.connected = threading.Event()
+		self.sid = None
+		self.poll_timeout = None
+		# Caches changed in memory but not written yet, saving a large library takes a while
+		self.unsaved = set()
+		self.save_due = 0.0
+		self.save_lock = threading.Lock()
+		self.counts = {"events": 0, "items": 0, "progress": 0, "ignored": 0, "reconnects": 0}
+		self.handlers = {
+			"item_added": self._on_item_updated,
+			"item_updated": self._on_item_updated,
+			"items_added": self._on_items_updated,
+			"items_updated": self._on_items_updated,
+			"item_removed": self._on_item_removed,
+			"user_item_progress_updated": self._on_progress_updated
+		}
+		self.thread = None
+
+	def start(self):
+		self.thread = threading.Thread(target=self._run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def wake(self):
+		"""Connect again right away, e.g. once the server is reachable again"""
+		self.wake_event.set()
+
+	def stop(self):
+		self.stop_event.set()
+		self.wake_event.set()
+		sid = self.sid
+		if sid is not None:
+			try:
+				self._send(sid, [MESSAGE + DISCONNECT, CLOSE])
+			except requests.RequestException:
+				pass
+		self._save(force=True)
+		xbmc.log("Realtime: {} events, {} items and {} progress updates applied, {} ignored, {} reconnects".format(
+			self.counts["events"], self.counts["items"], self.counts["progress"], self.counts["ignored"], self.counts["reconnects"]), xbmc.LOGINFO)
+
+	def _url(self, sid=None):
+		url = "{}{}?EIO=4&transport=polling&t={}".format(self.library_service.base_url, SOCKET_PATH, int(time.time() * 1000))
+		if sid is not None:
+			url += "&sid={}".format(sid)
+		return url
+
+	def _run(self):
+		backoff = INITIAL_BACKOFF
+		while not self.stop_event.is_set():
+			try:
+				self._connect()
+				backoff = INITIAL_BACKOFF
+				self._poll()
+			except (requests.RequestException, SocketClosed, ValueError) as e:
+				xbmc.log("Realtime connection lost: {}".format(str(e)), xbmc.LOGDEBUG)
+			self.connected.clear()
+			self.sid = None
+			self._save(force=True)
+			self.wake_event.wait(backoff)
+			self.wake_event.clear()
+			if self.stop_event.is_set():
+				return
+			backoff = min(backoff * 2, MAX_BACKOFF)
+			self.counts["reconnects"] += 1
+
+	def _connect(self):
+		response = self.session.get(self._url())
+		response.raise_for_status()
+		packets = self._decode(response.text)
+		if not packets or packets[0][:1] != OPEN:
+			raise SocketClosed("Unexpected handshake: {}".format(response.text[:100]))
+		handshake = json.loads(packets[0][1:])
+		# The server answers a poll after pingInterval at the latest and waits pingTimeout for the pong
+		self.poll_timeout = (CONNECT_TIMEOUT, (handshake["pingInterval"] + handshake["pingTimeout"]) / 1000.0)
+		self.sid = handshake["sid"]
+		self._send(self.sid, [MESSAGE + CONNECT])
+
+	def _poll(self):
+		while not self.stop_event.is_set():
+			response = self.session.get(self._url(self.sid), timeout=self.poll_timeout)
+			response.raise_for_status()
+			for packet in self._decode(response.text):
+				self._handle_packet(packet)
+			self._save()
+
+	def _handle_packet(self, packet):
+		kind, payload = packet[:1], packet[1:]
+		if kind == PING:
+			self._send(self.sid, [PONG])
+		elif kind == CLOSE:
+			raise SocketClosed("Closed by the server")
+		elif kind == MESSAGE:
+			self._handle_message(payload)
+
+	def _handle_message(self, message):
+		kind, payload = message[:1], message[1:]
+		if kind == CONNECT:
+			# The namespace is connected, the server expects the token as first event
+			self._send(self.sid, [MESSAGE + EVENT + json.dumps(["auth", self.library_service.token])])
+		elif kind == EVENT:
+			name, *args = json.loads(payload[payload.index("["):])
+			self._dispatch(name, args[0] if args else None)
+		elif kind in (DISCONNECT, CONNECT_ERROR):
+			raise SocketClosed("Namespace closed: {}".format(payload[:100]))
+
+	def _dispatch(self, name, data):
+		if name == "init":
+			self.connected.set()
+			xbmc.log("Realtime updates connected", xbmc.LOGINFO)
+			return
+		if name in ("auth_failed", "invalid_token"):
+			raise SocketClosed("Authentication failed")
+		handler = self.handlers.get(name)
+		if handler is None:
+			return
+		self.counts["events"] += 1
+		try:
+			handler(data)
+		except (KeyError, TypeError, AttributeError) as e:
+			xbmc.log("Ignoring malformed {} event: {}".format(name, str(e)), xbmc.LOGWARNING)
+
+	def _send(self, sid, packets):
+		response = self.session.post(self._url(sid), data=RECORD_SEPARATOR.join(packets).encode("utf-8"),
+			headers={"Content-Type": "text/plain;charset=UTF-8"})
+		response.raise_for_status()
+
+	def _mark_unsaved(self, cache):
+		with self.save_lock:
+			if not self.unsaved:
+				self.save_due = time.monotonic() + SAVE_DELAY
+			self.unsaved.add(cache)
+
+	def _save(self, force=False):
+		# Held while writing, so stop() returns only once a save of the poll thread is done
+		with self.save_lock:
+			if not self.unsaved or (not force and time.monotonic() < self.save_due):
+				return
+			caches, self.unsaved = self.unsaved, set()
+			for cache in caches:
+				cache.save()
+
+	@staticmethod
+	def _decode(payload):
+		# Binary packets ("b" followed by base64) carry nothing the add-on uses
+		return [packet for packet in payload.split(RECORD_SEPARATOR) if packet and packet[0] != "b"]
+
+	def _on_item_updated(self, item):
+		self._on_items_updated([item])
+
+	def _on_items_updated(self, items):
+		library_service = self.library_service
+		library_cache = library_service.library_cache
+		episode_index = library_service.episode_index
+		for item in items:
+			library_id = item["libraryId"]
+			item_id = item["id"]
+			patched = False
+			minified = minify_item(item)
+			if library_cache is not None and library_cache.patch(library_id, minified):
+				self._mark_unsaved(library_cache)
+				patched = True
+			if self.search_index is not None and library_id == self.library_id:
+				self.search_index.update(Audiobook.from_dict(minified, library_service.progress_cache.get((item_id, None))))
+				patched = True
+			# The pushed item is the full one, so details already cached are replaced rather than refetched
+			if item_id in library_service.item_cache:
+				library_service.item_cache.put(item_id, item)
+				patched = True
+			episodes = (item.get("media") or {}).get("episodes")
+			if episodes is not None and episode_index.has_show(library_id, item_id):
+				episode_index.replace_show(library_id, item_id, episodes)
+				self._mark_unsaved(episode_index)
+				patched = True
+			if self.cover_cache is not None and self.cover_cache.invalidate(item_id, item.get("updatedAt")):
+				patched = True
+			self.counts["items" if patched else "ignored"] += 1
+			xbmc.log("Realtime update of {}: {}".format(item_id, "applied" if patched else "not cached"), xbmc.LOGDEBUG)
+
+	def _on_item_removed(self, item):
+		library_service = self.library_service
+		item_id = item["id"]
+		library_cache = library_service.library_cache
+		if library_cache is not None and library_cache.remove(item["libraryId"], item_id):
+			self._mark_unsaved(library_cache)
+		library_service.item_cache.invalidate(item_id)
+		if self.search_index is not None:
+			self.search_index.remove(item_id)
+		if self.cover_cache is not None:
+			self.cover_cache.invalidate(item_id)
+		self.counts["items"] += 1
+		xbmc.log("Realtime removal of {}".format(item_id), xbmc.LOGDEBUG)
+
+	def _on_progress_updated(self, event):
+		progress = event["data"]
+		item_id = progress["libraryItemId"]
+		episode_id = progress.get("episodeId") or None
+		progress_cache = self.library_service.progress_cache
+		cached = progress_cache.get((item_id, episode_id)) or {}
+		pending = self.progress_writer.get_pending(item_id, episode_id) if self.progress_writer else None
+		# Progress of this device that is not sent yet is newer than anything the server knows
+		if pending is not None or (cached.get("lastUpdate") or 0) > (progress.get("lastUpdate") or 0):
+			self.counts["ignored"] += 1
+			return
+		progress_cache.put((item_id, episode_id), progress)
+		self.counts["progress"] += 1
+		xbmc.log("Realtime progress of {} {}: {:.0f}s".format(item_id, episode_id or "", progress.get("currentTime") or 0), xbmc.LOGDEBUG)
@@ -0,0 +1,120 @@
+import os
+import re
+import threading
+import xbmc
+from file_utils import atomic_write_json
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+STATS_FILE_NAME = "request_stats.json"
+
+ID_SEGMENT = re.compile(
+	r"^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"  # uuid ids of current servers
+	r"|[a-z]{2,5}_[A-Za-z0-9]+"  # li_..., lib_..., play_... ids of older servers
+	r"|\d+)$"  # inodes and episode numbers
+)
+
+
+def endpoint_template(method, url):
+	"""Return the endpoint of a request with ids replaced, e.g. GET /api/me/progress/{id}"""
+	path = url.split("://", 1)[-1]
+	path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+	path = path.split("?", 1)[0]
+	segments = ["{id}" if ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+	return "{} {}".format(method.upper(), "/".join(segments))
+
+
+class EndpointStats:
+	__slots__ = ('count', 'errors', 'statuses', 'bytes', 'total_ms', 'max_ms', 'histogram')
+
+	def __init__(self):
+		self.count = 0
+		self.errors = 0
+		self.statuses = {}
+		self.bytes = 0
+		self.total_ms = 0.0
+		self.max_ms = 0.0
+		self.histogram = [0] * len(LATENCY_BUCKETS)
+
+	def percentile(self, fraction):
+		"""Upper bound of the bucket containing the given fraction of the requests"""
+		threshold = fraction * self.count
+		seen = 0
+		for bound, count in zip(LATENCY_BUCKETS, self.histogram):
+			seen += count
+			if seen >= threshold and count:
+				return bound if bound != float("inf") else self.max_ms
+		return 0.0
+
+	def to_dict(self):
+		return {
+			"count": self.count,
+			"errors": self.errors,
+			"statuses": self.statuses,
+			"bytes": self.bytes,
+			"total_ms": round(self.total_ms, 1),
+			"mean_ms": round(self.total_ms / self.count, 1) if self.count else 0.0,
+			"p50_ms": self.percentile(0.5),
+			"p95_ms": self.percentile(0.95),
+			"max_ms": round(self.max_ms, 1),
+			"histogram": {"<={}".format(bound): count for bound, count in zip(LATENCY_BUCKETS, self.histogram)}
+		}
+
+
+class RequestStats:
+	"""Latency histograms, status codes, sizes and counts of the requests per endpoint.
+
+	Only the shared session records into it, so the stats cover the requests
+	the user interface waits for. The realtime listener's held polls and the
+	download manager's range requests use sessions of their own and are left
+	out: they last as long as the server holds them or the transfer takes and
+	would drown the latencies of interactive requests.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.endpoints = {}
+
+	def record(self, method, url, milliseconds, status=None, size=0):
+		"""Record a request; a status of None means it failed without a response"""
+		key = endpoint_template(method, url)
+		with self.lock:
+			stats = self.endpoints.get(key)
+			if stats is None:
+				stats = self.endpoints[key] = EndpointStats()
+			stats.count += 1
+			stats.total_ms += milliseconds
+			stats.max_ms = max(stats.max_ms, milliseconds)
+			for index, bound in enumerate(LATENCY_BUCKETS):
+				if milliseconds <= bound:
+					stats.histogram[index] += 1
+					break
+			if status is None:
+				stats.errors += 1
+			else:
+				stats.statuses[str(status)] = stats.statuses.get(str(status), 0) + 1
+				stats.bytes += size or 0
+
+	def snapshot(self):
+		with self.lock:
+			return {key: stats.to_dict() for key, stats in self.endpoints.items()}
+
+	def log_summary(self):
+		snapshot = self.snapshot()
+		if not snapshot:
+			return
+		# Endpoints that cost the most time first
+		lines = [
+			"{:>5} x {:>8.1f} ms total {:>7.1f} ms mean {:>7} ms p95 {:>10} bytes {} {}".format(
+				stats["count"], stats["total_ms"], stats["mean_ms"], stats["p95_ms"], stats["bytes"], key,
+				stats["statuses"] if not stats["errors"] else dict(stats["statuses"], failed=stats["errors"]))
+			for key, stats in sorted(snapshot.items(), key=lambda entry: entry[1]["total_ms"], reverse=True)
+		]
+		xbmc.log("Request statistics:\n{}".format("\n".join(lines)), xbmc.LOGINFO)
+
+	def save(self, directory):
+		path = os.path.join(directory, STATS_FILE_NAME)
+		try:
+			atomic_write_json(path, {"buckets_ms": [str(bound) for bound in LATENCY_BUCKETS], "endpoints": self.snapshot()}, indent=1)
+		except OSError as e:
+			xbmc.log("Failed to write request statistics: {}".format(str(e)), xbmc.LOGERROR)
@@ -0,0 +1,116 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text):
+	"""Lower-case text and strip accents so that "Dürrenmatt" matches "durrenmatt" """
+	decomposed = unicodedata.normalize("NFKD", text)
+	return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text):
+	return TOKEN_PATTERN.findall(normalize(text or ""))
+
+
+class SearchIndex:
+	"""Inverted index over title, subtitle, author, narrator and series of audiobooks.
+
+	Audiobooks are added as library pages load and updated or removed as the
+	server reports changes. Every query term is matched as a prefix, so
+	partial input already narrows the results.
+	"""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.postings = {}  # Token -> positions of the audiobooks containing it
+		self.sorted_tokens = []
+		self.tokens_dirty = False
+		self.audiobooks = []  # None where an audiobook was removed
+		self.positions = {}  # Audiobook id -> position
+
+	def __len__(self):
+		return len(self.positions)
+
+	def __contains__(self, item_id):
+		return item_id in self.positions
+
+	@staticmethod
+	def _tokens(audiobook):
+		metadata = audiobook.media.metadata
+		fields = (metadata.title, metadata.subtitle, metadata.author_name, metadata.narrator_name, metadata.series_name)
+		return {token for field in fields for token in tokenize(field)}
+
+	def add(self, audiobook):
+		with self.lock:
+			if audiobook.id in self.positions:
+				return
+			position = self.positions[audiobook.id] = len(self.audiobooks)
+			self.audiobooks.append(audiobook)
+			self._index(position, audiobook)
+
+	def update(self, audiobook):
+		"""Re-index a changed audiobook in its place, or add it if it is not indexed yet"""
+		with self.lock:
+			position = self.positions.get(audiobook.id)
+			if position is None:
+				position = self.positions[audiobook.id] = len(self.audiobooks)
+				self.audiobooks.append(audiobook)
+			else:
+				self._unindex(position)
+				self.audiobooks[position] = audiobook
+			self._index(position, audiobook)
+
+	def remove(self, item_id):
+		with self.lock:
+			position = self.positions.pop(item_id, None)
+			if position is not None:
+				self._unindex(position)
+				self.audiobooks[position] = None
+
+	def _index(self, position, audiobook):
+		for token in self._tokens(audiobook):
+			positions = self.postings.get(token)
+			if positions is None:
+				positions = self.postings[token] = set()
+				self.tokens_dirty = True
+			positions.add(position)
+
+	def _unindex(self, position):
+		for token in self._tokens(self.audiobooks[position]):
+			positions = self.postings[token]
+			positions.discard(position)
+			if not positions:
+				del self.postings[token]
+				self.tokens_dirty = True
+
+	def search(self, query, limit=None):
+		"""Return the audiobooks matching all terms of the query, in the order they were added"""
+		terms = tokenize(query)
+		if not terms:
+			return []
+
+		with self.lock:
+			if self.tokens_dirty:
+				self.sorted_tokens = sorted(self.postings)
+				self.tokens_dirty = False
+
+			result = None
+			# Start with the longest term, it usually matches the fewest tokens
+			for term in sorted(terms, key=len, reverse=True):
+				matches = set()
+				index = bisect_left(self.sorted_tokens, term)
+				while index < len(self.sorted_tokens) and self.sorted_tokens[index].startswith(term):
+					matches.update(self.postings[self.sorted_tokens[index]])
+					index += 1
+				result = matches if result is None else result & matches
+				if not result:
+					return []
+
+			positions = sorted(result)
+			if limit is not None:
+				positions = positions[:limit]
+			return [self.audiobooks[position] for position in positions]
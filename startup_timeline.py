@@ -0,0 +1,21 @@
+import time
+import xbmc
+
+
+class StartupTimeline:
+	"""Records how long each startup step took, relative to the add-on launch"""
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.last = self.started
+		self.steps = []
+
+	def mark(self, step):
+		now = time.perf_counter()
+		self.steps.append((step, (now - self.last) * 1000, (now - self.started) * 1000))
+		self.last = now
+		xbmc.log("Startup: {} after {:.0f} ms".format(step, (now - self.started) * 1000), xbmc.LOGINFO)
+
+	def log_summary(self):
+		lines = ["{:>7.0f} ms {:>7.0f} ms  {}".format(total, duration, step) for step, duration, total in self.steps]
+		xbmc.log("Startup timeline (total, step):\n{}".format("\n".join(lines)), xbmc.LOGINFO)
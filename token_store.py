@@ -0,0 +1,47 @@
+import json
+import os
+import xbmc
+from file_utils import atomic_write_json
+
+TOKEN_FILE_NAME = "tokens.json"
+
+
+class TokenStore:
+	"""Keeps the access and refresh token of the last login in the add-on profile.
+
+	Tokens are bound to the server and user they were issued for, so changing
+	either in the settings falls back to a password login.
+	"""
+
+	def __init__(self, profile_dir):
+		self.path = os.path.join(profile_dir, TOKEN_FILE_NAME)
+
+	def load(self, server_url, username):
+		try:
+			with open(self.path, "r", encoding="utf-8") as f:
+				data = json.load(f)
+		except FileNotFoundError:
+			return None
+		except (OSError, ValueError) as e:
+			xbmc.log("Stored token is unreadable, logging in again: {}".format(str(e)), xbmc.LOGWARNING)
+			return None
+
+		if not isinstance(data, dict) or data.get("server") != server_url or data.get("username") != username or not data.get("token"):
+			return None
+		return data
+
+	def save(self, server_url, username, token, refresh_token=None):
+		data = {"server": server_url, "username": username, "token": token, "refresh_token": refresh_token}
+		try:
+			# The tokens grant access to the account, keep them private to the user
+			atomic_write_json(self.path, data, mode=0o600)
+		except OSError as e:
+			xbmc.log("Failed to store token: {}".format(str(e)), xbmc.LOGERROR)
+
+	def clear(self):
+		try:
+			os.remove(self.path)
+		except FileNotFoundError:
+			pass
+		except OSError as e:
+			xbmc.log("Failed to remove stored token: {}".format(str(e)), xbmc.LOGERROR)
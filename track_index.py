@@ -0,0 +1,37 @@
+from bisect import bisect_right
+
+
+class TrackIndex:
+	"""Maps global book time to (track position, offset) for books split over several audio files.
+
+	Tracks are the audioTracks of a playback session, each carrying the
+	startOffset of the file within the book and its duration.
+	"""
+
+	def __init__(self, tracks):
+		self.tracks = sorted(tracks or [], key=lambda track: track.get('startOffset') or 0.0)
+		self.offsets = [track.get('startOffset') or 0.0 for track in self.tracks]
+
+	def __len__(self):
+		return len(self.tracks)
+
+	def is_multi_track(self):
+		return len(self.tracks) > 1
+
+	def locate(self, book_time):
+		"""Return the playlist position of the track playing at book_time and the offset within it"""
+		if not self.tracks:
+			return 0, book_time
+		position = max(bisect_right(self.offsets, book_time) - 1, 0)
+		offset = book_time - self.offsets[position]
+		duration = self.tracks[position].get('duration')
+		if duration is not None:
+			offset = min(offset, duration)
+		return position, max(offset, 0.0)
+
+	def to_book_time(self, position, track_time):
+		"""Convert a time within the track at position to global book time"""
+		if not self.tracks:
+			return track_time
+		position = min(max(position, 0), len(self.tracks) - 1)
+		return self.offsets[position] + track_time